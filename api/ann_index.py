@@ -0,0 +1,441 @@
+"""
+ANN Index
+Inverted-file index (IVF-Flat) dalam numpy untuk gallery yang sangat besar.
+Query hanya di-score terhadap nprobe cluster terdekat, bukan seluruh gallery.
+"""
+import io
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from embedding_store import atomic_write_bytes
+from matching import MatchResult, build_result
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = "ann_index.npz"
+
+
+def spherical_kmeans(data: np.ndarray,
+                     nlist: int,
+                     n_iter: int = 10,
+                     seed: int = 0,
+                     chunk_size: int = 8192) -> np.ndarray:
+    """
+    K-means pada vector L2-normalized (similarity = dot product)
+
+    Args:
+        data: Matrix (N, D) normalized
+        nlist: Jumlah cluster
+        n_iter: Jumlah iterasi
+        seed: Random seed
+        chunk_size: Jumlah row per matrix product (batas memory)
+
+    Returns:
+        Centroids (nlist, D) normalized
+    """
+    rng = np.random.default_rng(seed)
+    n = data.shape[0]
+    centroids = data[rng.choice(n, size=nlist, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = assign_clusters(data, centroids, chunk_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(n, size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+    return centroids
+
+
+def assign_clusters(data: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192) -> np.ndarray:
+    """Index centroid terdekat untuk setiap row"""
+    assign = np.empty(data.shape[0], dtype=np.int64)
+    for start in range(0, data.shape[0], chunk_size):
+        assign[start:start + chunk_size] = np.argmax(data[start:start + chunk_size] @ centroids.T, axis=1)
+    return assign
+
+
+class IVFIndex:
+    """
+    IVF-Flat index dengan insert / remove incremental
+
+    Index menyimpan copy vector per inverted list supaya search hanya
+    menyentuh memory dari cluster yang di-probe. Di-attach ke
+    EmbeddingGallery sehingga setiap upsert / remove di gallery
+    (termasuk /api/face/register) langsung masuk ke index.
+
+    Centroids di-train ulang di background thread setelah index tumbuh dua
+    kali lipat sejak train terakhir; di bawah min_size index dilepas dan
+    matching kembali ke exact search.
+    """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 nlist: int = 0,
+                 nprobe: int = 8,
+                 min_size: int = 5000,
+                 persist_every: int = 1000):
+        """
+        Args:
+            path: File index (.npz), None = tidak dipersist
+            nlist: Jumlah cluster, 0 = otomatis (sqrt(N))
+            nprobe: Jumlah cluster yang di-score per query
+            min_size: Di bawah ukuran ini pakai exact search (index tidak di-train)
+            persist_every: Simpan index ke disk setiap N perubahan
+        """
+        self.path = Path(path) if path else None
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.persist_every = persist_every
+
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self._lock = threading.RLock()
+        self._vecs: List[np.ndarray] = []
+        self._list_ids: List[np.ndarray] = []
+        self._sizes: np.ndarray = np.zeros(0, dtype=np.int64)
+        self._where: Dict[str, Tuple[int, int]] = {}
+        self._dirty = 0
+        self._gallery = None
+        self._generation = 0  # Naik setiap reset gallery, retrain background yang ketinggalan dibuang
+        self._pending: Optional[Dict[str, Optional[np.ndarray]]] = None  # Perubahan selama retrain background
+
+    @property
+    def ready(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    # ============================
+    # Build
+    # ============================
+    def train(self, ids: np.ndarray, matrix: np.ndarray):
+        """
+        Train centroids (k-means) lalu masukkan semua vector
+
+        Args:
+            ids: Array employee_id (N,)
+            matrix: Embeddings normalized (N, D)
+        """
+        n = matrix.shape[0]
+        start = time.perf_counter()
+        centroids = self._kmeans(matrix)
+
+        with self._lock:
+            self.centroids = centroids
+            self.trained_size = n
+            self._fill(ids, matrix)
+            self._dirty = 0
+        logger.info(f"✓ IVF index trained: {n} vectors, nlist={centroids.shape[0]} "
+                    f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+        self.save()
+
+    def _kmeans(self, matrix: np.ndarray) -> np.ndarray:
+        """Centroids untuk matrix (N, D), nlist otomatis sqrt(N) jika tidak di-set"""
+        n = matrix.shape[0]
+        nlist = self.nlist or max(16, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        # Sample training seperti faiss: cukup puluhan point per cluster
+        rng = np.random.default_rng(0)
+        sample_size = min(n, nlist * 64)
+        sample = matrix[rng.choice(n, size=sample_size, replace=False)] if sample_size < n else matrix
+        return spherical_kmeans(np.ascontiguousarray(sample, dtype=np.float32), nlist)
+
+    def _retrain(self, generation: int):
+        """
+        Train ulang dari snapshot gallery di background thread (k-means di luar lock)
+
+        Perubahan gallery selama training dicatat di _pending oleh listener dan
+        diterapkan ulang setelah inverted lists diganti.
+        """
+        ids, matrix = self._gallery.snapshot()
+        try:
+            if len(ids) < self.min_size:
+                return
+            start = time.perf_counter()
+            centroids = self._kmeans(matrix)
+            with self._lock:
+                if generation != self._generation:
+                    return  # Gallery di-reload penuh selama training, sync_with sudah jalan
+                self.centroids = centroids
+                self.trained_size = len(ids)
+                self._fill(ids, matrix)
+                for employee_id, embedding in self._pending.items():
+                    if embedding is None:
+                        self.remove(employee_id, _count=False)
+                    else:
+                        self.add(employee_id, embedding)
+                self._dirty = 0
+            logger.info(f"✓ IVF index retrained in background: {len(self)} vectors, "
+                        f"nlist={centroids.shape[0]} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+            self.save()
+        except Exception as e:
+            logger.error(f"✗ IVF index retrain failed: {e}")
+        finally:
+            with self._lock:
+                if generation == self._generation:
+                    self._pending = None
+
+    def _schedule_retrain(self):
+        """Mulai retrain background (sekali jalan; dipanggil dengan _lock dipegang)"""
+        if self._pending is not None:
+            return
+        self._pending = {}
+        threading.Thread(target=self._retrain, args=(self._generation,),
+                         name="ivf-retrain", daemon=True).start()
+
+    def _drop(self):
+        """Lepas index (gallery di bawah min_size): matching kembali ke exact search"""
+        with self._lock:
+            self._generation += 1  # Retrain background yang sedang jalan dibuang
+            self._pending = None
+            self.centroids = None
+            self.trained_size = 0
+            self._vecs, self._list_ids, self._where = [], [], {}
+            self._sizes = np.zeros(0, dtype=np.int64)
+        logger.info(f"✓ IVF index dropped: gallery below {self.min_size}, using exact search")
+
+    def _fill(self, ids: np.ndarray, matrix: np.ndarray):
+        """Isi ulang semua inverted list dengan centroids yang sudah ada"""
+        nlist = self.centroids.shape[0]
+        assign = assign_clusters(matrix, self.centroids) if len(ids) else np.zeros(0, dtype=np.int64)
+        order = np.argsort(assign, kind="stable")
+        sizes = np.bincount(assign, minlength=nlist)
+        self._set_lists(sizes, matrix[order], np.asarray(ids, dtype=object)[order])
+
+    def _set_lists(self, sizes: np.ndarray, vectors: np.ndarray, ids: np.ndarray):
+        """Bangun inverted lists dari vectors / ids yang sudah urut per cluster"""
+        dim = self.centroids.shape[1]
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        self._vecs, self._list_ids, self._where = [], [], {}
+        for c in range(len(sizes)):
+            lo, hi = int(offsets[c]), int(offsets[c + 1])
+            capacity = max(8, (hi - lo) * 2)
+            vecs = np.zeros((capacity, dim), dtype=np.float32)
+            list_ids = np.empty(capacity, dtype=object)
+            vecs[:hi - lo] = vectors[lo:hi]
+            list_ids[:hi - lo] = ids[lo:hi]
+            self._vecs.append(vecs)
+            self._list_ids.append(list_ids)
+            for pos, employee_id in enumerate(ids[lo:hi]):
+                self._where[str(employee_id)] = (c, pos)
+        self._sizes = np.asarray(sizes, dtype=np.int64)
+
+    def sync_with(self, ids: np.ndarray, matrix: np.ndarray):
+        """
+        Samakan isi index dengan gallery (train jika perlu)
+
+        Dipakai saat startup (index dari disk bisa ketinggalan) dan saat gallery di-reload penuh.
+        """
+        n = len(ids)
+        if n < self.min_size:
+            with self._lock:
+                self.centroids = None
+                self._where = {}
+            return
+        if not self.ready or self.centroids.shape[1] != matrix.shape[1] or n > 2 * self.trained_size:
+            self.train(ids, matrix)
+            return
+
+        with self._lock:
+            self._fill(ids, matrix)
+            self._dirty += 1
+        logger.info(f"✓ IVF index synced with gallery: {n} vectors")
+        self.save()
+
+    # ============================
+    # Incremental update
+    # ============================
+    def add(self, employee_id: str, embedding: np.ndarray):
+        """Insert / replace satu vector normalized"""
+        with self._lock:
+            self.remove(employee_id, _count=False)
+            c = int(np.argmax(self.centroids @ embedding))
+            pos = int(self._sizes[c])
+            if pos == self._vecs[c].shape[0]:
+                self._vecs[c] = np.concatenate([self._vecs[c], np.zeros_like(self._vecs[c])])
+                self._list_ids[c] = np.concatenate([self._list_ids[c], np.empty_like(self._list_ids[c])])
+            self._vecs[c][pos] = embedding
+            self._list_ids[c][pos] = employee_id
+            self._sizes[c] += 1
+            self._where[employee_id] = (c, pos)
+            self._mark_dirty()
+
+    def remove(self, employee_id: str, _count: bool = True) -> bool:
+        """Hapus vector (swap dengan elemen terakhir di list)"""
+        with self._lock:
+            where = self._where.pop(employee_id, None)
+            if where is None:
+                return False
+            c, pos = where
+            last = int(self._sizes[c]) - 1
+            if pos != last:
+                self._vecs[c][pos] = self._vecs[c][last]
+                moved = self._list_ids[c][last]
+                self._list_ids[c][pos] = moved
+                self._where[moved] = (c, pos)
+            self._list_ids[c][last] = None
+            self._sizes[c] = last
+            if _count:
+                self._mark_dirty()
+            return True
+
+    def _mark_dirty(self):
+        self._dirty += 1
+        if self.persist_every and self._dirty >= self.persist_every:
+            self.save()
+
+    # ============================
+    # Search
+    # ============================
+    def search(self, query: np.ndarray, k: int = 5, nprobe: Optional[int] = None) -> MatchResult:
+        """
+        Top-k approximate search
+
+        Args:
+            query: Embedding normalized (D,)
+            k: Jumlah kandidat teratas
+            nprobe: Override jumlah cluster yang di-probe
+
+        Returns:
+            MatchResult, atau None jika index tidak aktif (pakai exact search)
+        """
+        nprobe = nprobe or self.nprobe
+        with self._lock:
+            if self.centroids is None:
+                return None  # Index dilepas di antara cek ready dan search
+            centroid_scores = self.centroids @ query
+            nprobe = min(nprobe, centroid_scores.shape[0])
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            score_parts, id_parts = [], []
+            for c in probe:
+                n = int(self._sizes[c])
+                if n:
+                    score_parts.append(self._vecs[c][:n] @ query)
+                    id_parts.append(self._list_ids[c][:n])
+        if not score_parts:
+            return MatchResult([], None)
+        return build_result(np.concatenate(id_parts), np.concatenate(score_parts), k)
+
+    # ============================
+    # Persistence
+    # ============================
+    def save(self):
+        """Simpan index ke disk (atomic)"""
+        if self.path is None or not self.ready:
+            return
+        with self._lock:
+            parts = [(self._vecs[c][:n], self._list_ids[c][:n]) for c, n in enumerate(self._sizes.tolist())]
+            buffer = io.BytesIO()
+            np.savez(
+                buffer,
+                centroids=self.centroids,
+                sizes=self._sizes,
+                vectors=np.concatenate([v for v, _ in parts]),
+                ids=np.array([str(i) for _, list_ids in parts for i in list_ids], dtype=str),
+                trained_size=np.int64(self.trained_size)
+            )
+            self._dirty = 0
+        atomic_write_bytes(self.path, buffer.getvalue())
+        logger.info(f"✓ IVF index saved: {self.path}")
+
+    def load(self) -> bool:
+        """
+        Load index dari disk
+
+        Returns:
+            True jika file index ada dan berhasil di-load
+        """
+        if self.path is None or not self.path.exists():
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                centroids = data["centroids"]
+                sizes = data["sizes"]
+                vectors = data["vectors"]
+                ids = data["ids"].astype(object)
+                trained_size = int(data["trained_size"])
+        except Exception as e:
+            logger.error(f"✗ Error loading IVF index {self.path}: {e}")
+            return False
+
+        with self._lock:
+            self.centroids = centroids.astype(np.float32)
+            self.trained_size = trained_size
+            self._set_lists(sizes, vectors, ids)
+        logger.info(f"✓ IVF index loaded: {len(self)} vectors, nlist={centroids.shape[0]}")
+        return True
+
+    def reconcile(self, ids: np.ndarray, matrix: np.ndarray):
+        """
+        Terapkan selisih antara index (dari disk) dan gallery tanpa re-train
+
+        Vector yang berubah (re-register) dideteksi dari dot product dengan copy di index.
+        """
+        with self._lock:
+            gallery_ids = set(str(i) for i in ids)
+            for employee_id in [i for i in self._where if i not in gallery_ids]:
+                self.remove(employee_id)
+            for row, employee_id in enumerate(ids):
+                where = self._where.get(employee_id)
+                if where is not None:
+                    c, pos = where
+                    if float(self._vecs[c][pos] @ matrix[row]) > 0.9999:
+                        continue
+                self.add(employee_id, matrix[row])
+
+    def attach(self, gallery):
+        """
+        Load / build index untuk gallery lalu daftar sebagai listener
+
+        Args:
+            gallery: EmbeddingGallery
+        """
+        ids, matrix = gallery.snapshot()
+        if len(ids) >= self.min_size and self.load() and len(ids) <= 2 * self.trained_size:
+            self.reconcile(ids, matrix)
+            if self._dirty:
+                self.save()
+        else:
+            self.sync_with(ids, matrix)
+        self._gallery = gallery
+        gallery.add_listener(self._on_gallery_event)
+
+    def _on_gallery_event(self, event: str, employee_id: Optional[str] = None,
+                          embedding: Optional[np.ndarray] = None):
+        """
+        Listener EmbeddingGallery: 'upsert', 'remove', atau 'reset'
+
+        Dipanggil dengan lock gallery dipegang: train (k-means) tidak dijalankan
+        di sini kecuali reset, hanya dijadwalkan ke background thread.
+        """
+        if event == "reset":
+            with self._lock:
+                self._generation += 1
+                self._pending = None
+            ids, matrix = self._gallery.snapshot()
+            self.sync_with(ids, matrix)
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending[employee_id] = embedding if event == "upsert" else None
+            if not self.ready:
+                if len(self._gallery) >= self.min_size:
+                    self._schedule_retrain()
+            elif event == "upsert":
+                self.add(employee_id, embedding)
+                if len(self) > 2 * self.trained_size:
+                    self._schedule_retrain()
+            elif event == "remove":
+                self.remove(employee_id)
+                if len(self) < self.min_size:
+                    self._drop()
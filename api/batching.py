@@ -0,0 +1,141 @@
+"""
+Micro-batching
+Kumpulkan item dari request yang jalan bersamaan (misal aligned face crop)
+selama beberapa milidetik atau sampai N item, jalankan satu batched call,
+lalu kirim hasilnya kembali ke masing-masing pemanggil.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Sequence
+import logging
+
+import numpy as np
+
+from metrics import BATCH_FILL, BATCH_QUEUE_DELAY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batcher berbasis thread
+
+    Pemanggil (thread executor) memanggil run(item) dan block sampai hasilnya
+    siap. Satu thread batching mengambil item dari antrian: batch ditutup saat
+    berisi max_batch_size item atau max_wait_ms sudah lewat sejak item pertama
+    masuk antrian, jadi delay tambahan per item maksimal max_wait_ms.
+    Fill setiap batch dan delay antrian setiap item di-observe ke histogram
+    /metrics (label batcher = name).
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[List], Sequence],
+                 max_batch_size: int = 8,
+                 max_wait_ms: float = 2.0,
+                 name: str = "batcher"):
+        """
+        Args:
+            batch_fn: Fungsi list item -> hasil per item (urutan sama)
+            max_batch_size: Maksimum item per batch
+            max_wait_ms: Maksimum waktu menunggu item lain sejak item pertama masuk
+            name: Nama thread (untuk log)
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._batch_size_counts = np.zeros(max_batch_size + 1, dtype=np.int64)
+        self._total_queue_delay = 0.0
+        self._max_queue_delay = 0.0
+
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        """Masukkan item ke antrian, hasil lewat Future"""
+        future: Future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def run(self, item):
+        """Submit satu item dan tunggu hasilnya"""
+        return self.submit(item).result()
+
+    def run_many(self, items: Sequence) -> List:
+        """Submit banyak item sekaligus (bisa masuk batch yang sama) dan tunggu semua hasil"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = first[2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    self._queue.put(_STOP)
+                    break
+                batch.append(entry)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List):
+        started = time.perf_counter()
+        delays = [started - enqueued for _, _, enqueued in batch]
+        BATCH_FILL.observe(len(batch) / self.max_batch_size, self.name)
+        for delay in delays:
+            BATCH_QUEUE_DELAY_SECONDS.observe(delay, self.name)
+        try:
+            results = self.batch_fn([item for item, _, _ in batch])
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            logger.error(f"✗ {self.name} batch of {len(batch)} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+
+        with self._lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._batch_size_counts[len(batch)] += 1
+            self._total_queue_delay += sum(delays)
+            self._max_queue_delay = max(self._max_queue_delay, max(delays))
+
+    def stats(self) -> Dict:
+        """Snapshot statistik: batch fill dan delay antrian tambahan"""
+        with self._lock:
+            batches = self._batches
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches": batches,
+                "items": self._items,
+                "queue_depth": self._queue.qsize(),
+                "avg_batch_size": self._items / batches if batches else 0.0,
+                "avg_batch_fill": self._items / (batches * self.max_batch_size) if batches else 0.0,
+                "batch_size_histogram": {
+                    str(size): int(count) for size, count in enumerate(self._batch_size_counts) if count
+                },
+                "avg_queue_delay_ms": self._total_queue_delay / self._items * 1000 if self._items else 0.0,
+                "max_queue_delay_ms": self._max_queue_delay * 1000,
+            }
+
+    def close(self):
+        """Hentikan thread batching setelah antrian habis diproses"""
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5)
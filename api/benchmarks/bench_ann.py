@@ -0,0 +1,97 @@
+"""
+Benchmark recall vs latency: IVF index vs exact search
+
+Usage (dari folder api/):
+    python benchmarks/bench_ann.py
+    python benchmarks/bench_ann.py --sizes 10000 100000 --nprobe 1 4 8 16 32
+
+Query = embedding salah satu identity + noise (mirip foto check-in vs foto registrasi).
+recall@1 = top-1 IVF sama dengan top-1 exact, recall@k = irisan top-k / k.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ann_index import IVFIndex  # noqa: E402
+from matching import search_matrix  # noqa: E402
+
+
+def make_gallery(n: int, dim: int, groups: int, spread: float, rng: np.random.Generator):
+    """
+    Gallery sintetis. groups > 0 memberi struktur cluster seperti embedding wajah asli
+    (identity mirip mengumpul); groups = 0 -> isotropic (kasus terburuk untuk IVF).
+    """
+    matrix = rng.standard_normal((n, dim)).astype(np.float32)
+    if groups > 0:
+        centers = rng.standard_normal((groups, dim)).astype(np.float32)
+        matrix = centers[rng.integers(0, groups, size=n)] + spread * matrix
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    ids = np.array([f"emp{i:07d}" for i in range(n)], dtype=object)
+    return ids, matrix
+
+
+def make_queries(matrix: np.ndarray, count: int, noise: float, rng: np.random.Generator):
+    rows = rng.choice(matrix.shape[0], size=count, replace=False)
+    queries = matrix[rows] + noise * rng.standard_normal((count, matrix.shape[1])).astype(np.float32) / np.sqrt(matrix.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=1.0, help="Noise query relatif terhadap norm embedding")
+    parser.add_argument("--groups", type=int, default=256, help="Jumlah cluster laten di gallery (0 = isotropic)")
+    parser.add_argument("--spread", type=float, default=1.0, help="Sebaran identity di sekitar pusat cluster")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n in args.sizes:
+        ids, matrix = make_gallery(n, args.dim, args.groups, args.spread, rng)
+        queries = make_queries(matrix, args.queries, args.noise, rng)
+
+        start = time.perf_counter()
+        index = IVFIndex(nlist=args.nlist, min_size=0, persist_every=0)
+        index.train(ids, matrix)
+        build_s = time.perf_counter() - start
+
+        exact, exact_times = [], []
+        for q in queries:
+            t = time.perf_counter()
+            exact.append(search_matrix(q, ids, matrix, args.k))
+            exact_times.append(time.perf_counter() - t)
+
+        print(f"\nN={n}  nlist={index.centroids.shape[0]}  build={build_s:.2f}s  "
+              f"mean top-1 similarity={np.mean([r.best[1] for r in exact]):.3f}")
+        print(f"{'mode':>10} {'recall@1':>9} {f'recall@{args.k}':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        print(f"{'exact':>10} {1.0:>9.3f} {1.0:>9.3f} {percentile_ms(exact_times, 50):>8.3f} "
+              f"{percentile_ms(exact_times, 95):>8.3f}")
+
+        for nprobe in args.nprobe:
+            hits1, hitsk, times = 0, 0.0, []
+            for q, ref in zip(queries, exact):
+                t = time.perf_counter()
+                result = index.search(q, args.k, nprobe=nprobe)
+                times.append(time.perf_counter() - t)
+                hits1 += result.best is not None and result.best[0] == ref.best[0]
+                ref_ids = {i for i, _ in ref.candidates}
+                hitsk += len(ref_ids & {i for i, _ in result.candidates}) / len(ref_ids)
+            print(f"{f'ivf/{nprobe}':>10} {hits1 / len(queries):>9.3f} {hitsk / len(queries):>9.3f} "
+                  f"{percentile_ms(times, 50):>8.3f} {percentile_ms(times, 95):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark adaptive detection (fast pass resolusi kecil + fallback) vs fixed DETECTION_SIZE
+
+Usage (dari folder api/, butuh model InsightFace):
+    python benchmarks/bench_detection.py --images ../data/faces
+    python benchmarks/bench_detection.py --images frames/ --fast-sizes 256 320 --min-score 0.7
+
+Foto registrasi / frame kiosk (satu wajah dekat kamera) adalah kasus yang
+dioptimasi; foto grup atau wajah kecil akan lebih sering fallback. Yang
+dilaporkan per konfigurasi: distribusi latency detection, fallback rate
+(fast pass tidak menemukan wajah / score rendah) dan agreement wajah target
+dengan detection fixed (IoU bbox >= 0.5, bbox dalam koordinat image).
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import config  # noqa: E402
+from metrics import DETECTION_PATHS  # noqa: E402
+from quantize_models import list_images  # noqa: E402
+from utils import FaceRecognitionSystem, bbox_iou  # noqa: E402
+
+FALLBACK_PATHS = ("fallback_no_face", "fallback_low_score")
+
+
+def target_bbox(face_system: FaceRecognitionSystem, img: np.ndarray, bboxes: np.ndarray) -> Optional[List[float]]:
+    if bboxes.shape[0] == 0:
+        return None
+    return bboxes[face_system.select_face(bboxes, img.shape), :4].tolist()
+
+
+def run(face_system: FaceRecognitionSystem, images: List[np.ndarray], mode: str, repeats: int):
+    """Latency (ms) per panggilan dan bbox target per image"""
+    latencies, targets = [], []
+    for img in images:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            bboxes, _ = face_system.detect_adaptive(img, mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+        targets.append(target_bbox(face_system, img, bboxes))
+    return np.array(latencies), targets
+
+
+def agreement(base: List, other: List) -> float:
+    same = [(b is None and o is None) or (b is not None and o is not None and bbox_iou(b, o) >= 0.5)
+            for b, o in zip(base, other)]
+    return float(np.mean(same))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=config.FACES_DIR)
+    parser.add_argument("--max-images", type=int, default=200)
+    parser.add_argument("--det-size", type=int, default=config.DETECTION_SIZE[0])
+    parser.add_argument("--fast-sizes", type=int, nargs="+", default=[256, 320])
+    parser.add_argument("--min-score", type=float, default=config.FAST_DETECTION_MIN_SCORE)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    images = [img for img in (cv2.imread(str(p)) for p in list_images(args.images, args.max_images)) if img is not None]
+    face_system = FaceRecognitionSystem(
+        det_size=(args.det_size, args.det_size),
+        fast_det_size=max(args.fast_sizes),
+        fast_det_min_score=args.min_score,
+        warmup_iterations=2
+    )
+    face_system.warmup()
+    for size in args.fast_sizes:  # Anchor cache / alokasi ORT untuk setiap resolusi
+        face_system.detect_faces(images[0], (size, size))
+
+    base_latency, base_targets = run(face_system, images, "full", args.repeats)
+    print(f"images: {len(images)}, repeats: {args.repeats}, min score: {args.min_score}")
+    print(f"{'config':>16} {'mean':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'speedup':>8} {'fallback':>9} {'agree':>7}")
+
+    def report(name: str, latency: np.ndarray, fallback: float, agree: float):
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        print(f"{name:>16} {latency.mean():>7.1f} {p50:>7.1f} {p95:>7.1f} {p99:>7.1f} "
+              f"{np.median(base_latency) / p50:>8.2f} {fallback:>9.1%} {agree:>7.1%}")
+
+    report(f"fixed {args.det_size}", base_latency, 0.0, 1.0)
+    for size in args.fast_sizes:
+        face_system.fast_det_size = size
+        before = {path: DETECTION_PATHS.get(path) for path in FALLBACK_PATHS + ("fast",)}
+        latency, targets = run(face_system, images, "adaptive", args.repeats)
+        counts = {path: DETECTION_PATHS.get(path) - count for path, count in before.items()}
+        fallback = sum(counts[p] for p in FALLBACK_PATHS) / max(sum(counts.values()), 1)
+        report(f"adaptive {size}", latency, fallback, agreement(base_targets, targets))
+
+
+if __name__ == "__main__":
+    main()
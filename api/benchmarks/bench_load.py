@@ -0,0 +1,379 @@
+"""
+Load & latency benchmark untuk API (/recognize, /api/attendance/checkin, /api/face/register)
+
+Usage (dari folder api/, CPU, offline - model InsightFace harus sudah ada di MODEL_ROOT):
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --gallery-size 10000 --concurrency 1 4 8 --requests 200
+    python benchmarks/bench_load.py --images path/ke/corpus --output hasil.json --compare baseline.json
+    python benchmarks/bench_load.py --url http://127.0.0.1:8001 --endpoints recognize
+
+Mode default in-process: app FastAPI dijalankan lewat httpx.ASGITransport dengan
+data directory sementara (data/ asli tidak disentuh) berisi gallery sintetis
+sebanyak --gallery-size embeddings di embedding store. Dengan --url, request
+dikirim ke server lokal yang sudah jalan (gallery milik server; --seed-dir untuk
+mengisi embedding store yang dipakai server tersebut).
+
+Corpus default: gambar contoh bawaan package insightface (tanpa download).
+Corpus di-register dulu (id corpus-<i>) supaya /recognize & checkin menghasilkan match.
+
+Corpus dikirim berulang, jadi result cache (RESULT_CACHE_SIZE) dimatikan di mode
+in-process supaya yang diukur adalah inference, bukan cache hit; --result-cache
+memakai setting dari env / .env. Di mode --url cache milik server: jalankan
+server dengan RESULT_CACHE_SIZE=0. Hit cache per run dicatat di hasil
+(result_cache_hits, dari /metrics) dan setting cache di meta.
+
+Latency per endpoint diukur di client (exact). Latency per stage dihitung dari
+selisih histogram /metrics sebelum dan sesudah tiap run (estimasi p50/p95/p99
+per bucket, seperti histogram_quantile Prometheus). Hasil ditulis ke JSON
+(default benchmarks/results/) untuk dibandingkan antar commit dengan --compare.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+import httpx  # noqa: E402
+
+ENDPOINTS = {
+    "recognize": "/recognize",
+    "checkin": "/api/attendance/checkin",
+    "register": "/api/face/register",
+}
+
+_BUCKET_RE = re.compile(r'^face_api_stage_seconds_bucket\{stage="([^"]+)",le="([^"]+)"\} (\S+)$')
+_SUM_RE = re.compile(r'^face_api_stage_seconds_sum\{stage="([^"]+)"\} (\S+)$')
+_CACHE_HIT_RE = re.compile(r'^face_api_result_cache_total\{kind="extract",result="hit"\} (\S+)$')
+
+
+# ============================
+# Corpus & gallery
+# ============================
+def load_corpus(images_dir: Optional[str]) -> List[bytes]:
+    """Isi file gambar corpus (default: contoh bawaan insightface)"""
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    else:
+        import insightface
+        sample_dir = Path(insightface.__file__).parent / "data" / "images"
+        paths = [sample_dir / "Tom_Hanks_54745.png", sample_dir / "t1.jpg"]
+    if not paths:
+        sys.exit(f"No images found in {images_dir}")
+    return [p.read_bytes() for p in paths]
+
+
+def seed_gallery(embeddings_dir: Path, size: int, dim: int = 512, chunk: int = 50000):
+    """Tulis embeddings random (normalized) ke embedding store"""
+    from embedding_store import EmbeddingStore
+
+    store = EmbeddingStore(str(embeddings_dir))
+    rng = np.random.default_rng(0)
+    for start in range(0, size, chunk):
+        n = min(chunk, size - start)
+        matrix = rng.standard_normal((n, dim)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        store.put_many((f"synthetic{start + i:07d}", matrix[i]) for i in range(n))
+
+
+# ============================
+# Stage metrics (/metrics)
+# ============================
+def parse_stage_histograms(text: str) -> Dict[str, Dict]:
+    """Parse face_api_stage_seconds dari Prometheus text -> {stage: {buckets: [(le, count)], sum}}"""
+    stages: Dict[str, Dict] = defaultdict(lambda: {"buckets": [], "sum": 0.0})
+    for line in text.splitlines():
+        m = _BUCKET_RE.match(line)
+        if m:
+            stages[m.group(1)]["buckets"].append((float(m.group(2)), float(m.group(3))))
+            continue
+        m = _SUM_RE.match(line)
+        if m:
+            stages[m.group(1)]["sum"] = float(m.group(2))
+    return dict(stages)
+
+
+def parse_result_cache_hits(text: str) -> float:
+    """Counter hit result cache (extract) dari Prometheus text"""
+    for line in text.splitlines():
+        m = _CACHE_HIT_RE.match(line)
+        if m:
+            return float(m.group(1))
+    return 0.0
+
+
+def histogram_quantile(q: float, buckets: List) -> float:
+    """Estimasi quantile dari bucket kumulatif (interpolasi linear dalam bucket)"""
+    total = buckets[-1][1]
+    if total <= 0:
+        return 0.0
+    rank = q * total
+    prev_le, prev_count = 0.0, 0.0
+    for le, count in buckets:
+        if count >= rank:
+            if le == float("inf"):
+                return prev_le
+            if count == prev_count:
+                return le
+            return prev_le + (le - prev_le) * (rank - prev_count) / (count - prev_count)
+        prev_le, prev_count = le, count
+    return prev_le
+
+
+def stage_delta(before: Dict, after: Dict) -> Dict[str, Dict]:
+    """Statistik stage untuk observasi di antara dua scrape"""
+    result = {}
+    for name, hist in after.items():
+        old = dict(before.get(name, {}).get("buckets", []))
+        buckets = [(le, count - old.get(le, 0.0)) for le, count in hist["buckets"]]
+        count = buckets[-1][1] if buckets else 0
+        if count <= 0:
+            continue
+        total = hist["sum"] - before.get(name, {}).get("sum", 0.0)
+        result[name] = {
+            "count": int(count),
+            "mean_ms": total / count * 1000,
+            "p50_ms": histogram_quantile(0.50, buckets) * 1000,
+            "p95_ms": histogram_quantile(0.95, buckets) * 1000,
+            "p99_ms": histogram_quantile(0.99, buckets) * 1000,
+        }
+    return result
+
+
+# ============================
+# Load generator
+# ============================
+async def send(client: httpx.AsyncClient, endpoint: str, image: bytes, seq: int):
+    files = {"file": ("image.jpg", image, "image/jpeg")}
+    if endpoint == "register":
+        return await client.post(ENDPOINTS[endpoint], data={"employee_id": f"bench-{seq:07d}"}, files=files)
+    return await client.post(ENDPOINTS[endpoint], files=files)
+
+
+def outcome_of(endpoint: str, response: httpx.Response) -> str:
+    if response.status_code != 200:
+        return f"http_{response.status_code}"
+    if endpoint == "register":
+        return "registered"
+    body = response.json()
+    if body.get("success"):
+        return "match"
+    return "no_face" if "terdeteksi" in body.get("message", "") else "no_match"
+
+
+async def run_endpoint(client: httpx.AsyncClient, endpoint: str, corpus: List[bytes],
+                       concurrency: int, total: int, seq_start: int) -> Dict:
+    """Kirim total request dengan concurrency worker, return statistik client-side"""
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await send(client, endpoint, corpus[i % len(corpus)], seq_start + i)
+                outcomes[outcome_of(endpoint, response)] += 1
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    samples = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": float(samples.mean()),
+            "p50": float(np.percentile(samples, 50)),
+            "p95": float(np.percentile(samples, 95)),
+            "p99": float(np.percentile(samples, 99)),
+        },
+        "outcomes": dict(outcomes),
+    }
+
+
+async def run_suite(client: httpx.AsyncClient, args, corpus: List[bytes]) -> List[Dict]:
+    # Register corpus supaya recognize / checkin menghasilkan match
+    if args.enroll_corpus:
+        for i, image in enumerate(corpus):
+            response = await client.post(ENDPOINTS["register"], data={"employee_id": f"corpus-{i}"},
+                                         files={"file": ("image.jpg", image, "image/jpeg")})
+            if response.status_code != 200:
+                print(f"! corpus image {i} not enrolled: {response.status_code} {response.text[:100]}")
+
+    results = []
+    seq = 0
+    for endpoint in args.endpoints:
+        for concurrency in args.concurrency:
+            await run_endpoint(client, endpoint, corpus, concurrency, args.warmup, seq)
+            seq += args.warmup
+            before = (await client.get("/metrics")).text
+            result = await run_endpoint(client, endpoint, corpus, concurrency, args.requests, seq)
+            seq += args.requests
+            after = (await client.get("/metrics")).text
+            result["stages"] = stage_delta(parse_stage_histograms(before), parse_stage_histograms(after))
+            result["result_cache_hits"] = int(parse_result_cache_hits(after) - parse_result_cache_hits(before))
+            results.append(result)
+            print_result(result)
+    return results
+
+
+# ============================
+# Reporting
+# ============================
+def print_result(result: Dict):
+    lat = result["latency_ms"]
+    print(f"{result['endpoint']:>10} c={result['concurrency']:<3} {result['throughput_rps']:>8.1f} req/s  "
+          f"p50 {lat['p50']:>8.1f}  p95 {lat['p95']:>8.1f}  p99 {lat['p99']:>8.1f} ms  "
+          f"errors {result['errors']}  {result['outcomes']}")
+    if result["result_cache_hits"]:
+        print(f"{'':>16}! {result['result_cache_hits']} request dijawab dari result cache")
+    for name, s in sorted(result["stages"].items()):
+        print(f"{'':>16}{name:>8}  p50 {s['p50_ms']:>8.2f}  p95 {s['p95_ms']:>8.2f}  "
+              f"p99 {s['p99_ms']:>8.2f} ms  (mean {s['mean_ms']:.2f}, n={s['count']})")
+
+
+def compare(results: List[Dict], baseline_path: str):
+    """Bandingkan throughput & p95 dengan file hasil sebelumnya"""
+    baseline = json.loads(Path(baseline_path).read_text())
+    base = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('git_commit')}):")
+    for r in results:
+        b = base.get((r["endpoint"], r["concurrency"]))
+        if b is None:
+            continue
+        print(f"{r['endpoint']:>10} c={r['concurrency']:<3} throughput {r['throughput_rps'] / b['throughput_rps']:>6.2f}x  "
+              f"p95 {r['latency_ms']['p95'] / b['latency_ms']['p95']:>6.2f}x")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=str(API_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_meta(args, corpus: List[bytes]) -> Dict:
+    from config import config
+
+    settings = {}
+    for key, value in config.get_all().items():
+        if "KEY" in key or "PASSWORD" in key:
+            continue
+        if isinstance(value, Path):
+            value = str(value)
+        elif isinstance(value, set):
+            value = sorted(value)
+        elif not isinstance(value, (str, int, float, bool, list, tuple, type(None))):
+            continue
+        settings[key] = value
+    return {
+        "git_commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "mode": "url" if args.url else "in-process",
+        "url": args.url,
+        "gallery_size": args.gallery_size,
+        "corpus_images": len(corpus),
+        "requests": args.requests,
+        "warmup": args.warmup,
+        # Mode --url: setting cache milik server, tidak diketahui dari sini (lihat result_cache_hits)
+        "result_cache_size": None if args.url else config.RESULT_CACHE_SIZE,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": settings,
+    }
+
+
+# ============================
+# Main
+# ============================
+async def main_async(args, corpus: List[bytes]) -> List[Dict]:
+    if args.url:
+        if args.seed_dir:
+            seed_gallery(Path(args.seed_dir), args.gallery_size)
+        async with httpx.AsyncClient(base_url=args.url, timeout=120) as client:
+            return await run_suite(client, args, corpus)
+
+    with tempfile.TemporaryDirectory(prefix="bench-load-") as workdir:
+        import main as api
+
+        logging.getLogger().setLevel(args.log_level)
+        api.EMBEDDINGS_DIR = Path(workdir) / "embeddings"
+        api.FACES_DIR = Path(workdir) / "faces"
+        api.EMBEDDINGS_DIR.mkdir()
+        api.FACES_DIR.mkdir()
+        if args.gallery_size:
+            seed_gallery(api.EMBEDDINGS_DIR, args.gallery_size)
+
+        await api.startup_event()
+        try:
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+                return await run_suite(client, args, corpus)
+        finally:
+            await api.shutdown_event()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory corpus gambar (default: contoh bawaan insightface)")
+    parser.add_argument("--gallery-size", type=int, default=1000, help="Embeddings sintetis di gallery")
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=100, help="Request per endpoint per concurrency")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--no-enroll-corpus", dest="enroll_corpus", action="store_false")
+    parser.add_argument("--url", help="Benchmark server lokal yang sudah jalan, bukan in-process")
+    parser.add_argument("--seed-dir", help="Mode --url: isi embedding store di directory ini dengan gallery sintetis")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="Mode in-process: pakai RESULT_CACHE_SIZE dari env (default: cache dimatikan)")
+    parser.add_argument("--log-level", default="WARNING", help="Level log app in-process (default WARNING)")
+    parser.add_argument("--output", help="File JSON hasil (default benchmarks/results/load-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="File JSON hasil sebelumnya untuk dibandingkan")
+    args = parser.parse_args()
+    if not args.url and not args.result_cache:
+        os.environ["RESULT_CACHE_SIZE"] = "0"  # Sebelum config di-import (build_meta / main)
+
+    corpus = load_corpus(args.images)
+    meta = build_meta(args, corpus)
+    results = asyncio.run(main_async(args, corpus))
+
+    output = Path(args.output) if args.output else (
+        Path(__file__).parent / "results" / f"load-{meta['git_commit'] or 'nogit'}-{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
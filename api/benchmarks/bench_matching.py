@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: vectorized MatchingEngine vs loop per-employee lama
+
+Usage (dari folder api/):
+    python benchmarks/bench_matching.py
+    python benchmarks/bench_matching.py --sizes 1000 10000 100000 --dim 512
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gallery import EmbeddingGallery  # noqa: E402
+from matching import MatchingEngine  # noqa: E402
+
+
+def legacy_find_matching_face(query_embedding, database_embeddings, threshold):
+    """Implementasi find_matching_face sebelum vectorized (baseline)"""
+    best_match = None
+    best_similarity = 0.0
+    for employee_id, db_embedding in database_embeddings.items():
+        similarity = float(np.dot(query_embedding, db_embedding) /
+                           (np.linalg.norm(query_embedding) * np.linalg.norm(db_embedding)))
+        if similarity > best_similarity:
+            best_similarity = similarity
+            best_match = employee_id
+    if best_similarity >= threshold:
+        return best_match, best_similarity
+    return None
+
+
+def build_gallery(n: int, dim: int, rng: np.random.Generator):
+    embeddings = rng.standard_normal((n, dim)).astype(np.float32)
+    database = {f"emp{i:06d}": embeddings[i] for i in range(n)}
+    gallery = EmbeddingGallery("/nonexistent", refresh_interval=float("inf"))
+    for employee_id, embedding in database.items():
+        gallery.upsert(employee_id, embedding)
+    return database, gallery
+
+
+def time_call(fn, repeats: int) -> float:
+    """Median latency dalam ms"""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'N':>8} {'loop (ms)':>12} {'vector (ms)':>12} {'speedup':>9}  same")
+    for n in args.sizes:
+        database, gallery = build_gallery(n, args.dim, rng)
+        engine = MatchingEngine(gallery, args.threshold)
+        # Query = noisy copy dari salah satu identity supaya ada match
+        query = database[f"emp{n // 2:06d}"] + 0.3 * rng.standard_normal(args.dim).astype(np.float32)
+
+        legacy = legacy_find_matching_face(query, database, args.threshold)
+        result = engine.search(query, k=args.k)
+        same = legacy is not None and result.best[0] == legacy[0]
+
+        loop_repeats = max(1, min(args.repeats, 200000 // n))
+        loop_ms = time_call(lambda: legacy_find_matching_face(query, database, args.threshold), loop_repeats)
+        vec_ms = time_call(lambda: engine.search(query, k=args.k), args.repeats)
+        print(f"{n:>8} {loop_ms:>12.3f} {vec_ms:>12.3f} {loop_ms / vec_ms:>8.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark pipeline extraction: FaceAnalysis.get (semua head, semua wajah) vs
+lean pipeline (detection -> wajah target -> align -> recognition)
+
+Usage (dari folder api/, butuh model InsightFace):
+    python benchmarks/bench_pipeline.py --image ../data/faces/contoh.jpg
+    python benchmarks/bench_pipeline.py --image face.jpg --faces 1 3 8 --repeats 20
+
+Frame dengan N wajah dibuat dengan menyusun --image N kali dalam grid
+(simulasi antrian di belakang user di kiosk).
+"""
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import FaceRecognitionSystem  # noqa: E402
+
+
+def make_frame(face_img: np.ndarray, n_faces: int, cell: int = 320) -> np.ndarray:
+    """Susun n_faces copy face_img dalam grid; copy pertama paling besar (user di depan kiosk)"""
+    cols = math.ceil(math.sqrt(n_faces))
+    rows = math.ceil(n_faces / cols)
+    frame = np.full((rows * cell, cols * cell, 3), 127, dtype=np.uint8)
+    for i in range(n_faces):
+        size = cell if i == 0 else int(cell * 0.7)
+        tile = cv2.resize(face_img, (size, size))
+        r, c = divmod(i, cols)
+        y, x = r * cell + (cell - size) // 2, c * cell + (cell - size) // 2
+        frame[y:y + size, x:x + size] = tile
+    return frame
+
+
+def legacy_extract(face_system: FaceRecognitionSystem, img: np.ndarray):
+    """Pipeline sebelumnya: app.get menjalankan semua model untuk semua wajah"""
+    faces = face_system.app.get(img)
+    if not faces:
+        return None
+    return max(faces, key=lambda x: (x.bbox[2] - x.bbox[0]) * (x.bbox[3] - x.bbox[1]))
+
+
+def time_ms(fn, repeats: int):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples)), float(np.percentile(samples, 95))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", required=True, help="Foto dengan satu wajah")
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 3, 8])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    face_img = cv2.imread(args.image)
+    if face_img is None:
+        sys.exit(f"Cannot read image: {args.image}")
+
+    face_system = FaceRecognitionSystem()
+    print(f"{'faces':>6} {'detected':>9} {'app.get p50':>12} {'p95':>8} {'lean p50':>10} {'p95':>8} {'speedup':>8}  same")
+    for n in args.faces:
+        frame = make_frame(face_img, n)
+        detected = face_system.detect_faces(frame)[0].shape[0]
+        legacy_face = legacy_extract(face_system, frame)
+        lean = face_system.extract_face_embedding_from_array(frame)
+        same = (legacy_face is not None and lean is not None and
+                float(np.dot(legacy_face.normed_embedding, lean["embedding"] / lean["embedding_norm"])) > 0.999)
+
+        legacy_p50, legacy_p95 = time_ms(lambda: legacy_extract(face_system, frame), args.repeats)
+        lean_p50, lean_p95 = time_ms(lambda: face_system.extract_face_embedding_from_array(frame), args.repeats)
+        print(f"{n:>6} {detected:>9} {legacy_p50:>12.1f} {legacy_p95:>8.1f} {lean_p50:>10.1f} {lean_p95:>8.1f} "
+              f"{legacy_p50 / lean_p50:>7.2f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
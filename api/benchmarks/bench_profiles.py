@@ -0,0 +1,63 @@
+"""
+Benchmark startup time dan resident memory per pipeline profile
+
+Usage (dari folder api/, butuh model InsightFace):
+    python benchmarks/bench_profiles.py
+    python benchmarks/bench_profiles.py --profiles full recognition --model buffalo_l
+
+Setiap profile di-load di subprocess baru, jadi angka RSS tidak tercampur
+dengan model yang sudah di-load profile sebelumnya.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+from utils import PIPELINE_PROFILES  # noqa: E402
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {api_dir!r})
+from utils import FaceRecognitionSystem, get_rss_mb
+rss_start = get_rss_mb()
+start = time.perf_counter()
+face_system = FaceRecognitionSystem(model_name={model!r}, pipeline_profile={profile!r}, embeddings_dir={tmp!r})
+stats = dict(face_system.load_stats)
+stats["startup_seconds"] = time.perf_counter() - start
+stats["rss_total_mb"] = get_rss_mb()
+stats["rss_baseline_mb"] = rss_start
+print("RESULT " + json.dumps(stats))
+"""
+
+
+def run_profile(profile: str, model: str, tmp: str) -> dict:
+    code = CHILD.format(api_dir=str(API_DIR), model=model, profile=profile, tmp=tmp)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=str(API_DIR))
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"Profile {profile} failed:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    import tempfile
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=list(PIPELINE_PROFILES), choices=list(PIPELINE_PROFILES))
+    parser.add_argument("--model", default="buffalo_l")
+    args = parser.parse_args()
+
+    print(f"{'profile':>12} {'load s':>8} {'startup s':>10} {'model RSS MB':>13} {'total RSS MB':>13}  modules")
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in args.profiles:
+            stats = run_profile(profile, args.model, tmp)
+            print(f"{profile:>12} {stats['load_seconds']:>8.2f} {stats['startup_seconds']:>10.2f} "
+                  f"{stats['rss_delta_mb']:>13.0f} {stats['rss_total_mb']:>13.0f}  {', '.join(stats['modules'])}")
+
+
+if __name__ == "__main__":
+    main()
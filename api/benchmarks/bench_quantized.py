@@ -0,0 +1,155 @@
+"""
+Evaluasi model quantized vs fp32: speedup, drift embedding dan keputusan match
+
+Usage (dari folder api/, butuh model InsightFace + varian dari quantize_models.py):
+    python benchmarks/bench_quantized.py --images ../data/faces
+    python benchmarks/bench_quantized.py --precisions int8-static int8-dynamic --threshold 0.4
+
+Untuk setiap image, pipeline lengkap (detect -> wajah target -> align ->
+embed) dijalankan dengan fp32 dan setiap precision. Yang dilaporkan:
+- det: image yang hasil detect-nya sama (ada / tidak ada wajah) dan IoU bbox target
+- cos: cosine embedding quantized vs fp32 untuk image yang sama (1.0 = identik)
+- self: embedding quantized masih cocok dengan embedding fp32 image yang sama
+  (karyawan yang register dengan fp32 tetap dikenali setelah ganti precision)
+- pairs: keputusan match (similarity >= threshold) untuk semua pasangan image
+  berbeda, query quantized vs gallery fp32, dibanding query fp32 vs gallery fp32
+- speedup: median latency detect / embed fp32 dibagi precision tsb
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import config  # noqa: E402
+from model_loader import MODEL_PRECISIONS  # noqa: E402
+from quantize_models import list_images  # noqa: E402
+from utils import FaceRecognitionSystem, bbox_iou  # noqa: E402
+
+
+def run_precision(precision: str, images: List[np.ndarray], args) -> Dict:
+    """Embedding (normalized), bbox dan latency per image untuk satu precision"""
+    face_system = FaceRecognitionSystem(
+        det_size=(args.det_size, args.det_size),
+        model_name=args.model,
+        model_root=args.model_root,
+        model_precision=precision,
+        quantized_models_dir=args.quantized_dir,
+        warmup_iterations=args.warmup
+    )
+    face_system.warmup()
+    embeddings: List[Optional[np.ndarray]] = []
+    bboxes: List[Optional[List[float]]] = []
+    detect_ms, embed_ms = [], []
+    for img in images:
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            boxes, kpss = face_system.detect_faces(img)
+            detect_ms.append((time.perf_counter() - start) * 1000)
+        if boxes.shape[0] == 0:
+            embeddings.append(None)
+            bboxes.append(None)
+            continue
+        i = face_system.select_face(boxes, img.shape)
+        crop = face_system.align_face(img, kpss[i])
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            embedding = face_system.embed_aligned([crop])[0]
+            embed_ms.append((time.perf_counter() - start) * 1000)
+        embeddings.append(embedding / np.linalg.norm(embedding))
+        bboxes.append(boxes[i, :4].tolist())
+    face_system.close()
+    return {
+        "embeddings": embeddings,
+        "bboxes": bboxes,
+        "detect_ms": float(np.median(detect_ms)),
+        "embed_ms": float(np.median(embed_ms)) if embed_ms else float("nan"),
+    }
+
+
+def compare(base: Dict, other: Dict, threshold: float) -> Dict:
+    """Drift dan agreement keputusan match precision lain terhadap fp32"""
+    n = len(base["embeddings"])
+    det_agree = sum((b is None) == (o is None) for b, o in zip(base["embeddings"], other["embeddings"]))
+    both = [i for i in range(n) if base["embeddings"][i] is not None and other["embeddings"][i] is not None]
+    if not both:
+        return {"det_agree": det_agree, "compared": 0}
+
+    gallery = np.stack([base["embeddings"][i] for i in both])   # fp32 (seperti yang sudah ter-register)
+    queries = np.stack([other["embeddings"][i] for i in both])
+    cos = np.sum(gallery * queries, axis=1)
+    ious = [bbox_iou(base["bboxes"][i], other["bboxes"][i]) for i in both]
+
+    off_diag = ~np.eye(len(both), dtype=bool)
+    base_decisions = (gallery @ gallery.T >= threshold)[off_diag]
+    other_decisions = (queries @ gallery.T >= threshold)[off_diag]
+    return {
+        "det_agree": det_agree,
+        "compared": len(both),
+        "bbox_iou_mean": float(np.mean(ious)),
+        "cos_mean": float(cos.mean()),
+        "cos_min": float(cos.min()),
+        "self_match_rate": float(np.mean(cos >= threshold)),
+        "pairs": int(off_diag.sum()),
+        "pair_agreement": float(np.mean(base_decisions == other_decisions)) if off_diag.any() else 1.0,
+        "pair_flips": int(np.sum(base_decisions != other_decisions)),
+        "detect_speedup": base["detect_ms"] / other["detect_ms"],
+        "embed_speedup": base["embed_ms"] / other["embed_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=config.FACES_DIR)
+    parser.add_argument("--max-images", type=int, default=200)
+    parser.add_argument("--precisions", nargs="+", default=["int8-static", "int8-dynamic"],
+                        choices=[p for p in MODEL_PRECISIONS if p != "fp32"])
+    parser.add_argument("--threshold", type=float, default=config.SIMILARITY_THRESHOLD)
+    parser.add_argument("--model", default=config.MODEL_NAME)
+    parser.add_argument("--model-root", default=config.MODEL_ROOT)
+    parser.add_argument("--quantized-dir", default=config.QUANTIZED_MODELS_DIR)
+    parser.add_argument("--det-size", type=int, default=config.DETECTION_SIZE[0])
+    parser.add_argument("--repeats", type=int, default=3, help="Pengukuran latency per image")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--output", type=Path, help="Simpan hasil sebagai JSON")
+    args = parser.parse_args()
+
+    paths = list_images(args.images, args.max_images)
+    images = [img for img in (cv2.imread(str(p)) for p in paths) if img is not None]
+    print(f"images: {len(images)}, threshold: {args.threshold}")
+
+    base = run_precision("fp32", images, args)
+    found = sum(e is not None for e in base["embeddings"])
+    print(f"fp32: faces {found}/{len(images)}, detect {base['detect_ms']:.1f} ms, embed {base['embed_ms']:.1f} ms")
+
+    print(f"{'precision':>13} {'det':>8} {'iou':>6} {'cos mean':>9} {'cos min':>8} {'self':>6} "
+          f"{'pairs agree':>12} {'flips':>6} {'det ms':>7} {'x':>5} {'emb ms':>7} {'x':>5}")
+    results = {"fp32": {"detect_ms": base["detect_ms"], "embed_ms": base["embed_ms"], "faces": found}}
+    for precision in args.precisions:
+        other = run_precision(precision, images, args)
+        report = compare(base, other, args.threshold)
+        report.update(detect_ms=other["detect_ms"], embed_ms=other["embed_ms"])
+        results[precision] = report
+        if report["compared"] == 0:
+            print(f"{precision:>13} {report['det_agree']:>4}/{len(images):<3} no comparable faces")
+            continue
+        print(f"{precision:>13} {report['det_agree']:>4}/{len(images):<3} {report['bbox_iou_mean']:>6.3f} "
+              f"{report['cos_mean']:>9.4f} {report['cos_min']:>8.4f} {report['self_match_rate']:>6.1%} "
+              f"{report['pair_agreement']:>12.2%} {report['pair_flips']:>6} "
+              f"{other['detect_ms']:>7.1f} {report['detect_speedup']:>5.2f} "
+              f"{other['embed_ms']:>7.1f} {report['embed_speedup']:>5.2f}")
+
+    if args.output:
+        args.output.write_text(json.dumps({"threshold": args.threshold, "images": len(images), "results": results},
+                                          indent=2))
+        print(f"saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Sweep setting ONNX Runtime: session pool size x intra-op / inter-op threads
+x graph optimization, diukur dengan N thread yang memanggil
+extract_face_embedding_from_array bersamaan (seperti thread executor API)
+
+Usage (dari folder api/, butuh model InsightFace):
+    python benchmarks/bench_sessions.py
+    python benchmarks/bench_sessions.py --pool 1 2 4 --intra 0 1 2 4 --concurrency 4 8
+    python benchmarks/bench_sessions.py --image path/ke/foto_wajah.jpg --opt basic all
+
+Setiap kombinasi dijalankan di subprocess baru supaya thread pool ORT tidak
+tercampur. Pilih kombinasi dengan throughput tertinggi yang p95-nya masih
+masuk akal, lalu set ORT_* di .env (pool x intra sebaiknya <= jumlah core).
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+API_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(API_DIR))
+
+CHILD = """
+import json, sys, threading, time
+sys.path.insert(0, {api_dir!r})
+import cv2
+import numpy as np
+from utils import FaceRecognitionSystem
+img = cv2.imread({image!r})
+face_system = FaceRecognitionSystem(
+    model_name={model!r}, embeddings_dir={tmp!r},
+    intra_op_threads={intra}, inter_op_threads={inter},
+    graph_optimization={opt!r}, session_pool_size={pool}
+)
+for _ in range({warmup}):
+    face_system.extract_face_embedding_from_array(img)
+latencies = []
+lock = threading.Lock()
+def worker():
+    for _ in range({requests}):
+        start = time.perf_counter()
+        face_system.extract_face_embedding_from_array(img)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+threads = [threading.Thread(target=worker) for _ in range({concurrency})]
+start = time.perf_counter()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+wall = time.perf_counter() - start
+samples = np.array(latencies) * 1000
+print("RESULT " + json.dumps({{
+    "throughput": len(latencies) / wall,
+    "p50": float(np.percentile(samples, 50)),
+    "p95": float(np.percentile(samples, 95)),
+}}))
+"""
+
+
+def default_image() -> str:
+    import insightface
+
+    return str(Path(insightface.__file__).parent / "data" / "images" / "t1.jpg")
+
+
+def run_config(args, tmp: str, pool: int, intra: int, inter: int, opt: str, concurrency: int) -> dict:
+    code = CHILD.format(
+        api_dir=str(API_DIR), image=args.image, model=args.model, tmp=tmp,
+        intra=intra, inter=inter, opt=opt, pool=pool, warmup=args.warmup,
+        requests=args.requests, concurrency=concurrency
+    )
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=str(API_DIR))
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"pool={pool} intra={intra} inter={inter} opt={opt} failed:\n{proc.stderr[-2000:]}")
+
+
+def main():
+    import tempfile
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", default=None, help="Foto dengan wajah (default: sample insightface)")
+    parser.add_argument("--model", default="buffalo_l")
+    parser.add_argument("--pool", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--intra", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--inter", type=int, nargs="+", default=[0])
+    parser.add_argument("--opt", nargs="+", default=["all"], choices=["disable", "basic", "extended", "all"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4])
+    parser.add_argument("--requests", type=int, default=20, help="Request per thread")
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args()
+    args.image = args.image or default_image()
+
+    print(f"cpu cores: {os.cpu_count()}")
+    print(f"{'pool':>5} {'intra':>6} {'inter':>6} {'opt':>9} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pool, intra, inter, opt, concurrency in itertools.product(
+                args.pool, args.intra, args.inter, args.opt, args.concurrency):
+            result = run_config(args, tmp, pool, intra, inter, opt, concurrency)
+            print(f"{pool:>5} {intra:>6} {inter:>6} {opt:>9} {concurrency:>5} "
+                  f"{result['throughput']:>8.1f} {result['p50']:>8.1f} {result['p95']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Bulk enrollment offline: register foto satu site sekaligus tanpa HTTP
+
+Usage (dari folder api/):
+    python bulk_enroll.py ../data/onboarding            # directory berisi {employee_id}_*.jpg
+    python bulk_enroll.py site-a.zip --workers 4
+    python bulk_enroll.py site-a.zip --dry-run          # hanya report, tanpa commit
+    python bulk_enroll.py site-a.zip --restart          # abaikan journal, proses ulang semua file
+
+Detection + embedding dijalankan di pool process (satu model per worker, image
+lewat shared memory, lihat inference_pool.py); read + decode di thread process
+ini. Foto per karyawan jadi template (maks MAX_TEMPLATES_PER_EMPLOYEE, confidence
+tertinggi lebih dulu) dan semuanya ditulis ke embedding store dalam satu commit
+atomic; template lama karyawan yang di-enroll dihapus di commit yang sama.
+API yang sedang jalan mengambil perubahan saat refresh gallery.
+
+Setiap file yang selesai dicatat di journal (JSONL, termasuk embedding), jadi run
+yang terputus cukup dijalankan ulang: file yang sudah ada di journal dilewati.
+File yang ditolak (no_face, multiple_faces, low_confidence, unreadable,
+invalid_name, template_cap, already_enrolled) ditulis ke rejects.csv.
+"""
+import argparse
+import base64
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import logging
+
+import numpy as np
+
+from config import config
+from embedding_store import EmbeddingStore
+from ingest import ImageIngestor, ImageRejected
+from templates import TEMPLATE_SEPARATOR, template_key, template_owner
+from utils import FaceRecognitionSystem
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+MAX_ENROLL_FILE_SIZE = 50 * 1024 * 1024  # Offline: foto kamera asli boleh lebih besar dari limit upload
+DEFAULT_WORK_DIR = Path(__file__).parent.parent / "data" / "bulk_enroll"
+
+
+def employee_id_from_name(name: str) -> Optional[str]:
+    """employee_id dari nama file {employee_id}_*.jpg / {employee_id}.jpg, None jika tidak valid"""
+    stem = Path(name).stem
+    employee_id = stem.split("_", 1)[0].strip()
+    if not employee_id or TEMPLATE_SEPARATOR in employee_id or "\n" in employee_id or "\r" in employee_id:
+        return None
+    return employee_id
+
+
+class EnrollSource:
+    """File foto dari directory (rekursif) atau zip"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._lock = threading.Lock()
+        if path.is_file() and zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+        elif not path.is_dir():
+            raise ValueError(f"Source harus directory atau zip: {path}")
+
+    def names(self) -> List[str]:
+        if self._zip is not None:
+            names = [info.filename for info in self._zip.infolist() if not info.is_dir()]
+        else:
+            names = [p.relative_to(self.path).as_posix() for p in self.path.rglob("*") if p.is_file()]
+        return sorted(name for name in names
+                      if name.lower().endswith(IMAGE_SUFFIXES) and not Path(name).name.startswith("."))
+
+    def read(self, name: str) -> bytes:
+        if self._zip is not None:
+            with self._lock:  # Satu file handle zip dipakai bersama oleh semua thread
+                return self._zip.read(name)
+        return (self.path / name).read_bytes()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+class Journal:
+    """Hasil per file (append-only JSONL) untuk resume setelah interrupt"""
+
+    def __init__(self, path: Path, restart: bool = False):
+        self.path = path
+        self.records: Dict[str, Dict] = {}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if restart and path.exists():
+            path.unlink()
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Baris terakhir terpotong saat interrupt
+                    self.records[record["file"]] = record
+        self._file = open(path, "a", encoding="utf-8")
+
+    def append(self, record: Dict):
+        self.records[record["file"]] = record
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def encode_embedding(embedding: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(embedding, dtype="<f4").tobytes()).decode("ascii")
+
+
+def decode_embedding(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+def extract_file(face_system: FaceRecognitionSystem,
+                 ingestor: ImageIngestor,
+                 source: EnrollSource,
+                 name: str,
+                 min_confidence: float,
+                 allow_multiple: bool,
+                 detection: str) -> Dict:
+    """
+    Read -> decode -> extract_face_embedding satu file (dijalankan di thread)
+
+    Returns:
+        Record journal: file, employee_id, status ("ok" / "rejected"), reason, confidence, faces, embedding
+    """
+    record = {"file": name, "employee_id": employee_id_from_name(name), "status": "rejected"}
+    if record["employee_id"] is None:
+        return dict(record, reason="invalid_name")
+    try:
+        decoded = ingestor.decode(source.read(name))
+    except (ImageRejected, OSError) as e:
+        return dict(record, reason="unreadable", detail=getattr(e, "message", str(e)))
+
+    result = face_system.extract_face_embedding_from_array(decoded.image, detection)
+    if result is None:
+        return dict(record, reason="no_face")
+    record.update(confidence=round(result["confidence"], 4), faces=result.get("faces", 1))
+    if record["faces"] > 1 and not allow_multiple:
+        return dict(record, reason="multiple_faces")
+    if result["confidence"] < min_confidence:
+        return dict(record, reason="low_confidence")
+    return dict(record, status="ok", embedding=encode_embedding(result["embedding"]))
+
+
+def select_templates(records: List[Dict], max_templates: int) -> Tuple[List[Tuple[str, np.ndarray]], List[Dict]]:
+    """
+    Template per karyawan dari record "ok": confidence tertinggi lebih dulu, maks max_templates
+
+    Returns:
+        Tuple (items [(key template, embedding)], record yang tidak terpakai karena cap)
+    """
+    by_employee: Dict[str, List[Dict]] = defaultdict(list)
+    for record in records:
+        by_employee[record["employee_id"]].append(record)
+
+    items = []
+    capped = []
+    for employee_id, employee_records in sorted(by_employee.items()):
+        employee_records.sort(key=lambda r: (-r["confidence"], r["file"]))
+        for slot, record in enumerate(employee_records[:max_templates]):
+            items.append((template_key(employee_id, slot), decode_embedding(record["embedding"])))
+        capped.extend(dict(record, status="rejected", reason="template_cap")
+                      for record in employee_records[max_templates:])
+    return items, capped
+
+
+def write_report(path: Path, rejects: List[Dict]):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["file", "employee_id", "reason", "faces", "confidence", "detail"])
+        for record in sorted(rejects, key=lambda r: r["file"]):
+            writer.writerow([record["file"], record.get("employee_id") or "", record["reason"],
+                             record.get("faces", ""), record.get("confidence", ""), record.get("detail", "")])
+
+
+def enroll(source_path: Path,
+           embeddings_dir: Path,
+           work_dir: Path,
+           workers: int,
+           max_templates: int,
+           min_confidence: float = 0.7,
+           allow_multiple: bool = False,
+           skip_existing: bool = False,
+           restart: bool = False,
+           dry_run: bool = False,
+           intra_op_threads: int = 0) -> Dict:
+    """
+    Proses semua foto di source lalu commit template ke embedding store
+
+    Args:
+        source_path: Directory atau zip berisi {employee_id}_*.jpg
+        embeddings_dir: Directory embedding store
+        work_dir: Directory journal dan report untuk source ini
+        workers: Jumlah inference process (0 = inference di process ini)
+        max_templates: Maks template per karyawan
+        min_confidence: Score detection minimum
+        allow_multiple: Terima foto dengan beberapa wajah (pakai wajah terbesar)
+        skip_existing: Jangan sentuh karyawan yang sudah punya embedding di store
+        restart: Hapus journal dan proses ulang semua file
+        dry_run: Tulis report tanpa commit ke store
+        intra_op_threads: Thread ONNX Runtime per worker (0 = core / workers)
+
+    Returns:
+        Ringkasan: files, processed, employees, templates, rejected
+    """
+    source = EnrollSource(source_path)
+    journal = Journal(work_dir / "journal.jsonl", restart=restart)
+    names = source.names()
+    pending = [name for name in names if name not in journal.records]
+    logger.info(f"✓ {len(names)} foto di {source_path}, {len(names) - len(pending)} sudah di journal, "
+                f"{len(pending)} diproses")
+
+    if pending:
+        if not intra_op_threads:
+            intra_op_threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+        det_size = config.DETECTION_SIZE
+        face_system = FaceRecognitionSystem(
+            det_size=det_size,
+            face_selection=config.FACE_SELECTION,
+            model_name=config.MODEL_NAME,
+            model_root=config.MODEL_ROOT,
+            providers=config.MODEL_PROVIDERS,
+            pipeline_profile="recognition",
+            inference_processes=workers,
+            intra_op_threads=intra_op_threads,
+            graph_cache_dir=config.ORT_GRAPH_CACHE_DIR if config.ORT_GRAPH_CACHE else None,
+            warmup_iterations=0,
+            model_precision=config.MODEL_PRECISION,
+            quantized_models_dir=config.QUANTIZED_MODELS_DIR,
+            detection_mode=config.REGISTER_DETECTION_MODE
+        )
+        ingestor = ImageIngestor(
+            max_file_size=MAX_ENROLL_FILE_SIZE,
+            min_size=config.MIN_IMAGE_SIZE,
+            max_pixels=config.MAX_IMAGE_PIXELS,
+            target_size=det_size if config.REDUCED_DECODE else None
+        )
+        start = time.perf_counter()
+        try:
+            # Thread > worker supaya read + decode file berikutnya overlap dengan inference
+            with ThreadPoolExecutor(max_workers=max(workers, 1) * 2) as executor:
+                futures = [executor.submit(extract_file, face_system, ingestor, source, name, min_confidence,
+                                           allow_multiple, config.REGISTER_DETECTION_MODE) for name in pending]
+                for done, future in enumerate(as_completed(futures), 1):
+                    journal.append(future.result())
+                    if done % 100 == 0 or done == len(futures):
+                        elapsed = time.perf_counter() - start
+                        logger.info(f"- {done}/{len(futures)} foto ({done / elapsed:.1f} foto/s)")
+        finally:
+            face_system.close()
+    source.close()
+    journal.close()
+
+    records = [journal.records[name] for name in names if name in journal.records]
+    rejects = [record for record in records if record["status"] != "ok"]
+    accepted = [record for record in records if record["status"] == "ok"]
+
+    store = EmbeddingStore(str(embeddings_dir))
+    store.sync(force=True)
+    if skip_existing:
+        existing = {template_owner(key) for key in store.live}
+        rejects.extend(dict(record, status="rejected", reason="already_enrolled")
+                       for record in accepted if record["employee_id"] in existing)
+        accepted = [record for record in accepted if record["employee_id"] not in existing]
+
+    items, capped = select_templates(accepted, max(1, max_templates))
+    rejects.extend(capped)
+    employees: Set[str] = {template_owner(key) for key, _ in items}
+    # Template lama karyawan yang di-enroll ulang (slot yang tidak ditulis lagi)
+    stale = [key for key in store.live if template_owner(key) in employees]
+
+    report_path = work_dir / "rejects.csv"
+    write_report(report_path, rejects)
+    reasons: Dict[str, int] = defaultdict(int)
+    for record in rejects:
+        reasons[record["reason"]] += 1
+    logger.info(f"✓ Rejects: {len(rejects)} {dict(reasons)} -> {report_path}")
+
+    if dry_run:
+        logger.info(f"- Dry run: {len(items)} template untuk {len(employees)} karyawan tidak di-commit")
+    elif items:
+        store.put_many(items, delete=stale)
+        logger.info(f"✓ Enrolled {len(employees)} karyawan ({len(items)} template), "
+                    f"store sekarang berisi {len(store)} embeddings")
+
+    return {
+        "files": len(names),
+        "processed": len(pending),
+        "employees": len(employees),
+        "templates": len(items),
+        "rejected": len(rejects),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", type=Path, help="Directory atau zip berisi {employee_id}_*.jpg")
+    parser.add_argument("--embeddings-dir", type=Path, default=config.EMBEDDINGS_DIR)
+    parser.add_argument("--work-dir", type=Path, default=None,
+                        help="Journal + rejects.csv (default ../data/bulk_enroll/<nama source>)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Jumlah inference process, satu model per process (0 = tanpa pool)")
+    parser.add_argument("--intra-op-threads", type=int, default=config.ORT_INTRA_OP_THREADS,
+                        help="Thread ONNX Runtime per worker (0 = core / workers)")
+    parser.add_argument("--max-templates", type=int, default=config.MAX_TEMPLATES_PER_EMPLOYEE)
+    parser.add_argument("--min-confidence", type=float, default=0.7, help="Score detection minimum")
+    parser.add_argument("--allow-multiple", action="store_true",
+                        help="Terima foto dengan beberapa wajah (pakai wajah target)")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="Lewati karyawan yang sudah punya embedding di store")
+    parser.add_argument("--restart", action="store_true", help="Hapus journal, proses ulang semua file")
+    parser.add_argument("--dry-run", action="store_true", help="Report saja, tanpa commit ke store")
+    args = parser.parse_args()
+
+    if not args.source.exists():
+        logger.error(f"Source not found: {args.source}")
+        return 1
+    work_dir = args.work_dir or DEFAULT_WORK_DIR / args.source.resolve().name
+    summary = enroll(
+        args.source,
+        args.embeddings_dir,
+        work_dir,
+        workers=args.workers,
+        max_templates=args.max_templates,
+        min_confidence=args.min_confidence,
+        allow_multiple=args.allow_multiple,
+        skip_existing=args.skip_existing,
+        restart=args.restart,
+        dry_run=args.dry_run,
+        intra_op_threads=args.intra_op_threads
+    )
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -29,12 +29,67 @@ API_PORT = int(os.getenv("API_PORT", 8001))
 API_RELOAD = os.getenv("API_RELOAD", "True").lower() == "true"
 
 # Face Recognition Settings
-MODEL_NAME = os.getenv("MODEL_NAME", "antelopev2")
+MODEL_NAME = os.getenv("MODEL_NAME", "buffalo_l")  # Model pack yang selama ini dipakai (default FaceAnalysis)
+MODEL_ROOT = os.getenv("MODEL_ROOT", "~/.insightface")
+PIPELINE_PROFILE = os.getenv("PIPELINE_PROFILE", "recognition")  # "recognition" (detection+recognition) atau "full"
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32")  # fp32 | int8-dynamic | int8-static | fp16 (quantize_models.py)
+QUANTIZED_MODELS_DIR = os.getenv("QUANTIZED_MODELS_DIR", "") or str(MODELS_DIR / "insightface")
 DETECTION_SIZE: Tuple[int, int] = (
     int(os.getenv("DETECTION_SIZE", 640)),
     int(os.getenv("DETECTION_SIZE", 640))
 )
 SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", 0.4))
+FACE_SELECTION = os.getenv("FACE_SELECTION", "largest")  # Wajah target: "largest" atau "center"
+
+# Adaptive detection: coba resolusi kecil dulu, fallback ke DETECTION_SIZE jika tidak ada wajah / score rendah
+FAST_DETECTION_SIZE = int(os.getenv("FAST_DETECTION_SIZE", 320))  # 0 = selalu DETECTION_SIZE
+FAST_DETECTION_MIN_SCORE = float(os.getenv("FAST_DETECTION_MIN_SCORE", 0.75))
+RECOGNITION_DETECTION_MODE = os.getenv("RECOGNITION_DETECTION_MODE", "adaptive")  # /recognize, check-in
+REGISTER_DETECTION_MODE = os.getenv("REGISTER_DETECTION_MODE", "full")  # Registrasi: kualitas dulu
+GROUP_DETECTION_MODE = os.getenv("GROUP_DETECTION_MODE", "full")  # /recognize/group: wajah kecil di belakang antrian
+
+# Group recognition: semua wajah di frame yang lolos cutoff
+GROUP_MIN_CONFIDENCE = float(os.getenv("GROUP_MIN_CONFIDENCE", 0.6))
+GROUP_MIN_FACE_SIZE = int(os.getenv("GROUP_MIN_FACE_SIZE", 40))  # Sisi bbox terpendek (pixel image asli)
+GROUP_MAX_FACES = int(os.getenv("GROUP_MAX_FACES", 16))  # Wajah terbesar lebih dulu
+
+# Sesi streaming kiosk (/ws/kiosk): tracking wajah antar frame
+TRACK_DETECTION_SIZE = int(os.getenv("TRACK_DETECTION_SIZE", 224))  # Detection di crop sekitar bbox lama, 0 = off
+TRACK_MARGIN = float(os.getenv("TRACK_MARGIN", 0.5))  # Lebar crop: kelipatan sisi bbox per arah
+KIOSK_CONFIRM_FRAMES = int(os.getenv("KIOSK_CONFIRM_FRAMES", 3))  # Match sama di K frame -> event match
+KIOSK_MAX_MISSED_FRAMES = int(os.getenv("KIOSK_MAX_MISSED_FRAMES", 3))  # Frame tanpa wajah sebelum "lost"
+KIOSK_MAX_SESSIONS = int(os.getenv("KIOSK_MAX_SESSIONS", 32))
+KIOSK_IDLE_TIMEOUT = float(os.getenv("KIOSK_IDLE_TIMEOUT", 30.0))  # detik tanpa frame -> sesi ditutup
+
+# Gallery (embeddings in-memory)
+GALLERY_REFRESH_INTERVAL = float(os.getenv("GALLERY_REFRESH_INTERVAL", 2.0))  # detik antar sync dengan disk
+READ_LEGACY_PICKLES = os.getenv("READ_LEGACY_PICKLES", "True").lower() == "true"  # False setelah migrate_embeddings.py
+
+# Multi-template enrollment: beberapa foto register per karyawan, score = max antar template
+MAX_TEMPLATES_PER_EMPLOYEE = int(os.getenv("MAX_TEMPLATES_PER_EMPLOYEE", 1))  # 1 = register selalu overwrite (default), > 1 = opt-in
+TEMPLATE_SCORING = os.getenv("TEMPLATE_SCORING", "max")  # "max" atau "centroid" (centroid + re-rank max)
+TEMPLATE_REPLACE_POLICY = os.getenv("TEMPLATE_REPLACE_POLICY", "nearest")  # "nearest" atau "outlier"
+
+# Foto register: ditulis di background setelah embedding durable di store
+FACE_IMAGE_MODE = os.getenv("FACE_IMAGE_MODE", "original")  # "original" (upload apa adanya) atau "thumbnail" (crop wajah JPEG)
+FACE_THUMBNAIL_SIZE = int(os.getenv("FACE_THUMBNAIL_SIZE", 160))  # Sisi terpanjang thumbnail (px)
+FACE_THUMBNAIL_MARGIN = float(os.getenv("FACE_THUMBNAIL_MARGIN", 0.3))  # Margin crop relatif terhadap bbox
+FACE_THUMBNAIL_QUALITY = int(os.getenv("FACE_THUMBNAIL_QUALITY", 90))  # JPEG quality thumbnail
+FACE_IMAGE_QUEUE = int(os.getenv("FACE_IMAGE_QUEUE", 256))  # Maks foto menunggu ditulis (penuh = register menunggu)
+
+# Result cache per hash upload (retry / upload identik tidak di-inference ulang)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 1024))  # 0 = off
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 60.0))  # detik
+
+# Matching index: "exact" (brute-force) atau "ivf" (ANN, untuk gallery sangat besar)
+MATCH_INDEX = os.getenv("MATCH_INDEX", "exact")
+IVF_NLIST = int(os.getenv("IVF_NLIST", 0))  # 0 = otomatis sqrt(N)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 8))
+ANN_MIN_SIZE = int(os.getenv("ANN_MIN_SIZE", 5000))  # di bawah ini tetap exact search
+
+# Multi-process: "shared" = satu gallery memory-mapped untuk semua uvicorn workers / process
+GALLERY_BACKEND = os.getenv("GALLERY_BACKEND", "local")  # "local" atau "shared"
+SHARED_GALLERY_DIR = os.getenv("SHARED_GALLERY_DIR", "") or None  # default /dev/shm/mealscan
 
 # Database Configuration (Laravel)
 LARAVEL_API_URL = os.getenv("LARAVEL_API_URL", "http://localhost:8000")
@@ -45,7 +100,11 @@ API_KEY = os.getenv("API_KEY", "")
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
 # Performance
-MAX_WORKERS = int(os.getenv("MAX_WORKERS", 4))
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", 4))  # Job inference / decode / disk write yang jalan bersamaan
+INFERENCE_QUEUE_LIMIT = int(os.getenv("INFERENCE_QUEUE_LIMIT", 0))  # Maks job menunggu, 0 = tanpa batas (503 jika penuh)
+RECOGNITION_BATCH_SIZE = int(os.getenv("RECOGNITION_BATCH_SIZE", 1))  # Micro-batching ArcFace, 1 = off
+RECOGNITION_BATCH_WAIT_MS = float(os.getenv("RECOGNITION_BATCH_WAIT_MS", 2.0))  # Maks delay tambahan per face
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", 0))  # Pool process inference, 0 = di process API
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", 30))
 
 # Logging
@@ -55,13 +114,31 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 MIN_IMAGE_SIZE = (50, 50)  # Minimum width, height
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", 40_000_000))  # Dicek dari header sebelum decode
+MAX_REQUEST_SIZE = int(os.getenv("MAX_REQUEST_SIZE", MAX_FILE_SIZE + 64 * 1024))  # Content-Length (file + multipart)
+REDUCED_DECODE = os.getenv("REDUCED_DECODE", "True").lower() == "true"  # JPEG besar di-decode di 1/2 .. 1/8 resolusi
+MAX_CHIPS_PER_REQUEST = int(os.getenv("MAX_CHIPS_PER_REQUEST", 32))  # /recognize/chips
+MAX_EMBEDDINGS_PER_REQUEST = int(os.getenv("MAX_EMBEDDINGS_PER_REQUEST", 256))  # /recognize/embedding
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", 16))  # /api/face/register/batch, /recognize/batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 32 * 1024 * 1024))  # Total byte semua file dalam satu batch
+MAX_BATCH_REQUEST_SIZE = int(os.getenv("MAX_BATCH_REQUEST_SIZE", MAX_BATCH_SIZE + 256 * 1024))  # Content-Length batch
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 512))  # Dim embedding jika gallery masih kosong (ArcFace: 512)
 
 # Face Recognition Settings
 MIN_FACE_CONFIDENCE = 0.5  # Minimum confidence untuk face detection
 MAX_FACES_PER_IMAGE = 1  # Untuk registration, hanya 1 face
 
 # Model Settings
-MODEL_PROVIDERS = ["CPUExecutionProvider"]  # Change to ["CUDAExecutionProvider"] for GPU
+MODEL_PROVIDERS = os.getenv("MODEL_PROVIDERS", "CPUExecutionProvider").split(",")  # "CUDAExecutionProvider" for GPU
+
+# ONNX Runtime (lihat benchmarks/bench_sessions.py untuk mencari kombinasi terbaik)
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", 0))  # Thread per session, 0 = default ORT (semua core)
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", 0))  # > 1 = parallel execution mode
+ORT_GRAPH_OPTIMIZATION = os.getenv("ORT_GRAPH_OPTIMIZATION", "all")  # disable | basic | extended | all
+ORT_SESSION_POOL_SIZE = int(os.getenv("ORT_SESSION_POOL_SIZE", 1))  # Session independen per model
+ORT_GRAPH_CACHE = os.getenv("ORT_GRAPH_CACHE", "True").lower() == "true"  # Simpan graph teroptimasi, reuse saat start
+ORT_GRAPH_CACHE_DIR = os.getenv("ORT_GRAPH_CACHE_DIR", "") or str(MODELS_DIR / "ort_cache")
+WARMUP_ITERATIONS = int(os.getenv("WARMUP_ITERATIONS", 2))  # Inference dummy sebelum /ready, 0 = tanpa warm-up
 
 # Redis Cache (optional, untuk future improvement)
 REDIS_ENABLED = os.getenv("REDIS_ENABLED", "False").lower() == "true"
@@ -90,9 +167,55 @@ class Config:
     
     # Face Recognition
     MODEL_NAME = MODEL_NAME
+    MODEL_ROOT = MODEL_ROOT
+    PIPELINE_PROFILE = PIPELINE_PROFILE
+    MODEL_PRECISION = MODEL_PRECISION
+    QUANTIZED_MODELS_DIR = QUANTIZED_MODELS_DIR
     DETECTION_SIZE = DETECTION_SIZE
     SIMILARITY_THRESHOLD = SIMILARITY_THRESHOLD
+    FACE_SELECTION = FACE_SELECTION
+    FAST_DETECTION_SIZE = FAST_DETECTION_SIZE
+    FAST_DETECTION_MIN_SCORE = FAST_DETECTION_MIN_SCORE
+    RECOGNITION_DETECTION_MODE = RECOGNITION_DETECTION_MODE
+    REGISTER_DETECTION_MODE = REGISTER_DETECTION_MODE
+    GROUP_DETECTION_MODE = GROUP_DETECTION_MODE
+    GROUP_MIN_CONFIDENCE = GROUP_MIN_CONFIDENCE
+    GROUP_MIN_FACE_SIZE = GROUP_MIN_FACE_SIZE
+    GROUP_MAX_FACES = GROUP_MAX_FACES
+    TRACK_DETECTION_SIZE = TRACK_DETECTION_SIZE
+    TRACK_MARGIN = TRACK_MARGIN
+    KIOSK_CONFIRM_FRAMES = KIOSK_CONFIRM_FRAMES
+    KIOSK_MAX_MISSED_FRAMES = KIOSK_MAX_MISSED_FRAMES
+    KIOSK_MAX_SESSIONS = KIOSK_MAX_SESSIONS
+    KIOSK_IDLE_TIMEOUT = KIOSK_IDLE_TIMEOUT
     MODEL_PROVIDERS = MODEL_PROVIDERS
+    ORT_INTRA_OP_THREADS = ORT_INTRA_OP_THREADS
+    ORT_INTER_OP_THREADS = ORT_INTER_OP_THREADS
+    ORT_GRAPH_OPTIMIZATION = ORT_GRAPH_OPTIMIZATION
+    ORT_SESSION_POOL_SIZE = ORT_SESSION_POOL_SIZE
+    ORT_GRAPH_CACHE = ORT_GRAPH_CACHE
+    ORT_GRAPH_CACHE_DIR = ORT_GRAPH_CACHE_DIR
+    WARMUP_ITERATIONS = WARMUP_ITERATIONS
+    
+    # Gallery
+    GALLERY_REFRESH_INTERVAL = GALLERY_REFRESH_INTERVAL
+    READ_LEGACY_PICKLES = READ_LEGACY_PICKLES
+    MAX_TEMPLATES_PER_EMPLOYEE = MAX_TEMPLATES_PER_EMPLOYEE
+    TEMPLATE_SCORING = TEMPLATE_SCORING
+    TEMPLATE_REPLACE_POLICY = TEMPLATE_REPLACE_POLICY
+    FACE_IMAGE_MODE = FACE_IMAGE_MODE
+    FACE_THUMBNAIL_SIZE = FACE_THUMBNAIL_SIZE
+    FACE_THUMBNAIL_MARGIN = FACE_THUMBNAIL_MARGIN
+    FACE_THUMBNAIL_QUALITY = FACE_THUMBNAIL_QUALITY
+    FACE_IMAGE_QUEUE = FACE_IMAGE_QUEUE
+    RESULT_CACHE_SIZE = RESULT_CACHE_SIZE
+    RESULT_CACHE_TTL = RESULT_CACHE_TTL
+    MATCH_INDEX = MATCH_INDEX
+    IVF_NLIST = IVF_NLIST
+    IVF_NPROBE = IVF_NPROBE
+    ANN_MIN_SIZE = ANN_MIN_SIZE
+    GALLERY_BACKEND = GALLERY_BACKEND
+    SHARED_GALLERY_DIR = SHARED_GALLERY_DIR
     
     # Laravel
     LARAVEL_API_URL = LARAVEL_API_URL
@@ -104,6 +227,10 @@ class Config:
     
     # Performance
     MAX_WORKERS = MAX_WORKERS
+    INFERENCE_QUEUE_LIMIT = INFERENCE_QUEUE_LIMIT
+    RECOGNITION_BATCH_SIZE = RECOGNITION_BATCH_SIZE
+    RECOGNITION_BATCH_WAIT_MS = RECOGNITION_BATCH_WAIT_MS
+    INFERENCE_PROCESSES = INFERENCE_PROCESSES
     REQUEST_TIMEOUT = REQUEST_TIMEOUT
     
     # Logging
@@ -113,6 +240,15 @@ class Config:
     MAX_FILE_SIZE = MAX_FILE_SIZE
     ALLOWED_EXTENSIONS = ALLOWED_EXTENSIONS
     MIN_IMAGE_SIZE = MIN_IMAGE_SIZE
+    MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    MAX_REQUEST_SIZE = MAX_REQUEST_SIZE
+    REDUCED_DECODE = REDUCED_DECODE
+    MAX_CHIPS_PER_REQUEST = MAX_CHIPS_PER_REQUEST
+    MAX_EMBEDDINGS_PER_REQUEST = MAX_EMBEDDINGS_PER_REQUEST
+    MAX_BATCH_ITEMS = MAX_BATCH_ITEMS
+    MAX_BATCH_SIZE = MAX_BATCH_SIZE
+    MAX_BATCH_REQUEST_SIZE = MAX_BATCH_REQUEST_SIZE
+    EMBEDDING_DIM = EMBEDDING_DIM
     
     # Face Recognition
     MIN_FACE_CONFIDENCE = MIN_FACE_CONFIDENCE
@@ -0,0 +1,450 @@
+"""
+Embedding Store
+Penyimpanan embeddings columnar dalam satu directory (pengganti satu .pkl per karyawan)
+
+Layout (di dalam embeddings_dir):
+    store.json              manifest - commit point, ditulis atomic (tmp + rename)
+    embeddings.<gen>.f32    matrix float32 raw (rows x dim), append-only, bisa di-memmap
+    ids.<gen>.txt           employee_id per row (satu per baris), append-only
+    tombstones.<gen>.i64    index row yang sudah dihapus / diganti (int64), append-only
+
+Data di luar ukuran yang tercatat di manifest (sisa write yang crash) diabaikan
+oleh reader dan di-truncate oleh writer berikutnya. Tidak ada pickle, jadi load
+tidak bisa mengeksekusi code dari file.
+
+Compaction menulis generation baru lalu meng-unlink file generation lama.
+Reader yang membaca manifest lama sebelum unlink (sync tanpa lock antar
+process) akan mendapat FileNotFoundError, lalu membaca ulang manifest dan
+me-reload penuh dari generation baru.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya lock antar thread
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "store.json"
+LOCK_NAME = "store.lock"
+
+# Percobaan sync jika file generation hilang karena compaction di process lain
+SYNC_ATTEMPTS = 3
+
+
+def _fsync_dir(path: Path):
+    if os.name != "posix":
+        return
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Tulis file secara atomic: tulis ke temp file, fsync, lalu rename"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+
+
+class EmbeddingStore:
+    """
+    Columnar embedding store dengan append-on-register dan tombstones
+
+    Satu instance menyimpan view in-memory (live map employee_id -> row) yang
+    di-update incremental lewat sync(), jadi perubahan dari process lain
+    cukup dibaca dari offset terakhir.
+    """
+
+    # Compact otomatis jika row mati > setengah total row
+    COMPACT_MIN_ROWS = 64
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: Directory embeddings
+        """
+        self.root = Path(root)
+        self.manifest_path = self.root / MANIFEST_NAME
+        self._lock = threading.RLock()
+        self._reset_view()
+
+    def _reset_view(self):
+        self.manifest: Optional[Dict] = None
+        self.ids: List[str] = []             # employee_id untuk setiap row (termasuk row mati)
+        self.live: Dict[str, int] = {}       # employee_id -> row aktif
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self._tombstone_count = 0
+        self._manifest_stat: Optional[Tuple[int, int, int]] = None
+        self._pending_changes: Optional[Set[str]] = None  # None = reset (reload penuh)
+
+    # ============================
+    # Paths
+    # ============================
+    def _data_path(self, generation: int) -> Path:
+        return self.root / f"embeddings.{generation}.f32"
+
+    def _ids_path(self, generation: int) -> Path:
+        return self.root / f"ids.{generation}.txt"
+
+    def _tombstones_path(self, generation: int) -> Path:
+        return self.root / f"tombstones.{generation}.i64"
+
+    @property
+    def version(self) -> int:
+        return self.manifest["version"] if self.manifest else 0
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.manifest["dim"] if self.manifest else None
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    def __len__(self) -> int:
+        return len(self.live)
+
+    def __contains__(self, employee_id: str) -> bool:
+        return employee_id in self.live
+
+    # ============================
+    # Read
+    # ============================
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self.manifest_path, "rb") as f:
+                manifest = json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported embedding store format: {manifest.get('format')}")
+        return manifest
+
+    def sync(self, force: bool = False) -> Optional[Set[str]]:
+        """
+        Baca perubahan dari disk sejak sync terakhir
+
+        Args:
+            force: Selalu baca manifest (tanpa shortcut stat file)
+
+        Returns:
+            Set employee_id yang berubah (ditambah, diganti, atau dihapus),
+            atau None jika view di-reload penuh (misal setelah compaction)
+        """
+        changes = self._sync(force)
+        with self._lock:
+            if changes is None:
+                self._pending_changes = None
+            elif self._pending_changes is not None:
+                self._pending_changes |= changes
+        return changes
+
+    def drain_changes(self) -> Optional[Set[str]]:
+        """
+        Ambil (dan reset) akumulasi perubahan dari semua sync() sejak drain terakhir,
+        termasuk sync internal saat write
+
+        Returns:
+            Set employee_id yang berubah, atau None jika perlu reload penuh
+        """
+        with self._lock:
+            changes = self._pending_changes
+            self._pending_changes = set()
+            return changes
+
+    def _sync(self, force: bool) -> Optional[Set[str]]:
+        with self._lock:
+            for attempt in range(SYNC_ATTEMPTS):
+                try:
+                    return self._sync_once(force)
+                except FileNotFoundError:
+                    # Manifest dibaca tanpa lock, lalu compaction process lain meng-unlink
+                    # file generation tersebut: baca ulang manifest dan reload penuh
+                    if attempt == SYNC_ATTEMPTS - 1:
+                        raise
+                    logger.warning("✗ Embedding store generation removed during sync, reloading")
+                    self._reset_view()
+                    force = True
+
+    def _sync_once(self, force: bool) -> Optional[Set[str]]:
+        try:
+            stat = os.stat(self.manifest_path)
+            manifest_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            manifest_stat = None
+        if not force and manifest_stat is not None and manifest_stat == self._manifest_stat:
+            return set()
+
+        manifest = self._read_manifest()
+        current = self.manifest
+        self._manifest_stat = manifest_stat
+
+        if manifest is None:
+            if current is None:
+                return set()
+            self._reset_view()
+            return None
+        if current is not None and manifest["version"] == current["version"]:
+            return set()
+        if (current is None
+                or manifest["generation"] != current["generation"]
+                or manifest["rows"] < current["rows"]):
+            self._load_full(manifest)
+            return None
+        return self._apply_increment(current, manifest)
+
+    def _load_full(self, manifest: Dict):
+        generation = manifest["generation"]
+        self.ids = []
+        self.live = {}
+        self._tombstone_count = 0
+        self.manifest = dict(manifest, rows=0, ids_bytes=0, tombstones=0)
+        self._apply_increment(self.manifest, manifest)
+        logger.info(f"✓ Embedding store loaded (gen {generation}): {len(self.live)} embeddings")
+
+    def _apply_increment(self, current: Dict, manifest: Dict) -> Set[str]:
+        generation = manifest["generation"]
+        changed: Set[str] = set()
+
+        # Row baru
+        if manifest["ids_bytes"] > current["ids_bytes"]:
+            with open(self._ids_path(generation), "rb") as f:
+                f.seek(current["ids_bytes"])
+                chunk = f.read(manifest["ids_bytes"] - current["ids_bytes"])
+            new_ids = chunk.decode("utf-8").split("\n")[:-1]
+            if len(self.ids) + len(new_ids) != manifest["rows"]:
+                raise ValueError("Embedding store corrupted: ids file does not match manifest rows")
+            for offset, employee_id in enumerate(new_ids):
+                self.live[employee_id] = len(self.ids) + offset
+                changed.add(employee_id)
+            self.ids.extend(new_ids)
+
+        # Tombstones baru
+        if manifest["tombstones"] > self._tombstone_count:
+            rows = np.fromfile(
+                self._tombstones_path(generation),
+                dtype="<i8",
+                count=manifest["tombstones"] - self._tombstone_count,
+                offset=self._tombstone_count * 8
+            )
+            for row in rows.tolist():
+                employee_id = self.ids[row]
+                if self.live.get(employee_id) == row:
+                    del self.live[employee_id]
+                    changed.add(employee_id)
+            self._tombstone_count = manifest["tombstones"]
+
+        if manifest["rows"] > 0:
+            self.matrix = np.memmap(
+                self._data_path(generation), dtype="<f4", mode="r",
+                shape=(manifest["rows"], manifest["dim"])
+            )
+        else:
+            self.matrix = np.zeros((0, manifest["dim"]), dtype=np.float32)
+        self.manifest = manifest
+        return changed
+
+    def get(self, employee_id: str) -> Optional[np.ndarray]:
+        """Ambil embedding aktif untuk employee_id (copy, float32)"""
+        with self._lock:
+            row = self.live.get(employee_id)
+            if row is None:
+                return None
+            return np.array(self.matrix[row], dtype=np.float32)
+
+    def live_items(self) -> Tuple[List[str], np.ndarray]:
+        """
+        Semua embedding aktif
+
+        Returns:
+            Tuple (ids, matrix) - matrix float32 (N, D) hasil satu fancy-index dari memmap
+        """
+        with self._lock:
+            if not self.live:
+                return [], np.zeros((0, self.dim or 0), dtype=np.float32)
+            ids = list(self.live.keys())
+            rows = np.fromiter(self.live.values(), dtype=np.int64, count=len(ids))
+            return ids, np.asarray(self.matrix[rows], dtype=np.float32)
+
+    # ============================
+    # Write
+    # ============================
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / LOCK_NAME, "a+b") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    self.sync(force=True)
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _commit(self, manifest: Dict):
+        manifest = dict(manifest, version=self.version + 1)
+        atomic_write_bytes(self.manifest_path, json.dumps(manifest, indent=1).encode("utf-8"))
+
+    @staticmethod
+    def _append(path: Path, committed_size: int, data: bytes):
+        """Append data setelah truncate sisa write yang tidak pernah di-commit"""
+        with open(path, "ab") as f:
+            f.truncate(committed_size)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def put(self, employee_id: str, embedding: np.ndarray):
+        """Tambah / replace embedding untuk satu employee_id (satu commit)"""
+        self.put_many([(employee_id, embedding)])
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]], delete: Iterable[str] = ()):
+        """
+        Tambah / replace banyak embeddings dalam satu commit atomic
+
+        Args:
+            items: Iterable (employee_id, embedding)
+            delete: employee_id yang dihapus di commit yang sama (misal template lama
+                yang tidak ditulis ulang oleh bulk enrollment)
+        """
+        items = [(str(employee_id), np.asarray(embedding, dtype="<f4").reshape(-1))
+                 for employee_id, embedding in items]
+        delete = set(map(str, delete)).difference(employee_id for employee_id, _ in items)
+        if not items and not delete:
+            return
+        for employee_id, _ in items:
+            if not employee_id or "\n" in employee_id or "\r" in employee_id:
+                raise ValueError(f"Invalid employee_id: {employee_id!r}")
+
+        with self._write_lock():
+            manifest = self.manifest
+            if manifest is None:
+                if not items:
+                    return
+                manifest = {
+                    "format": FORMAT_VERSION,
+                    "generation": 0,
+                    "dim": int(items[0][1].shape[0]),
+                    "rows": 0,
+                    "ids_bytes": 0,
+                    "tombstones": 0,
+                    "version": 0,
+                }
+            dim = manifest["dim"]
+            for employee_id, embedding in items:
+                if embedding.shape[0] != dim:
+                    raise ValueError(f"Embedding dim {embedding.shape[0]} != store dim {dim}")
+
+            # Row lama (dan duplikat di dalam batch) jadi tombstone
+            tombstones = []
+            pending: Dict[str, int] = {}
+            for offset, (employee_id, _) in enumerate(items):
+                old_row = pending.get(employee_id, self.live.get(employee_id))
+                if old_row is not None:
+                    tombstones.append(old_row)
+                pending[employee_id] = manifest["rows"] + offset
+            deleted = [self.live[employee_id] for employee_id in sorted(delete) if employee_id in self.live]
+            tombstones.extend(deleted)
+            if not items and not deleted:
+                return
+
+            generation = manifest["generation"]
+            ids_data = "".join(f"{employee_id}\n" for employee_id, _ in items).encode("utf-8")
+            data = np.stack([embedding for _, embedding in items]).tobytes() if items else b""
+            self._append(self._data_path(generation), manifest["rows"] * dim * 4, data)
+            self._append(self._ids_path(generation), manifest["ids_bytes"], ids_data)
+            self._append(self._tombstones_path(generation), manifest["tombstones"] * 8,
+                         np.asarray(tombstones, dtype="<i8").tobytes())
+
+            self._commit(dict(
+                manifest,
+                rows=manifest["rows"] + len(items),
+                ids_bytes=manifest["ids_bytes"] + len(ids_data),
+                tombstones=manifest["tombstones"] + len(tombstones)
+            ))
+            self.sync(force=True)
+        logger.info(f"✓ Embedding store: {len(items)} embeddings committed"
+                    + (f", {len(deleted)} deleted" if deleted else ""))
+        self._maybe_compact()
+
+    def delete(self, employee_id: str) -> bool:
+        """
+        Hapus embedding (tombstone)
+
+        Returns:
+            True jika employee_id ada di store
+        """
+        with self._write_lock():
+            row = self.live.get(employee_id)
+            if row is None:
+                return False
+            manifest = self.manifest
+            self._append(self._tombstones_path(manifest["generation"]), manifest["tombstones"] * 8,
+                         np.asarray([row], dtype="<i8").tobytes())
+            self._commit(dict(manifest, tombstones=manifest["tombstones"] + 1))
+            self.sync(force=True)
+        logger.info(f"✓ Embedding store: {employee_id} deleted")
+        self._maybe_compact()
+        return True
+
+    def _maybe_compact(self):
+        manifest = self.manifest
+        if manifest is None or manifest["rows"] < self.COMPACT_MIN_ROWS:
+            return
+        if manifest["rows"] - len(self.live) > manifest["rows"] // 2:
+            self.compact()
+
+    def compact(self):
+        """Tulis ulang hanya row aktif ke generation baru, lalu hapus file lama"""
+        with self._write_lock():
+            manifest = self.manifest
+            if manifest is None:
+                return
+            old_generation = manifest["generation"]
+            generation = old_generation + 1
+            ids, matrix = self.live_items()
+            ids_data = "".join(f"{employee_id}\n" for employee_id in ids).encode("utf-8")
+
+            for path, data in ((self._data_path(generation), np.ascontiguousarray(matrix, dtype="<f4").tobytes()),
+                               (self._ids_path(generation), ids_data),
+                               (self._tombstones_path(generation), b"")):
+                with open(path, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            self._commit(dict(
+                manifest,
+                generation=generation,
+                rows=len(ids),
+                ids_bytes=len(ids_data),
+                tombstones=0
+            ))
+            self.sync(force=True)
+
+            for path in (self._data_path(old_generation), self._ids_path(old_generation),
+                         self._tombstones_path(old_generation)):
+                try:
+                    path.unlink()
+                except OSError:
+                    # File masih di-map process lain (Windows) - dibersihkan di compaction berikutnya
+                    pass
+        logger.info(f"✓ Embedding store compacted: {len(ids)} embeddings (gen {generation})")
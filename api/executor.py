@@ -0,0 +1,112 @@
+"""
+Inference Executor
+Thread pool khusus untuk kerja blocking (decode, detection / embedding, disk write)
+supaya event loop FastAPI tetap bebas menerima upload dan request lain.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ExecutorOverloaded(Exception):
+    """Antrian executor penuh (backpressure)"""
+
+
+class InferenceExecutor:
+    """
+    Bounded executor untuk inference
+
+    Concurrency dibatasi max_workers (ONNX Runtime dan OpenCV melepas GIL, jadi
+    thread cukup). Job yang menunggu worker dihitung sebagai queue depth; jika
+    max_queue > 0 dan antrian penuh, job baru ditolak dengan ExecutorOverloaded.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 0, name: str = "inference"):
+        """
+        Args:
+            max_workers: Jumlah job yang boleh jalan bersamaan
+            max_queue: Maksimum job yang menunggu (0 = tanpa batas)
+            name: Prefix nama thread
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._max_queued = 0
+        self._started = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return self._running
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Jalankan fn(*args, **kwargs) di worker thread dan tunggu hasilnya
+
+        Raises:
+            ExecutorOverloaded: Jika antrian sudah mencapai max_queue
+        """
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorOverloaded(f"Inference queue full ({self._queued} waiting)")
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+
+        submitted = time.perf_counter()
+        future = self._pool.submit(partial(self._execute, fn, submitted, *args, **kwargs))
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        # Job yang di-cancel sebelum sempat jalan (client disconnect) tidak pernah masuk _execute
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def _execute(self, fn: Callable[..., T], submitted: float, *args, **kwargs) -> T:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._started += 1
+            self._total_wait += time.perf_counter() - submitted
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+
+    def stats(self) -> Dict:
+        """Snapshot statistik executor"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queued,
+                "in_flight": self._running,
+                "max_queue_depth": self._max_queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_queue_wait_ms": (self._total_wait / self._started * 1000) if self._started else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
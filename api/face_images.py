@@ -0,0 +1,179 @@
+"""
+Face Image Writer
+Foto register ditulis oleh background thread, di luar jalur request. Embedding
+sudah durable di embedding store (append + fsync, manifest tmp + rename) sebelum
+response dikirim; foto hanya artefak (audit / re-enrollment), jadi cukup menyusul.
+
+Setiap file ditulis atomic (temp file + rename), crash di tengah write tidak
+meninggalkan foto setengah jadi. Mode "thumbnail" menyimpan crop wajah (bbox +
+margin) yang di-resize dan di-encode ulang sebagai JPEG, bukan frame penuh.
+"""
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import logging
+
+import cv2
+import numpy as np
+
+from embedding_store import atomic_write_bytes
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+FACE_IMAGE_MODES = ("original", "thumbnail")
+
+_STOP = object()
+
+
+def face_thumbnail(content: bytes, bbox: List[float], size: int = 160,
+                   margin: float = 0.3, quality: int = 90) -> bytes:
+    """
+    Crop wajah dari upload asli lalu encode ulang sebagai JPEG
+
+    Args:
+        content: Bytes upload asli (JPEG / PNG)
+        bbox: [x1, y1, x2, y2] di koordinat image asli
+        size: Sisi terpanjang thumbnail (px), crop lebih kecil tidak di-upscale
+        margin: Margin di sekitar bbox, relatif terhadap sisi terpanjang bbox
+        quality: JPEG quality
+
+    Returns:
+        Bytes JPEG thumbnail
+    """
+    image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Image tidak bisa di-decode")
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = bbox
+    pad = margin * max(x2 - x1, y2 - y1)
+    left, top = max(int(x1 - pad), 0), max(int(y1 - pad), 0)
+    right, bottom = min(int(np.ceil(x2 + pad)), width), min(int(np.ceil(y2 + pad)), height)
+    crop = image[top:bottom, left:right] if right > left and bottom > top else image
+
+    scale = size / max(crop.shape[:2])
+    if scale < 1.0:
+        crop = cv2.resize(crop, (max(int(crop.shape[1] * scale), 1), max(int(crop.shape[0] * scale), 1)),
+                          interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Encode thumbnail gagal")
+    return encoded.tobytes()
+
+
+class FaceImageWriter:
+    """
+    Antrian write foto register dengan satu background thread
+
+    submit() hanya memasukkan job ke antrian (block jika antrian penuh, sebagai
+    backpressure ke executor). close() menunggu antrian habis ditulis.
+    """
+
+    def __init__(self,
+                 mode: str = "original",
+                 thumbnail_size: int = 160,
+                 thumbnail_margin: float = 0.3,
+                 jpeg_quality: int = 90,
+                 max_queue: int = 256,
+                 name: str = "face-images"):
+        """
+        Args:
+            mode: "original" = bytes upload apa adanya, "thumbnail" = crop wajah JPEG
+            thumbnail_size: Sisi terpanjang thumbnail (px)
+            thumbnail_margin: Margin crop relatif terhadap bbox
+            jpeg_quality: JPEG quality thumbnail
+            max_queue: Maksimum foto yang menunggu ditulis
+            name: Nama thread (untuk log)
+        """
+        if mode not in FACE_IMAGE_MODES:
+            raise ValueError(f"Unknown face image mode: {mode}")
+        self.mode = mode
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_margin = thumbnail_margin
+        self.jpeg_quality = jpeg_quality
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(max_queue, 1))
+        self._lock = threading.Lock()
+        self._written = 0
+        self._failed = 0
+        self._bytes = 0
+
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def path_for(self, path: Path) -> Path:
+        """Path final foto (thumbnail selalu .jpg)"""
+        return path.with_suffix(".jpg") if self.mode == "thumbnail" else path
+
+    def submit(self, path: Path, content: bytes, bbox: Optional[List[float]] = None) -> Path:
+        """
+        Jadwalkan write foto register
+
+        Args:
+            path: Path tujuan (extension sesuai format upload)
+            content: Bytes upload asli
+            bbox: Bbox wajah di koordinat asli (wajib untuk mode thumbnail)
+
+        Returns:
+            Path final foto (file muncul setelah write selesai)
+        """
+        path = self.path_for(path)
+        self._queue.put((path, content, bbox))
+        return path
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                self._write(*job)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, path: Path, content: bytes, bbox: Optional[List[float]]):
+        started = time.perf_counter()
+        try:
+            if self.mode == "thumbnail" and bbox is not None:
+                data = face_thumbnail(content, bbox, self.thumbnail_size, self.thumbnail_margin, self.jpeg_quality)
+            else:
+                data = content
+            atomic_write_bytes(path, data)
+        except Exception as e:
+            logger.error(f"✗ Failed to write face image {path.name}: {e}")
+            with self._lock:
+                self._failed += 1
+            return
+        STAGE_SECONDS.observe(time.perf_counter() - started, "face_image")
+        with self._lock:
+            self._written += 1
+            self._bytes += len(data)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self):
+        """Block sampai semua foto yang sudah di-submit selesai ditulis"""
+        self._queue.join()
+
+    def stats(self) -> Dict:
+        """Snapshot statistik writer"""
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "queue_depth": self._queue.qsize(),
+                "written": self._written,
+                "failed": self._failed,
+                "bytes_written": self._bytes,
+            }
+
+    def close(self, timeout: float = 30.0):
+        """Tulis sisa antrian lalu hentikan thread"""
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.warning(f"✗ {self.name}: {self._queue.qsize()} face images not written before shutdown")
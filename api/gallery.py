@@ -0,0 +1,439 @@
+"""
+Embedding Gallery
+In-memory gallery untuk face matching: satu matrix float32 contiguous
+berisi embeddings yang sudah L2-normalized, plus array employee_id.
+Sumber data: EmbeddingStore, plus file .pkl legacy selama masa transisi.
+Satu row = satu template (lihat templates.py); karyawan dengan beberapa
+template punya beberapa row dengan key "<employee_id>#<slot>".
+"""
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple, TypeVar
+import logging
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from templates import (
+    TemplateIndex, centroid_norms_from_codes, index_from_codes, plan_template, template_owner, template_slot
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def normalize_embedding(embedding: np.ndarray) -> np.ndarray:
+    """L2-normalize embedding (hasil float32, 1-D)"""
+    vec = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec = vec / norm
+    return vec
+
+
+class EmbeddingGallery:
+    """
+    Gallery embeddings yang resident di memory
+
+    Di-load sekali saat startup, lalu di-update in place saat register.
+    Perubahan dari process lain diambil lewat refresh() yang di-throttle
+    dengan refresh_interval.
+    """
+
+    _INITIAL_CAPACITY = 64
+
+    def __init__(self,
+                 embeddings_dir: str,
+                 refresh_interval: float = 2.0,
+                 read_legacy_pickles: bool = True):
+        """
+        Initialize gallery
+
+        Args:
+            embeddings_dir: Path ke directory embeddings
+            refresh_interval: Jarak minimum (detik) antar sync dengan disk, 0 = selalu sync
+            read_legacy_pickles: Ikut baca file {employee_id}.pkl lama yang belum dimigrasi
+        """
+        self.embeddings_dir = Path(embeddings_dir)
+        self.refresh_interval = refresh_interval
+        self.read_legacy_pickles = read_legacy_pickles
+        self.store = EmbeddingStore(embeddings_dir)
+        self.dim: Optional[int] = None
+        self.version = 0
+
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._ids = np.empty(0, dtype=object)
+        self._size = 0
+        self._index: Dict[str, int] = {}
+        self._legacy_stats: Dict[str, Tuple[int, int]] = {}
+        self._last_refresh = 0.0
+        self._listeners: List[Callable] = []
+        self._templates: Optional[Tuple[int, TemplateIndex]] = None
+        # Owner template di-maintain incremental (tanpa scan seluruh gallery per register / match)
+        self._codes = np.zeros(0, dtype=np.int64)      # Code owner per row (sejajar _ids)
+        self._owner_code: Dict[str, int] = {}          # employee_id -> code
+        self._owner_names: List[str] = []              # code -> employee_id
+        self._owner_keys: Dict[str, Set[str]] = {}     # employee_id -> key template yang ada
+        self._owner_norms: List[float] = []            # code -> norm jumlah template (centroid)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, employee_id: str) -> bool:
+        return employee_id in self._index
+
+    # ============================
+    # Read access
+    # ============================
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ambil view konsisten dari gallery
+
+        Returns:
+            Tuple (ids, matrix) - ids shape (N,), matrix shape (N, D) float32
+        """
+        with self._lock:
+            n = self._size
+            return self._ids[:n], self._matrix[:n]
+
+    def read(self, fn: Callable[[np.ndarray, np.ndarray], T]) -> T:
+        """Jalankan fn(ids, matrix) terhadap snapshot (interface sama dengan SharedGallery)"""
+        ids, matrix = self.snapshot()
+        return fn(ids, matrix)
+
+    def read_templates(self, fn: Callable[[np.ndarray, np.ndarray, TemplateIndex], T]) -> T:
+        """Jalankan fn(ids, matrix, template_index) - index row -> owner di-cache per version"""
+        with self._lock:
+            n = self._size
+            ids, matrix = self._ids[:n], self._matrix[:n]
+            cached = self._templates
+            if cached is None or cached[0] != self.version:
+                owner_ids = np.array(self._owner_names, dtype=object)
+                cached = self._templates = (self.version, index_from_codes(
+                    self._codes[:n], owner_ids, matrix, np.array(self._owner_norms, dtype=np.float32)))
+        return fn(ids, matrix, cached[1])
+
+    def templates(self, employee_id: str) -> Dict[str, np.ndarray]:
+        """Semua template (key -> embedding normalized) milik employee_id, urut slot"""
+        with self._lock:
+            keys = sorted(self._owner_keys.get(employee_id, ()), key=template_slot)
+            return {key: self._matrix[self._index[key]].copy() for key in keys}
+
+    def _add_owner(self, key: str) -> int:
+        """Catat key template di map owner, return code owner"""
+        owner = template_owner(key)
+        code = self._owner_code.get(owner)
+        if code is None:
+            code = self._owner_code[owner] = len(self._owner_names)
+            self._owner_names.append(owner)
+            self._owner_norms.append(0.0)
+        self._owner_keys.setdefault(owner, set()).add(key)
+        return code
+
+    def _remove_owner(self, key: str):
+        owner = template_owner(key)
+        keys = self._owner_keys.get(owner)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._owner_keys[owner]
+        self._update_owner_norm(owner)
+
+    def _update_owner_norm(self, owner: str):
+        """Hitung ulang norm centroid satu owner dari template-nya (maks max_templates row)"""
+        rows = [self._index[key] for key in self._owner_keys.get(owner, ())]
+        norm = float(np.linalg.norm(self._matrix[rows].sum(axis=0))) if rows else 0.0
+        self._owner_norms[self._owner_code[owner]] = norm
+
+    def get(self, employee_id: str) -> Optional[np.ndarray]:
+        """Ambil embedding (normalized) untuk employee_id / key template"""
+        with self._lock:
+            row = self._index.get(employee_id)
+            if row is None:
+                return None
+            return self._matrix[row].copy()
+
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        """Gallery sebagai Dict {employee_id: embedding}"""
+        ids, matrix = self.snapshot()
+        return {str(employee_id): matrix[i] for i, employee_id in enumerate(ids)}
+
+    # ============================
+    # Mutations
+    # ============================
+    def add_listener(self, callback: Callable):
+        """
+        Daftarkan callback perubahan gallery (misal ANN index)
+
+        Dipanggil sebagai callback(event, employee_id, embedding) dengan event
+        'upsert' (embedding normalized), 'remove', atau 'reset' (gallery di-load ulang).
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, event: str, employee_id: Optional[str] = None, embedding: Optional[np.ndarray] = None):
+        for callback in self._listeners:
+            callback(event, employee_id, embedding)
+
+    def upsert(self, employee_id: str, embedding: np.ndarray):
+        """Tambah atau replace embedding untuk employee_id (in place)"""
+        vec = normalize_embedding(embedding)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vec.shape[0]
+                self._matrix = np.zeros((self._INITIAL_CAPACITY, self.dim), dtype=np.float32)
+                self._ids = np.empty(self._INITIAL_CAPACITY, dtype=object)
+                self._codes = np.zeros(self._INITIAL_CAPACITY, dtype=np.int64)
+            elif vec.shape[0] != self.dim:
+                raise ValueError(f"Embedding dim {vec.shape[0]} != gallery dim {self.dim}")
+
+            row = self._index.get(employee_id)
+            if row is None:
+                self._ensure_capacity(self._size + 1)
+                row = self._size
+                self._ids[row] = employee_id
+                self._codes[row] = self._add_owner(employee_id)
+                self._index[employee_id] = row
+                self._size += 1
+            self._matrix[row] = vec
+            self._update_owner_norm(template_owner(employee_id))
+            self.version += 1
+            self._notify("upsert", employee_id, vec)
+
+    def remove(self, employee_id: str) -> bool:
+        """
+        Hapus embedding dari gallery
+
+        Buffer baru dialokasikan supaya snapshot yang sedang dipakai
+        request lain tidak ikut bergeser.
+        """
+        with self._lock:
+            row = self._index.get(employee_id)
+            if row is None:
+                return False
+            keep = np.ones(self._size, dtype=bool)
+            keep[row] = False
+            capacity = max(self._INITIAL_CAPACITY, self._matrix.shape[0])
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            ids = np.empty(capacity, dtype=object)
+            codes = np.zeros(capacity, dtype=np.int64)
+            self._size -= 1
+            matrix[:self._size] = self._matrix[:self._size + 1][keep]
+            ids[:self._size] = self._ids[:self._size + 1][keep]
+            codes[:self._size] = self._codes[:self._size + 1][keep]
+            self._matrix, self._ids, self._codes = matrix, ids, codes
+            self._index = {str(eid): i for i, eid in enumerate(ids[:self._size])}
+            self._remove_owner(employee_id)
+            self.version += 1
+            self._notify("remove", employee_id)
+            return True
+
+    def _ensure_capacity(self, needed: int):
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, self._INITIAL_CAPACITY)
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        ids = np.empty(new_capacity, dtype=object)
+        codes = np.zeros(new_capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        codes[:self._size] = self._codes[:self._size]
+        self._matrix, self._ids, self._codes = matrix, ids, codes
+
+    # ============================
+    # Disk sync
+    # ============================
+    def load(self) -> int:
+        """
+        Load semua embeddings dari store (dan .pkl legacy) - full reload
+
+        Returns:
+            Jumlah embeddings di gallery
+        """
+        with self._lock:
+            self.store.sync(force=True)
+            self.store.drain_changes()
+            ids, matrix = self.store.live_items()
+            self._set_all(ids, matrix)
+            self._legacy_stats = {}
+            self._last_refresh = time.monotonic()
+            if self.read_legacy_pickles:
+                self._sync_legacy(force=True)
+            self.version += 1
+            self._notify("reset")
+        logger.info(f"✓ Gallery loaded: {len(self)} embeddings")
+        return len(self)
+
+    @property
+    def refresh_due(self) -> bool:
+        """True jika refresh() berikutnya akan sync ke disk (refresh_interval sudah lewat)"""
+        return time.monotonic() - self._last_refresh >= self.refresh_interval
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Sinkronkan gallery dengan disk (perubahan store dan .pkl legacy dari process lain)
+
+        Args:
+            force: Abaikan refresh_interval
+
+        Returns:
+            True jika gallery berubah
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return False
+        with self._lock:
+            self._last_refresh = now
+            version = self.version
+            self.store.sync()
+            self._apply_store_changes()
+            if self.read_legacy_pickles:
+                self._sync_legacy(force=False)
+            changed = self.version != version
+        if changed:
+            logger.info(f"✓ Gallery refreshed from disk: {len(self)} embeddings")
+        return changed
+
+    def _apply_store_changes(self):
+        changes = self.store.drain_changes()
+        if changes is None:
+            self.load()
+            return
+        for employee_id in changes:
+            embedding = self.store.get(employee_id)
+            if embedding is not None:
+                self.upsert(employee_id, embedding)
+            elif employee_id in self._legacy_stats:
+                self._load_legacy(employee_id)
+            else:
+                self.remove(employee_id)
+
+    def register(self, employee_id: str, embedding: np.ndarray):
+        """Simpan embedding ke store (commit atomic) lalu update gallery in place"""
+        with self._lock:
+            self.store.put(employee_id, embedding)
+            self._apply_store_changes()
+
+    def delete(self, employee_id: str) -> bool:
+        """
+        Hapus embedding dari store, file .pkl legacy, dan gallery
+
+        Returns:
+            True jika employee_id terdaftar
+        """
+        with self._lock:
+            found = self.store.delete(employee_id)
+            legacy_path = self.embeddings_dir / f"{employee_id}.pkl"
+            if legacy_path.exists():
+                legacy_path.unlink()
+                found = True
+            self._legacy_stats.pop(employee_id, None)
+            self._apply_store_changes()
+            self.remove(employee_id)
+            return found
+
+    def register_template(self,
+                          employee_id: str,
+                          embedding: np.ndarray,
+                          max_templates: int = 1,
+                          policy: str = "nearest",
+                          replace: bool = False) -> Tuple[str, int]:
+        """
+        Tambah template untuk employee_id (slot kosong, atau ganti satu template sesuai policy)
+
+        Args:
+            employee_id: ID karyawan
+            embedding: Face embedding
+            max_templates: Maks template per karyawan
+            policy: Template yang diganti jika sudah penuh (lihat templates.choose_replacement)
+            replace: Hapus semua template lama, simpan embedding sebagai satu-satunya template
+
+        Returns:
+            Tuple (key template yang ditulis, jumlah template karyawan sekarang)
+        """
+        with self._lock:
+            self.store.sync()
+            self._apply_store_changes()
+            key, stale = plan_template(self.templates(employee_id), employee_id,
+                                       normalize_embedding(embedding), max_templates, policy, replace)
+            self.register(key, embedding)
+            for stale_key in stale:
+                self.delete(stale_key)
+            return key, len(self.templates(employee_id))
+
+    def delete_templates(self, employee_id: str) -> bool:
+        """
+        Hapus semua template employee_id
+
+        Returns:
+            True jika employee_id terdaftar
+        """
+        with self._lock:
+            self.store.sync()
+            self._apply_store_changes()
+            found = self.delete(employee_id)
+            for key in self.templates(employee_id):
+                found = self.delete(key) or found
+            return found
+
+    def _set_all(self, ids, matrix: np.ndarray):
+        n = len(ids)
+        self.dim = matrix.shape[1] if n else None
+        capacity = max(self._INITIAL_CAPACITY, n)
+        self._matrix = np.zeros((capacity, self.dim or 0), dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=object)
+        if n:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix[:n] = matrix / np.where(norms > 0, norms, 1.0)
+            self._ids[:n] = ids
+        self._size = n
+        self._index = {employee_id: i for i, employee_id in enumerate(ids)}
+        self._owner_code, self._owner_names, self._owner_keys, self._owner_norms = {}, [], {}, []
+        self._codes = np.zeros(capacity, dtype=np.int64)
+        for i, employee_id in enumerate(ids):
+            self._codes[i] = self._add_owner(employee_id)
+        self._owner_norms = centroid_norms_from_codes(
+            self._codes[:n], len(self._owner_names), self._matrix[:n]).tolist()
+
+    # ============================
+    # Legacy .pkl (masa transisi, lihat migrate_embeddings.py)
+    # ============================
+    def _sync_legacy(self, force: bool):
+        if not self.embeddings_dir.exists():
+            return
+
+        current: Dict[str, Tuple[int, int]] = {}
+        with os.scandir(self.embeddings_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(".pkl"):
+                    stat = entry.stat()
+                    current[entry.name[:-4]] = (stat.st_mtime_ns, stat.st_size)
+
+        for employee_id in list(self._legacy_stats):
+            if employee_id not in current:
+                del self._legacy_stats[employee_id]
+                if employee_id not in self.store:
+                    self.remove(employee_id)
+
+        for employee_id, stat in current.items():
+            if not force and self._legacy_stats.get(employee_id) == stat:
+                continue
+            self._legacy_stats[employee_id] = stat
+            # Store selalu menang atas pickle legacy
+            if employee_id not in self.store:
+                self._load_legacy(employee_id)
+
+    def _load_legacy(self, employee_id: str):
+        file_path = self.embeddings_dir / f"{employee_id}.pkl"
+        try:
+            with open(file_path, 'rb') as f:
+                embedding = np.asarray(pickle.load(f), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"✗ Error loading embedding {file_path}: {e}")
+            return
+        self.upsert(employee_id, embedding)
@@ -0,0 +1,286 @@
+"""
+Inference Process Pool
+Pool process inference, masing-masing load FaceAnalysis sekali, supaya
+detection / embedding bisa memakai banyak core tanpa berebut GIL di
+process API.
+
+Image hasil decode (atau batch face chip) dikirim ke worker lewat shared memory: yang di-pickle
+hanya nama segment, shape dan dtype; worker membaca pixel langsung dari
+segment tanpa copy. Hasil (embedding 512 float + bbox) cukup kecil untuk
+dikirim balik lewat pipe biasa.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from metrics import DETECTION_PATHS, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Stage / path detection yang dijalankan di worker, dicatat ulang di process API untuk /metrics
+WORKER_STAGES = ("detect", "embed")
+DETECTION_PATH_LABELS = ("fast", "fallback_no_face", "fallback_low_score", "full", "track", "track_lost")
+
+# Jeda antar percobaan restart pool jika worker baru gagal start (detik)
+RESTART_BACKOFF = 2.0
+
+# Batas waktu semua worker selesai load model (dan warm-up) saat start / restart (detik)
+START_TIMEOUT = 300.0
+
+# FaceRecognitionSystem milik worker process (diisi initializer)
+_worker_system = None
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach ke segment shared memory milik process API
+
+    Worker spawn memakai resource_tracker yang sama dengan process API, jadi
+    registrasi saat attach tidak menambah entry baru; segment tetap di-unlink
+    (dan di-unregister) oleh process API setelah hasil diterima.
+    """
+    return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(system_kwargs: Dict, warmup_iterations: int):
+    global _worker_system
+    from utils import FaceRecognitionSystem
+
+    _worker_system = FaceRecognitionSystem(**system_kwargs)
+    if warmup_iterations > 0:
+        _worker_system.load_stats["warmup_seconds"] = _worker_system.warmup(warmup_iterations)
+
+
+def _worker_info(delay: float = 0.0) -> Tuple[int, Dict]:
+    time.sleep(delay)  # Tahan worker supaya ping berikutnya diambil worker lain
+    return os.getpid(), _worker_system.load_stats
+
+
+def _worker_call(method: str, shm_name: str, shape: Tuple[int, ...], dtype: str, *args):
+    """
+    Panggil method FaceRecognitionSystem worker dengan array di shared memory
+    (extract_face_embedding_from_array / embed_chips), plus durasi stage dan
+    path detection di worker
+    """
+    shm = attach_shared_memory(shm_name)
+    try:
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        before = {name: STAGE_SECONDS.snapshot(name) for name in WORKER_STAGES}
+        paths_before = {path: DETECTION_PATHS.get(path) for path in DETECTION_PATH_LABELS}
+        result = getattr(_worker_system, method)(array, *args)
+        del array
+    finally:
+        shm.close()
+
+    timings = {}
+    for name in WORKER_STAGES:
+        after = STAGE_SECONDS.snapshot(name)
+        if after["count"] > before[name]["count"]:
+            timings[name] = after["sum"] - before[name]["sum"]
+    paths = {path: DETECTION_PATHS.get(path) - count for path, count in paths_before.items()
+             if DETECTION_PATHS.get(path) > count}
+    return result, timings, paths
+
+
+class InferencePoolBroken(Exception):
+    """Worker process mati (OOM / crash), pool sedang di-restart"""
+
+
+class InferencePool:
+    """
+    Pool process untuk extract_face_embedding_from_array
+
+    Dipanggil dari thread executor API (blocking sampai worker selesai).
+    Worker di-start dengan context spawn dan model di-load (dan warm-up)
+    saat startup, bukan saat request pertama.
+
+    Jika worker mati, ProcessPoolExecutor menjadi broken untuk semua submit
+    berikutnya: pool dibangun ulang di background thread dan selama itu
+    setiap call raise InferencePoolBroken (ready = False).
+    """
+
+    def __init__(self, processes: int, system_kwargs: Dict, warmup_iterations: int = 0,
+                 start_timeout: float = START_TIMEOUT):
+        """
+        Args:
+            processes: Jumlah inference process
+            system_kwargs: Argumen FaceRecognitionSystem untuk worker (tanpa gallery)
+            warmup_iterations: Warm-up di setiap worker sebelum pool dianggap siap
+            start_timeout: Batas waktu semua worker siap (detik), lewat = TimeoutError
+        """
+        self.processes = processes
+        self.start_timeout = start_timeout
+        self._system_kwargs = system_kwargs
+        self._warmup_iterations = warmup_iterations
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._restarting = False
+        self.restarts = 0
+        self._pool = self._create()
+        try:
+            self.workers = self._start(self._pool)
+        except Exception:
+            self._discard(self._pool)
+            raise
+
+    def _create(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._system_kwargs, self._warmup_iterations)
+        )
+
+    def _start(self, pool: ProcessPoolExecutor) -> Dict[int, Dict]:
+        """
+        Paksa semua worker spawn dan load model, return {pid: load_stats}
+
+        Ping diulang sampai setiap worker menjawab: worker yang sudah siap
+        bisa mengambil beberapa ping sekaligus selagi worker lain masih load.
+        Raise TimeoutError jika belum semua worker menjawab dalam start_timeout
+        (misal load model macet), supaya restart bisa dicoba ulang.
+        """
+        deadline = time.monotonic() + self.start_timeout
+        workers: Dict[int, Dict] = {}
+        while len(workers) < self.processes:
+            futures = [pool.submit(_worker_info, 0.05) for _ in range(self.processes)]
+            try:
+                workers.update(future.result(timeout=max(deadline - time.monotonic(), 0)) for future in futures)
+            except FuturesTimeoutError:
+                raise TimeoutError(f"Inference pool start timed out after {self.start_timeout:.0f}s "
+                                   f"({len(workers)}/{self.processes} workers ready)") from None
+        logger.info(f"✓ Inference pool started: {len(workers)} processes {sorted(workers)}")
+        return workers
+
+    @staticmethod
+    def _discard(pool: ProcessPoolExecutor):
+        """Shutdown pool tanpa menunggu; worker yang masih hang (belum selesai load) di-terminate"""
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    @property
+    def ready(self) -> bool:
+        """False selama pool di-restart setelah worker mati"""
+        return not self._restarting
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Mulai rebuild pool di background (sekali per pool yang broken)"""
+        with self._lock:
+            if self._pool is not broken or self._restarting:
+                return
+            self._restarting = True
+        logger.error("✗ Inference worker died, restarting pool")
+        threading.Thread(target=self._rebuild, args=(broken,), name="inference-pool-restart", daemon=True).start()
+
+    def _rebuild(self, broken: ProcessPoolExecutor):
+        broken.shutdown(wait=False, cancel_futures=True)
+        while True:
+            pool = self._create()
+            try:
+                workers = self._start(pool)
+                break
+            except Exception as e:
+                logger.error(f"✗ Inference pool restart failed, retrying in {RESTART_BACKOFF:.0f}s: {e}")
+                self._discard(pool)
+                time.sleep(RESTART_BACKOFF)
+        with self._lock:
+            self._pool = pool
+            self.workers = workers
+            self.restarts += 1
+            self._restarting = False
+
+    def extract(self, img_array: np.ndarray, detection: Optional[str] = None) -> Optional[Dict]:
+        """
+        Extract embedding di worker process (image lewat shared memory)
+
+        Returns:
+            Dict sama dengan FaceRecognitionSystem.extract_face_embedding_from_array
+        """
+        return self._call("extract_face_embedding_from_array", img_array, detection)
+
+    def extract_many(self, img_arrays: List[np.ndarray], detection: Optional[str] = None) -> List[Optional[Dict]]:
+        """extract untuk banyak image: semua di-submit sekaligus supaya tersebar ke semua worker"""
+        return self._call_many("extract_face_embedding_from_array", img_arrays, detection)
+
+    def extract_tracked(self, img_array: np.ndarray, *args) -> Optional[Dict]:
+        """FaceRecognitionSystem.extract_tracked_face di worker process (frame lewat shared memory)"""
+        return self._call("extract_tracked_face", img_array, *args)
+
+    def extract_all(self, img_array: np.ndarray, *args) -> List[Dict]:
+        """FaceRecognitionSystem.extract_all_face_embeddings di worker process (image lewat shared memory)"""
+        return self._call("extract_all_face_embeddings", img_array, *args)
+
+    def embed_chips(self, chips: np.ndarray) -> np.ndarray:
+        """FaceRecognitionSystem.embed_chips di worker process (chip lewat shared memory)"""
+        return self._call("embed_chips", chips)
+
+    def _call(self, method: str, array: np.ndarray, *args):
+        """Copy array ke shared memory, jalankan method di worker, catat ulang metrics worker"""
+        return self._call_many(method, [array], *args)[0]
+
+    def _call_many(self, method: str, arrays: List[np.ndarray], *args) -> List:
+        """_call untuk banyak array: semua job di-submit dulu, lalu hasil ditunggu (urutan sama dengan input)"""
+        segments = []
+        futures = []
+        with self._lock:
+            pool = self._pool
+            self._in_flight += len(arrays)
+        try:
+            for array in arrays:
+                array = np.ascontiguousarray(array)
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                segments.append(shm)
+                view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+                view[...] = array
+                del view
+                futures.append(pool.submit(
+                    _worker_call, method, shm.name, array.shape, array.dtype.str, *args
+                ))
+            outputs = [future.result() for future in futures]
+        except BrokenProcessPool as e:
+            self._restart(pool)
+            raise InferencePoolBroken("Inference worker sedang restart") from e
+        finally:
+            wait(futures)  # Segment baru boleh di-unlink setelah tidak ada worker yang membacanya
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+            with self._lock:
+                self._in_flight -= len(arrays)
+                self._completed += len(arrays)
+
+        results = []
+        for result, timings, paths in outputs:
+            for name, seconds in timings.items():
+                STAGE_SECONDS.observe(seconds, name)
+            for path, count in paths.items():
+                DETECTION_PATHS.inc(path, amount=count)
+            results.append(result)
+        return results
+
+    def stats(self) -> Dict:
+        """Snapshot statistik pool"""
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "pids": sorted(self.workers),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "ready": not self._restarting,
+                "restarts": self.restarts,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,259 @@
+"""
+Image Ingestion
+Satu tahap ingestion untuk semua endpoint upload: baca upload dengan batas
+ukuran, cek format & dimensi dari header (tanpa decode), lalu decode sekali.
+
+Endpoint chip menerima face chip yang sudah di-align di client: JPEG / PNG
+per chip, atau body raw BGR (N x 112 x 112 x 3 byte) tanpa encode sama sekali.
+Endpoint embedding menerima vector float32 little-endian mentah (N x dim).
+
+Foto HP (12 MP+) jauh lebih besar dari input detector (640x640), jadi JPEG
+di-decode langsung ke 1/2, 1/4 atau 1/8 resolusi oleh libjpeg (IDCT scaling,
+jauh lebih murah daripada decode penuh lalu resize). Koordinat hasil
+detection dikalikan DecodedImage.scale untuk kembali ke koordinat asli.
+"""
+from typing import Iterable, NamedTuple, Optional, Tuple
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Marker SOF JPEG (baseline, progressive, lossless, arithmetic) - bukan DHT / JPG / DAC
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Faktor reduksi -> flag imdecode (JPEG di-scale saat decode)
+JPEG_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class ImageRejected(Exception):
+    """Upload ditolak sebelum / saat decode (status_code untuk response HTTP)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class ImageHeader(NamedTuple):
+    format: str     # "jpeg" atau "png"
+    width: int
+    height: int
+
+
+class DecodedImage(NamedTuple):
+    image: np.ndarray       # BGR, mungkin resolusi dikurangi
+    scale: float            # koordinat asli = koordinat di image x scale
+    header: ImageHeader
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """Format dari magic bytes"""
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:8] == PNG_SIGNATURE:
+        return "png"
+    return None
+
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) dari segment SOF, melewati APPn (EXIF) tanpa decode"""
+    i, n = 2, len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # marker tanpa length
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        if marker == 0xDA:  # start of scan sebelum SOF: rusak
+            return None
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def parse_image_header(data: bytes) -> Optional[ImageHeader]:
+    """Format dan dimensi dari header image, None jika format tidak dikenal / header rusak"""
+    image_format = sniff_format(data)
+    if image_format == "jpeg":
+        size = _jpeg_size(data)
+    elif image_format == "png":
+        size = None
+        if len(data) >= 24 and data[12:16] == b"IHDR":
+            size = int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+    else:
+        return None
+    if size is None:
+        return None
+    return ImageHeader(image_format, size[0], size[1])
+
+
+def reduction_factor(header: ImageHeader, target_size: Tuple[int, int]) -> int:
+    """
+    Faktor reduksi JPEG terbesar yang tidak membuat detector upsample
+
+    Detector me-resize image agar muat di target_size (aspect ratio tetap),
+    jadi image boleh dikecilkan selama salah satu sisi masih >= sisi target.
+    """
+    if header.format != "jpeg":
+        return 1
+    target_w, target_h = target_size
+    for factor in (8, 4, 2):
+        if header.width / factor >= target_w or header.height / factor >= target_h:
+            return factor
+    return 1
+
+
+class ImageIngestor:
+    """
+    Read -> cek header -> decode, dipakai semua endpoint upload
+
+    Tidak ada decode sebelum header lolos cek format, ukuran minimum dan
+    jumlah pixel maksimum (decompression bomb).
+    """
+
+    def __init__(self,
+                 max_file_size: int,
+                 min_size: Tuple[int, int] = (50, 50),
+                 max_pixels: int = 40_000_000,
+                 allowed_formats: Iterable[str] = ("jpeg", "png"),
+                 target_size: Optional[Tuple[int, int]] = None):
+        """
+        Args:
+            max_file_size: Maks ukuran upload (bytes)
+            min_size: Minimum (width, height)
+            max_pixels: Maks width x height
+            allowed_formats: Format yang diterima
+            target_size: Input detector (width, height) untuk reduced decode, None = selalu resolusi penuh
+        """
+        self.max_file_size = max_file_size
+        self.min_size = min_size
+        self.max_pixels = max_pixels
+        self.allowed_formats = set(allowed_formats)
+        self.target_size = target_size
+
+    async def read(self, upload) -> bytes:
+        """
+        Baca UploadFile per chunk, tolak (413) begitu melewati max_file_size
+        dan tolak (415) di chunk pertama jika magic bytes bukan image yang didukung
+        """
+        chunks = []
+        total = 0
+        while True:
+            chunk = await upload.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            if not chunks and sniff_format(chunk) not in self.allowed_formats:
+                raise ImageRejected("Format gambar tidak didukung (hanya JPEG / PNG)", 415)
+            total += len(chunk)
+            if total > self.max_file_size:
+                raise ImageRejected(f"File terlalu besar (maks {self.max_file_size // (1024 * 1024)} MB)", 413)
+            chunks.append(chunk)
+        if not chunks:
+            raise ImageRejected("File kosong")
+        return b"".join(chunks)
+
+    async def read_body(self, request, max_bytes: int) -> bytes:
+        """Baca body request (raw) per chunk, tolak (413) begitu melewati max_bytes"""
+        chunks = []
+        total = 0
+        async for chunk in request.stream():
+            total += len(chunk)
+            if total > max_bytes:
+                raise ImageRejected(f"Body terlalu besar (maks {max_bytes} bytes)", 413)
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def check_header(self, data: bytes) -> ImageHeader:
+        """Validasi format & dimensi dari header"""
+        header = parse_image_header(data)
+        if header is None or header.format not in self.allowed_formats:
+            raise ImageRejected("Image rusak / format tidak didukung")
+        if header.width < self.min_size[0] or header.height < self.min_size[1]:
+            raise ImageRejected("Image rusak / terlalu kecil")
+        if header.width * header.height > self.max_pixels:
+            raise ImageRejected("Resolusi image terlalu besar")
+        return header
+
+    def decode(self, data: bytes) -> DecodedImage:
+        """Cek header lalu decode sekali (JPEG besar langsung di resolusi lebih kecil)"""
+        header = self.check_header(data)
+        factor = reduction_factor(header, self.target_size) if self.target_size else 1
+        flags = JPEG_REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+        if img is None:
+            raise ImageRejected("Image rusak / tidak bisa di-decode")
+        # Pakai sisi terpanjang supaya benar juga untuk JPEG dengan EXIF rotation
+        scale = max(header.width, header.height) / max(img.shape[:2])
+        return DecodedImage(img, scale, header)
+
+    def decode_chip(self, data: bytes, chip_size: int) -> np.ndarray:
+        """
+        Decode satu face chip JPEG / PNG (aligned, persegi)
+
+        Chip dengan resolusi lain (mis. 224) di-resize ke chip_size; alignment
+        template ArcFace tidak bergantung skala.
+        """
+        header = self.check_header(data)
+        if header.width != header.height:
+            raise ImageRejected("Face chip harus persegi (hasil alignment)")
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ImageRejected("Image rusak / tidak bisa di-decode")
+        if img.shape[:2] != (chip_size, chip_size):
+            interpolation = cv2.INTER_AREA if img.shape[0] > chip_size else cv2.INTER_LINEAR
+            img = cv2.resize(img, (chip_size, chip_size), interpolation=interpolation)
+        return img
+
+    def decode_raw_chips(self, data: bytes, chip_size: int, max_chips: int) -> np.ndarray:
+        """
+        Body raw BGR: N chip chip_size x chip_size x 3 (uint8) berurutan
+
+        Returns:
+            Array (N, chip_size, chip_size, 3) - view read-only ke data, tanpa copy
+        """
+        chip_bytes = chip_size * chip_size * 3
+        if not data or len(data) % chip_bytes:
+            raise ImageRejected(f"Body raw harus kelipatan {chip_bytes} bytes ({chip_size}x{chip_size} BGR uint8)")
+        count = len(data) // chip_bytes
+        if count > max_chips:
+            raise ImageRejected(f"Maks {max_chips} chip per request", 413)
+        return np.frombuffer(data, np.uint8).reshape(count, chip_size, chip_size, 3)
+
+    def decode_raw_embeddings(self, data: bytes, dim: int, max_count: int) -> np.ndarray:
+        """
+        Body raw: N embedding float32 little-endian berurutan
+
+        Returns:
+            Array (N, dim) float32 - view read-only ke data, tanpa copy
+        """
+        vector_bytes = dim * 4
+        if not data or len(data) % vector_bytes:
+            raise ImageRejected(f"Body raw harus kelipatan {vector_bytes} bytes ({dim} float32 little-endian)")
+        count = len(data) // vector_bytes
+        if count > max_count:
+            raise ImageRejected(f"Maks {max_count} embedding per request", 413)
+        embeddings = np.frombuffer(data, dtype="<f4").reshape(count, dim)
+        if not np.isfinite(embeddings).all():
+            raise ImageRejected("Embedding berisi NaN / inf")
+        if not np.linalg.norm(embeddings, axis=1).all():
+            raise ImageRejected("Embedding nol tidak bisa di-match")
+        return embeddings
@@ -1,17 +1,33 @@
 """
 FastAPI Backend untuk Sistem Absensi Makan dengan Face Recognition
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from datetime import datetime
 from pathlib import Path
-import cv2
+from typing import List, Optional, Union
 import numpy as np
+import asyncio
 import logging
+import time
 
 # Import local modules
-from utils import FaceRecognitionSystem, validate_image_file
-from schemas import FaceRegistrationResponse, FaceRecognitionResponse, MealType
+from utils import CHIP_SIZE, FaceRecognitionSystem
+from templates import TEMPLATE_SEPARATOR
+from ingest import ImageIngestor, ImageRejected, DecodedImage
+from executor import InferenceExecutor, ExecutorOverloaded
+from inference_pool import InferencePoolBroken
+from result_cache import CacheEntry, ResultCache
+from face_images import FaceImageWriter
+from tracking import KioskSession, LatestFrame, SessionLimitReached, SessionRegistry
+from metrics import metrics, stage, OUTCOMES, REQUEST_SECONDS
+from schemas import (
+    FaceRegistrationResponse, FaceRegistrationBatchItem, FaceRegistrationBatchResponse,
+    FaceRecognitionResponse, FaceRecognitionBatchResponse,
+    GroupFaceResult, GroupRecognitionResponse, MealType, DetectionMode
+)
+from config import config
 
 # Setup logging
 logging.basicConfig(
@@ -20,6 +36,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Awal cold start (process import main)
+PROCESS_START = time.perf_counter()
+
 # Initialize FastAPI
 app = FastAPI(title="Face Recognition API", version="1.0.0")
 
@@ -43,13 +62,482 @@ EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
 # Face recognition instance
 face_system = None
 
+# Executor untuk kerja blocking (decode, inference, disk write)
+inference_executor = None
+
+# Read / validasi header / decode upload (semua endpoint)
+ingestor = None
+
+# Hasil extract / match per hash upload (None = off)
+result_cache = None
+
+# Sesi streaming kiosk aktif (/ws/kiosk)
+kiosk_sessions = None
+
+# Write foto register di background (setelah embedding durable)
+face_images = None
+
+# Endpoint multi-file: batas Content-Length MAX_BATCH_REQUEST_SIZE, bukan MAX_REQUEST_SIZE
+BATCH_PATHS = ("/api/face/register/batch", "/recognize/batch")
+
+# Status startup untuk /ready (ready = model loaded + warm-up selesai)
+startup_state = {
+    "ready": False,
+    "model_load_seconds": None,
+    "warmup_seconds": None,
+    "cold_start_seconds": None,
+}
+warmup_task = None
+
 
 @app.on_event("startup")
 async def startup_event():
-    global face_system
+    global face_system, inference_executor, warmup_task, ingestor, result_cache, kiosk_sessions, face_images
     logger.info("🚀 Loading face recognition model...")
-    face_system = FaceRecognitionSystem(det_size=(640, 640), similarity_threshold=0.5)
-    logger.info("✅ Model loaded successfully")
+    load_start = time.perf_counter()
+    face_system = FaceRecognitionSystem(
+        det_size=(640, 640),
+        similarity_threshold=0.5,
+        embeddings_dir=str(EMBEDDINGS_DIR),
+        gallery_refresh_interval=config.GALLERY_REFRESH_INTERVAL,
+        read_legacy_pickles=config.READ_LEGACY_PICKLES,
+        match_index=config.MATCH_INDEX,
+        ivf_nlist=config.IVF_NLIST,
+        ivf_nprobe=config.IVF_NPROBE,
+        ann_min_size=config.ANN_MIN_SIZE,
+        max_templates=config.MAX_TEMPLATES_PER_EMPLOYEE,
+        template_scoring=config.TEMPLATE_SCORING,
+        template_replace_policy=config.TEMPLATE_REPLACE_POLICY,
+        recognition_batch_size=config.RECOGNITION_BATCH_SIZE,
+        recognition_batch_wait_ms=config.RECOGNITION_BATCH_WAIT_MS,
+        face_selection=config.FACE_SELECTION,
+        fast_det_size=config.FAST_DETECTION_SIZE,
+        fast_det_min_score=config.FAST_DETECTION_MIN_SCORE,
+        detection_mode=config.RECOGNITION_DETECTION_MODE,
+        track_det_size=config.TRACK_DETECTION_SIZE,
+        track_margin=config.TRACK_MARGIN,
+        model_name=config.MODEL_NAME,
+        model_root=config.MODEL_ROOT,
+        providers=config.MODEL_PROVIDERS,
+        pipeline_profile=config.PIPELINE_PROFILE,
+        gallery_backend=config.GALLERY_BACKEND,
+        shared_gallery_dir=config.SHARED_GALLERY_DIR,
+        inference_processes=config.INFERENCE_PROCESSES,
+        intra_op_threads=config.ORT_INTRA_OP_THREADS,
+        inter_op_threads=config.ORT_INTER_OP_THREADS,
+        graph_optimization=config.ORT_GRAPH_OPTIMIZATION,
+        session_pool_size=config.ORT_SESSION_POOL_SIZE,
+        graph_cache_dir=config.ORT_GRAPH_CACHE_DIR if config.ORT_GRAPH_CACHE else None,
+        warmup_iterations=config.WARMUP_ITERATIONS,
+        model_precision=config.MODEL_PRECISION,
+        quantized_models_dir=config.QUANTIZED_MODELS_DIR
+    )
+    startup_state["model_load_seconds"] = time.perf_counter() - load_start
+    logger.info(f"✅ Model loaded successfully in {startup_state['model_load_seconds']:.2f}s, "
+                f"gallery size = {len(face_system.gallery)}")
+
+    ingestor = ImageIngestor(
+        max_file_size=config.MAX_FILE_SIZE,
+        min_size=config.MIN_IMAGE_SIZE,
+        max_pixels=config.MAX_IMAGE_PIXELS,
+        target_size=face_system.det_size if config.REDUCED_DECODE else None
+    )
+
+    if config.RESULT_CACHE_SIZE > 0:
+        result_cache = ResultCache(max_entries=config.RESULT_CACHE_SIZE, ttl=config.RESULT_CACHE_TTL)
+        logger.info(f"🗃️ Result cache: {config.RESULT_CACHE_SIZE} entries, TTL {config.RESULT_CACHE_TTL:.0f}s")
+
+    kiosk_sessions = SessionRegistry(
+        max_sessions=config.KIOSK_MAX_SESSIONS,
+        idle_timeout=config.KIOSK_IDLE_TIMEOUT,
+        confirm_frames=config.KIOSK_CONFIRM_FRAMES,
+        max_missed=config.KIOSK_MAX_MISSED_FRAMES
+    )
+
+    face_images = FaceImageWriter(
+        mode=config.FACE_IMAGE_MODE,
+        thumbnail_size=config.FACE_THUMBNAIL_SIZE,
+        thumbnail_margin=config.FACE_THUMBNAIL_MARGIN,
+        jpeg_quality=config.FACE_THUMBNAIL_QUALITY,
+        max_queue=config.FACE_IMAGE_QUEUE
+    )
+    logger.info(f"🖼️ Face images: {config.FACE_IMAGE_MODE}, written in background")
+
+    inference_executor = InferenceExecutor(
+        max_workers=config.MAX_WORKERS,
+        max_queue=config.INFERENCE_QUEUE_LIMIT
+    )
+    logger.info(f"⚙️ Inference executor: {config.MAX_WORKERS} workers, queue limit = {config.INFERENCE_QUEUE_LIMIT}")
+
+    # Gauge dibaca saat /metrics di-scrape
+    metrics.gauge("face_api_gallery_size", "Jumlah embeddings di gallery in-memory",
+                  lambda: len(face_system.gallery))
+    metrics.gauge("face_api_executor_queue_depth", "Job yang menunggu worker executor",
+                  lambda: inference_executor.queue_depth)
+    metrics.gauge("face_api_executor_in_flight", "Job yang sedang jalan di executor",
+                  lambda: inference_executor.in_flight)
+    if face_system.batcher is not None:
+        metrics.gauge("face_api_recognition_batcher_queue_depth", "Face crop yang menunggu batch ArcFace",
+                      lambda: face_system.batcher.stats()["queue_depth"])
+    if result_cache is not None:
+        metrics.gauge("face_api_result_cache_entries", "Upload yang hasilnya ada di result cache",
+                      lambda: len(result_cache))
+    metrics.gauge("face_api_face_image_queue_depth", "Foto register yang menunggu ditulis",
+                  lambda: face_images.queue_depth)
+    metrics.gauge("face_api_kiosk_sessions", "Sesi streaming kiosk aktif",
+                  lambda: len(kiosk_sessions))
+    metrics.gauge("face_api_ready", "1 setelah model loaded dan warm-up selesai",
+                  service_ready)
+
+    # Warm-up di background: server sudah menerima koneksi (/health), /ready hijau setelah selesai
+    warmup_task = asyncio.create_task(warm_up())
+
+
+async def warm_up():
+    """Inference dummy di executor, lalu tandai service ready dan log cold start"""
+    logger.info("🔥 Warming up inference...")
+    try:
+        startup_state["warmup_seconds"] = await inference_executor.run(face_system.warmup)
+    except Exception as e:
+        logger.error(f"❌ Warm-up failed, service stays not ready: {e}")
+        return
+    startup_state["cold_start_seconds"] = time.perf_counter() - PROCESS_START
+    startup_state["ready"] = True
+    logger.info(
+        f"🟢 Ready: cold start {startup_state['cold_start_seconds']:.2f}s "
+        f"(model load {startup_state['model_load_seconds']:.2f}s, warm-up {startup_state['warmup_seconds']:.2f}s)"
+    )
+
+
+def service_ready() -> bool:
+    """Warm-up selesai dan inference pool (jika ada) tidak sedang di-restart"""
+    pool_ready = face_system is None or face_system.pool is None or face_system.pool.ready
+    return startup_state["ready"] and pool_ready
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if inference_executor is not None:
+        inference_executor.shutdown()
+    if face_images is not None:
+        face_images.close()
+    if face_system is not None:
+        face_system.close()
+
+
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    """Total latency per endpoint (label = route path, bukan URL mentah)"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    if route is not None and route.path != "/metrics":
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route.path)
+    return response
+
+
+@app.middleware("http")
+async def limit_request_size(request: Request, call_next):
+    """Tolak upload terlalu besar dari Content-Length, sebelum body di-parse"""
+    content_length = request.headers.get("content-length")
+    if request.url.path in BATCH_PATHS:
+        limit, max_size = config.MAX_BATCH_REQUEST_SIZE, config.MAX_BATCH_SIZE
+    else:
+        limit, max_size = config.MAX_REQUEST_SIZE, config.MAX_FILE_SIZE
+    if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+        return JSONResponse({"detail": f"File terlalu besar (maks {max_size // (1024 * 1024)} MB)"},
+                            status_code=413)
+    return await call_next(request)
+
+
+@app.exception_handler(InferencePoolBroken)
+async def inference_pool_broken_handler(request: Request, exc: InferencePoolBroken):
+    logger.error(f"💥 {exc}")
+    return JSONResponse({"detail": "Server sedang memulihkan worker inference, coba lagi"}, status_code=503)
+
+
+@app.exception_handler(ImageRejected)
+async def image_rejected_handler(request: Request, exc: ImageRejected):
+    logger.warning(f"🚫 Upload rejected: {exc.message}")
+    return JSONResponse({"detail": exc.message}, status_code=exc.status_code)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Jalankan fungsi blocking di inference executor (503 jika antrian penuh)"""
+    try:
+        return await inference_executor.run(fn, *args, **kwargs)
+    except ExecutorOverloaded as e:
+        logger.warning(f"⏳ {e}")
+        raise HTTPException(503, "Server sibuk, coba lagi")
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """Baca isi upload dengan batas MAX_FILE_SIZE (stage "read")"""
+    with stage("read"):
+        return await ingestor.read(file)
+
+
+def decode_image(content: bytes) -> DecodedImage:
+    """Cek header lalu decode sekali, mungkin di resolusi lebih kecil (stage "decode")"""
+    with stage("decode"):
+        return ingestor.decode(content)
+
+
+def decode_and_extract(content: bytes, detection: Optional[DetectionMode] = None):
+    """Decode upload lalu extract embedding (satu job di executor), bbox di koordinat asli"""
+    decoded = decode_image(content)
+    result = face_system.extract_face_embedding_from_array(decoded.image, detection.value if detection else None)
+    if result is not None and decoded.scale != 1.0:
+        result["bbox"] = [v * decoded.scale for v in result["bbox"]]
+    return decoded.header, result
+
+
+async def extract_upload(content: bytes, detection: Optional[DetectionMode] = None) -> CacheEntry:
+    """decode_and_extract lewat result cache: upload identik dalam RESULT_CACHE_TTL tidak di-inference ulang"""
+    if result_cache is None:
+        header, result = await run_blocking(decode_and_extract, content, detection)
+        return CacheEntry(header, result, expires_at=0.0)
+    key = ResultCache.key(content, detection.value if detection else face_system.detection_mode)
+    entry = result_cache.get(key)
+    if entry is None:
+        header, result = await run_blocking(decode_and_extract, content, detection)
+        entry = result_cache.put(key, header, result)
+    return entry
+
+
+def match_and_cache(entry: CacheEntry, lookup: bool = True):
+    """
+    Refresh gallery, cek hasil match di cache (jika lookup) lalu find_matching_face
+    jika miss (satu job di executor); version dibaca sebelum match dihitung
+    """
+    version = face_system.gallery_version()
+    if lookup:
+        hit, match = result_cache.get_match(entry, version)
+        if hit:
+            return match
+    match = face_system.find_matching_face(entry.result["embedding"])
+    result_cache.set_match(entry, match, version)
+    return match
+
+
+async def match_upload(entry: CacheEntry):
+    """find_matching_face untuk hasil extract_upload, hasil match di-cache selama version gallery sama"""
+    if result_cache is None:
+        return await run_blocking(face_system.find_matching_face, entry.result["embedding"])
+    # Cek murah di event loop (version in-memory, tanpa sync disk / lock gallery);
+    # miss di version ini juga miss setelah refresh karena version hanya naik
+    version = face_system.cached_gallery_version()
+    if version is not None:
+        hit, match = result_cache.get_match(entry, version)
+        if hit:
+            return match
+    return await run_blocking(match_and_cache, entry, version is None)
+
+
+async def read_batch(uploads: list) -> List[Union[bytes, ImageRejected]]:
+    """
+    Baca field "files" batch: file yang ditolak (format / ukuran) dicatat per item,
+    jumlah file (MAX_BATCH_ITEMS) dan total byte (MAX_BATCH_SIZE) menolak seluruh request
+    """
+    if not uploads:
+        raise ImageRejected("Field 'files' kosong")
+    if len(uploads) > config.MAX_BATCH_ITEMS:
+        raise ImageRejected(f"Maks {config.MAX_BATCH_ITEMS} file per request", 413)
+    items = []
+    total = 0
+    for upload in uploads:
+        if isinstance(upload, str):
+            items.append(ImageRejected("Field 'files' harus berupa file"))
+            continue
+        try:
+            content = await read_upload(upload)
+        except ImageRejected as e:
+            items.append(e)
+            continue
+        total += len(content)
+        if total > config.MAX_BATCH_SIZE:
+            raise ImageRejected(f"Total file terlalu besar (maks {config.MAX_BATCH_SIZE // (1024 * 1024)} MB)", 413)
+        items.append(content)
+    return items
+
+
+def decode_and_extract_batch(contents: List[bytes], detection: Optional[DetectionMode] = None):
+    """
+    decode_and_extract untuk banyak upload (satu job di executor): detection per image,
+    embedding semua wajah satu batch. Upload yang gagal decode -> (ImageRejected, None)
+    """
+    decoded = []
+    for content in contents:
+        try:
+            decoded.append(decode_image(content))
+        except ImageRejected as e:
+            decoded.append(e)
+    results = iter(face_system.extract_face_embeddings_batch(
+        [d.image for d in decoded if not isinstance(d, ImageRejected)],
+        detection.value if detection else None
+    ))
+    extracted = []
+    for d in decoded:
+        if isinstance(d, ImageRejected):
+            extracted.append((d, None))
+            continue
+        result = next(results)
+        if result is not None and d.scale != 1.0:
+            result["bbox"] = [v * d.scale for v in result["bbox"]]
+        extracted.append((d.header, result))
+    return extracted
+
+
+async def extract_batch(items: List[Union[bytes, ImageRejected]],
+                        detection: Optional[DetectionMode] = None) -> List[Union[CacheEntry, ImageRejected]]:
+    """extract_upload untuk hasil read_batch: cache dicek per item, sisanya di-extract dalam satu batch"""
+    entries = list(items)
+    keys = {}
+    pending = []
+    for i, item in enumerate(items):
+        if isinstance(item, ImageRejected):
+            continue
+        if result_cache is not None:
+            key = ResultCache.key(item, detection.value if detection else face_system.detection_mode)
+            entry = result_cache.get(key)
+            if entry is not None:
+                entries[i] = entry
+                continue
+            keys[i] = key
+        pending.append(i)
+    if pending:
+        extracted = await run_blocking(decode_and_extract_batch, [items[i] for i in pending], detection)
+        for i, (header, result) in zip(pending, extracted):
+            if isinstance(header, ImageRejected):
+                entries[i] = header
+            elif result_cache is not None:
+                entries[i] = result_cache.put(keys[i], header, result)
+            else:
+                entries[i] = CacheEntry(header, result, expires_at=0.0)
+    return entries
+
+
+def recognize_group_faces(content: bytes, detection: DetectionMode):
+    """Decode, embed semua wajah yang lolos cutoff lalu match sekaligus (satu job di executor)"""
+    decoded = decode_image(content)
+    faces = face_system.extract_all_face_embeddings(
+        decoded.image,
+        detection.value,
+        min_confidence=config.GROUP_MIN_CONFIDENCE,
+        min_face_size=config.GROUP_MIN_FACE_SIZE,
+        max_faces=config.GROUP_MAX_FACES,
+        scale=decoded.scale
+    )
+    if not faces:
+        return faces, []
+    for face in faces:
+        face["bbox"] = [v * decoded.scale for v in face["bbox"]]
+    return faces, face_system.find_matching_faces(np.stack([face["embedding"] for face in faces]))
+
+
+def extract_kiosk_frame(content: bytes, track_bbox: Optional[List[float]], embed: bool):
+    """Decode frame, detection (crop tracking) + embedding lalu match (satu job di executor), bbox koordinat asli"""
+    decoded = decode_image(content)
+    scale = decoded.scale
+    if track_bbox is not None and scale != 1.0:
+        track_bbox = [v / scale for v in track_bbox]
+    face = face_system.extract_tracked_face(decoded.image, track_bbox, embed)
+    if face is None:
+        return None, None
+    if scale != 1.0:
+        face["bbox"] = [v * scale for v in face["bbox"]]
+    match = face_system.find_matching_face(face["embedding"]) if embed else None
+    return face, match
+
+
+def kiosk_event(event: str, session: KioskSession, face: Optional[dict]) -> dict:
+    """Payload event sesi kiosk (match / unknown sama dengan response /recognize + bbox)"""
+    payload = {"event": event, "frames": session.frames}
+    if event in ("match", "unknown"):
+        payload.update(recognition_response(session.identity, face["confidence"]), bbox=face["bbox"])
+    return payload
+
+
+async def receive_frames(websocket: WebSocket, slot: LatestFrame, idle_timeout: float):
+    """Terima frame binary ke slot sampai disconnect / idle_timeout detik tanpa pesan"""
+    try:
+        while True:
+            message = await asyncio.wait_for(websocket.receive(), timeout=idle_timeout)
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                slot.put(message["bytes"])
+    except asyncio.TimeoutError:
+        slot.timed_out = True
+    finally:
+        slot.close()
+
+
+def match_chips(contents: Optional[List[bytes]] = None, chips: Optional[np.ndarray] = None):
+    """Decode chip JPEG / PNG (jika belum raw), embed satu batch lalu match ke gallery (satu job di executor)"""
+    if chips is None:
+        with stage("decode"):
+            chips = np.stack([ingestor.decode_chip(c, CHIP_SIZE) for c in contents])
+    embeddings = face_system.embed_chips(chips)
+    return face_system.find_matching_faces(embeddings)
+
+
+def recognition_response(match, confidence: Optional[float]) -> dict:
+    """Response /recognize dari hasil find_matching_face (confidence None jika tanpa detection)"""
+    if match is None:
+        return {
+            "success": False,
+            "message": "Wajah tidak dikenali",
+            "similarity": 0.0,
+            "confidence": confidence
+        }
+    nik, similarity = match
+    nik = str(nik)
+    # ⚠️ Tidak lagi ambil nama ke Laravel, cukup kirim NIK & skor
+    return {
+        "success": True,
+        "message": "Wajah dikenali",
+        "employee_id": nik,
+        "nik": nik,
+        "similarity": float(similarity),
+        "confidence": confidence
+    }
+
+
+def persist_registration(employee_id: str, result: dict, content: bytes, img_path: Path,
+                         replace: bool = False) -> int:
+    """
+    Simpan embedding sebagai template (store + gallery, durable sebelum return) lalu
+    jadwalkan write foto di background (satu job di executor), return jumlah template karyawan
+    """
+    with stage("persist"):
+        _, templates = face_system.register_embedding(employee_id, result["embedding"], replace=replace)
+    face_images.submit(img_path, content, result["bbox"])
+    return templates
+
+
+def persist_registrations(items: list, replace: bool = False) -> List[Union[int, str]]:
+    """
+    persist_registration untuk register batch (satu job di executor, berurutan supaya
+    template karyawan yang sama di satu batch tidak saling timpa), error per item -> pesan
+    """
+    outcomes = []
+    for employee_id, result, content, img_path in items:
+        try:
+            outcomes.append(persist_registration(employee_id, result, content, img_path, replace))
+        except (ValueError, OSError) as e:
+            logger.error(f"❌ Failed to persist {employee_id}: {e}")
+            outcomes.append(f"Gagal menyimpan: {e}")
+    return outcomes
+
+
+def face_image_path(employee_id: str, entry: CacheEntry, n: Optional[int] = None) -> Path:
+    """Path file foto register (n = index item batch, supaya nama file unik dalam detik yang sama)"""
+    extension = ".png" if entry.header.format == "png" else ".jpg"
+    suffix = "" if n is None else f"_{n}"
+    return FACES_DIR / f"{employee_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}{extension}"
 
 
 # ============================
@@ -60,118 +548,437 @@ async def root():
     return {"message": "Face Recognition API Running"}
 
 
+@app.get("/health")
+async def health():
+    ready = service_ready()
+    return {
+        "status": "ok" if ready or not startup_state["ready"] else "degraded",
+        "model_loaded": face_system is not None,
+        "ready": ready,
+        "model": face_system.load_stats if face_system is not None else None,
+        "gallery_size": len(face_system.gallery) if face_system is not None else 0,
+        "executor": inference_executor.stats() if inference_executor is not None else None,
+        "recognition_batcher": face_system.batcher.stats() if face_system is not None and face_system.batcher else None,
+        "inference_pool": face_system.pool.stats() if face_system is not None and face_system.pool else None,
+        "face_images": face_images.stats() if face_images is not None else None
+    }
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 setelah warm-up selesai, 503 selama startup / restart inference pool"""
+    if not startup_state["ready"]:
+        return JSONResponse({"status": "starting", **startup_state}, status_code=503)
+    if not service_ready():
+        return JSONResponse({"status": "restarting_inference_pool", **startup_state}, status_code=503)
+    return {"status": "ready", **startup_state}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Metrics dalam Prometheus text format"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # ============================
 # Registration
 # ============================
 @app.post("/api/face/register", response_model=FaceRegistrationResponse)
-async def register_face(employee_id: str = Form(...), file: UploadFile = File(...)):
+async def register_face(employee_id: str = Form(...), file: UploadFile = File(...),
+                        replace: bool = Form(False), detection: Optional[DetectionMode] = None):
     employee_id = str(employee_id)
 
     logger.info(f"📝 Registering face for employee: {employee_id}")
 
     if not file.content_type.startswith("image/"):
         raise HTTPException(400, "File harus berupa gambar")
+    if TEMPLATE_SEPARATOR in employee_id:
+        raise HTTPException(400, f"employee_id tidak boleh mengandung '{TEMPLATE_SEPARATOR}'")
 
-    content = await file.read()
-    if not validate_image_file(content):
-        raise HTTPException(400, "Image rusak / terlalu kecil")
-
-    img = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
-    result = face_system.extract_face_embedding_from_array(img)
+    content = await read_upload(file)
+    entry = await extract_upload(content, detection or DetectionMode(config.REGISTER_DETECTION_MODE))
+    result = entry.result
 
     if result is None:
+        OUTCOMES.inc("register", "no_face")
         raise HTTPException(400, "Tidak ada wajah terdeteksi")
 
-    # Save embedding
-    embedding_path = EMBEDDINGS_DIR / f"{employee_id}.pkl"
-    face_system.save_embedding(result["embedding"], str(embedding_path))
-
-    # Save original image
-    img_path = FACES_DIR / f"{employee_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-    cv2.imwrite(str(img_path), img)
+    # Save embedding (embedding store + gallery in-memory), foto ditulis di background
+    img_path = face_image_path(employee_id, entry)
+    templates = await run_blocking(persist_registration, employee_id, result, content, img_path, replace)
+    OUTCOMES.inc("register", "registered")
 
-    logger.info(f"✅ Face registered for: {employee_id}")
+    logger.info(f"✅ Face registered for: {employee_id} ({templates} template)")
 
     return FaceRegistrationResponse(
         success=True,
         message="Face registered",
         employee_id=employee_id,
         bbox=result["bbox"],
-        confidence=result["confidence"]
+        confidence=result["confidence"],
+        templates=templates
     )
 
 
+@app.post("/api/face/register/batch", response_model=FaceRegistrationBatchResponse)
+async def register_face_batch(request: Request, detection: Optional[DetectionMode] = None):
+    """
+    Register banyak foto sekaligus (multipart): field "files" dan "employee_ids" berpasangan
+    sesuai urutan, field "replace" opsional (berlaku untuk semua item)
+
+    Detection per foto, embedding satu batch; foto yang gagal (format, tidak ada wajah,
+    employee_id tidak valid) hanya menggagalkan item tersebut. Maks MAX_BATCH_ITEMS file
+    dan MAX_BATCH_SIZE byte total per request.
+    """
+    form = await request.form()
+    employee_ids = [str(employee_id) for employee_id in form.getlist("employee_ids")]
+    uploads = form.getlist("files")
+    if len(employee_ids) != len(uploads):
+        raise HTTPException(400, "Jumlah 'employee_ids' harus sama dengan jumlah 'files'")
+    replace = str(form.get("replace", "false")).lower() in ("true", "1", "yes", "on")
+
+    logger.info(f"📝 Registering batch: {len(uploads)} files")
+
+    items = await read_batch(uploads)
+    entries = await extract_batch(items, detection or DetectionMode(config.REGISTER_DETECTION_MODE))
+
+    results: List[Optional[FaceRegistrationBatchItem]] = [None] * len(entries)
+    pending = []
+    for n, (employee_id, entry) in enumerate(zip(employee_ids, entries)):
+        if TEMPLATE_SEPARATOR in employee_id or not employee_id:
+            message = f"employee_id tidak boleh kosong atau mengandung '{TEMPLATE_SEPARATOR}'"
+            outcome = "rejected"
+        elif isinstance(entry, ImageRejected):
+            message, outcome = entry.message, "rejected"
+        elif entry.result is None:
+            message, outcome = "Tidak ada wajah terdeteksi", "no_face"
+        else:
+            pending.append(n)
+            continue
+        OUTCOMES.inc("register_batch", outcome)
+        results[n] = FaceRegistrationBatchItem(success=False, message=message, employee_id=employee_id)
+
+    outcomes = await run_blocking(persist_registrations, [
+        (employee_ids[n], entries[n].result, items[n], face_image_path(employee_ids[n], entries[n], n))
+        for n in pending
+    ], replace) if pending else []
+
+    for n, templates in zip(pending, outcomes):
+        result = entries[n].result
+        if isinstance(templates, str):
+            OUTCOMES.inc("register_batch", "failed")
+            results[n] = FaceRegistrationBatchItem(success=False, message=templates, employee_id=employee_ids[n],
+                                                   confidence=result["confidence"], bbox=result["bbox"])
+            continue
+        OUTCOMES.inc("register_batch", "registered")
+        results[n] = FaceRegistrationBatchItem(
+            success=True,
+            message="Face registered",
+            employee_id=employee_ids[n],
+            confidence=result["confidence"],
+            bbox=result["bbox"],
+            templates=templates
+        )
+
+    registered = sum(r.success for r in results)
+    logger.info(f"✅ Batch registered: {registered}/{len(results)}")
+
+    return FaceRegistrationBatchResponse(success=registered == len(results), registered=registered, results=results)
+
+
 # ============================
 # Recognition (dipanggil Laravel)
 # ============================
 @app.post("/recognize")
-async def recognize_face_simple(file: UploadFile = File(...)):
+async def recognize_face_simple(file: UploadFile = File(...), detection: Optional[DetectionMode] = None):
     logger.info("📸 Received recognition request")
 
-    content = await file.read()
-    img = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+    content = await read_upload(file)
+    entry = await extract_upload(content, detection)
+    result = entry.result
 
-    result = face_system.extract_face_embedding_from_array(img)
     if result is None:
         logger.info("❌ No face detected")
+        OUTCOMES.inc("recognize", "no_face")
         return {"success": False, "message": "Tidak ada wajah terdeteksi"}
 
-    embeddings = face_system.load_all_embeddings(str(EMBEDDINGS_DIR))
-    logger.info(f"📚 Loaded embeddings: {list(embeddings.keys())}")
+    logger.info(f"📚 Gallery size: {len(face_system.gallery)}")
 
-    match = face_system.find_matching_face(result["embedding"], embeddings)
+    match = await match_upload(entry)
+
+    response_data = recognition_response(match, float(result["confidence"]))
 
     if match is None:
         logger.info("❌ No match found")
-        return {
-            "success": False,
-            "message": "Wajah tidak dikenali",
-            "similarity": 0.0,
-            "confidence": float(result["confidence"])
-        }
-
-    nik, similarity = match
-    nik = str(nik)
+        OUTCOMES.inc("recognize", "no_match")
+        return response_data
 
-    logger.info(f"🎯 MATCH FOUND! NIK = {nik}, similarity = {similarity}")
-
-    # ⚠️ Tidak lagi ambil nama ke Laravel, cukup kirim NIK & skor
-    response_data = {
-        "success": True,
-        "message": "Wajah dikenali",
-        "employee_id": nik,
-        "nik": nik,
-        "similarity": float(similarity),
-        "confidence": float(result["confidence"])
-    }
+    logger.info(f"🎯 MATCH FOUND! NIK = {match[0]}, similarity = {match[1]}")
+    OUTCOMES.inc("recognize", "match")
 
     logger.info(f"📤 Final Response to Laravel: {response_data}")
 
     return response_data
 
 
+@app.post("/recognize/batch", response_model=FaceRecognitionBatchResponse)
+async def recognize_face_batch(request: Request, detection: Optional[DetectionMode] = None):
+    """
+    Recognize banyak foto sekaligus (multipart field "files"), satu wajah target per foto
+
+    Detection per foto, embedding satu batch, semua embedding di-match ke gallery
+    dengan satu matrix product. Foto yang ditolak / tanpa wajah hanya menggagalkan
+    item tersebut; results urut sesuai input. Maks MAX_BATCH_ITEMS file dan
+    MAX_BATCH_SIZE byte total per request.
+    """
+    form = await request.form()
+    items = await read_batch(form.getlist("files"))
+
+    logger.info(f"📸 Received batch recognition request: {len(items)} files")
+
+    entries = await extract_batch(items, detection)
+    faces = [n for n, entry in enumerate(entries)
+             if not isinstance(entry, ImageRejected) and entry.result is not None]
+    matches = await run_blocking(
+        face_system.find_matching_faces, np.stack([entries[n].result["embedding"] for n in faces])
+    ) if faces else []
+
+    results: List[Optional[FaceRecognitionResponse]] = [None] * len(entries)
+    for n, match in zip(faces, matches):
+        OUTCOMES.inc("recognize_batch", "no_match" if match is None else "match")
+        results[n] = FaceRecognitionResponse(**recognition_response(match, float(entries[n].result["confidence"])))
+    for n, entry in enumerate(entries):
+        if results[n] is not None:
+            continue
+        if isinstance(entry, ImageRejected):
+            OUTCOMES.inc("recognize_batch", "rejected")
+            results[n] = FaceRecognitionResponse(success=False, message=entry.message)
+        else:
+            OUTCOMES.inc("recognize_batch", "no_face")
+            results[n] = FaceRecognitionResponse(success=False, message="Tidak ada wajah terdeteksi")
+
+    logger.info(f"🎯 Batch: {len(results)} files, matched: {sum(r.success for r in results)}")
+
+    return FaceRecognitionBatchResponse(success=any(r.success for r in results), results=results)
+
+
+# ============================
+# Group recognition (antrian beberapa karyawan dalam satu frame)
+# ============================
+@app.post("/recognize/group", response_model=GroupRecognitionResponse)
+async def recognize_group(file: UploadFile = File(...), detection: Optional[DetectionMode] = None):
+    """
+    Recognize semua wajah di frame: satu batched forward pass recognition untuk
+    semua wajah yang lolos GROUP_MIN_CONFIDENCE / GROUP_MIN_FACE_SIZE dan satu
+    matrix product ke gallery. Hasil per wajah (bbox koordinat asli), terbesar dulu.
+    """
+    content = await read_upload(file)
+    faces, matches = await run_blocking(
+        recognize_group_faces, content, detection or DetectionMode(config.GROUP_DETECTION_MODE)
+    )
+
+    if not faces:
+        OUTCOMES.inc("recognize_group", "no_face")
+        return GroupRecognitionResponse(success=False, message="Tidak ada wajah terdeteksi", faces=0, results=[])
+
+    results = []
+    for face, match in zip(faces, matches):
+        OUTCOMES.inc("recognize_group", "no_match" if match is None else "match")
+        results.append(GroupFaceResult(bbox=face["bbox"], **recognition_response(match, face["confidence"])))
+
+    recognized = sum(match is not None for match in matches)
+    logger.info(f"👥 Group: {len(faces)} faces, {recognized} recognized")
+    return GroupRecognitionResponse(
+        success=recognized > 0,
+        message=f"{recognized} dari {len(faces)} wajah dikenali",
+        faces=len(faces),
+        results=results
+    )
+
+
+# ============================
+# Streaming sesi kiosk (WebSocket)
+# ============================
+@app.websocket("/ws/kiosk")
+async def kiosk_stream(websocket: WebSocket):
+    """
+    Sesi streaming kiosk: client mengirim frame JPEG / PNG sebagai pesan binary,
+    server mengirim event JSON:
+
+    - {"event": "session", ...} saat terhubung
+    - {"event": "match", ...response /recognize, "bbox"} setelah wajah yang sama
+      cocok di KIOSK_CONFIRM_FRAMES frame berturut-turut (identitas lalu ditahan
+      tanpa recognition ulang selama wajah masih ter-track)
+    - {"event": "unknown", ...} jika K frame berturut-turut tidak dikenali
+    - {"event": "lost"} saat wajah yang sudah diumumkan hilang / berganti orang
+    - {"event": "error", "detail"} untuk frame yang ditolak (sesi tetap jalan)
+
+    Frame berikutnya cukup detection di crop sekitar bbox lama (TRACK_DETECTION_SIZE).
+    Hanya frame terbaru yang diproses; frame yang datang selama inference ditimpa.
+    Sesi ditutup setelah KIOSK_IDLE_TIMEOUT detik tanpa frame.
+    """
+    await websocket.accept()
+    try:
+        session = kiosk_sessions.open()
+    except SessionLimitReached as e:
+        logger.warning(f"🚫 {e}")
+        await websocket.close(code=1013, reason="Terlalu banyak sesi kiosk")
+        return
+
+    logger.info(f"📹 Kiosk session {session.session_id[:8]} opened")
+    await websocket.send_json({
+        "event": "session",
+        "session_id": session.session_id,
+        "confirm_frames": session.confirm_frames,
+        "idle_timeout": kiosk_sessions.idle_timeout
+    })
+
+    slot = LatestFrame()
+    receiver = asyncio.create_task(receive_frames(websocket, slot, kiosk_sessions.idle_timeout))
+    try:
+        while (frame := await slot.get()) is not None:
+            session.touch()
+            if len(frame) > config.MAX_FILE_SIZE:
+                await websocket.send_json({"event": "error", "detail": "Frame terlalu besar"})
+                continue
+            try:
+                face, match = await inference_executor.run(
+                    extract_kiosk_frame, frame, session.bbox, session.needs_embedding
+                )
+            except ImageRejected as e:
+                await websocket.send_json({"event": "error", "detail": e.message})
+                continue
+            except ExecutorOverloaded:
+                continue  # Frame dibuang, kiosk mengirim frame berikutnya
+            except InferencePoolBroken:
+                await websocket.send_json({"event": "error", "detail": "Worker inference sedang restart"})
+                continue
+            for event in session.update(face, match):
+                OUTCOMES.inc("kiosk", event)
+                await websocket.send_json(kiosk_event(event, session, face))
+        if slot.timed_out:
+            await websocket.close(code=1000, reason="Idle timeout")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        kiosk_sessions.close(session)
+        logger.info(f"📹 Kiosk session {session.session_id[:8]} closed: {session.frames} frames, "
+                    f"{slot.dropped} dropped")
+
+
+# ============================
+# Recognize dari face chip (sudah di-align di client, tanpa detection)
+# ============================
+@app.post("/recognize/chips")
+async def recognize_chips(request: Request):
+    """
+    Recognize face chip 112x112 yang sudah di-align (template ArcFace) di client
+
+    - multipart/form-data: field "files", satu JPEG / PNG persegi per chip
+    - application/octet-stream: N x 112 x 112 x 3 byte BGR uint8 berurutan
+
+    Hanya model recognition (satu batch) + gallery match. Satu chip -> response
+    sama dengan /recognize (confidence null), beberapa chip -> {"results": [...]}.
+    """
+    max_chips = config.MAX_CHIPS_PER_REQUEST
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        uploads = form.getlist("files")
+        if not uploads:
+            raise ImageRejected("Field 'files' kosong")
+        if len(uploads) > max_chips:
+            raise ImageRejected(f"Maks {max_chips} chip per request", 413)
+        contents = [await read_upload(upload) for upload in uploads]
+        matches = await run_blocking(match_chips, contents=contents)
+    elif content_type.startswith("application/octet-stream"):
+        with stage("read"):
+            body = await ingestor.read_body(request, max_chips * CHIP_SIZE * CHIP_SIZE * 3)
+        chips = ingestor.decode_raw_chips(body, CHIP_SIZE, max_chips)
+        matches = await run_blocking(match_chips, chips=chips)
+    else:
+        raise ImageRejected("Content-Type harus multipart/form-data atau application/octet-stream", 415)
+
+    logger.info(f"🧩 Chips: {len(matches)}, matched: {sum(m is not None for m in matches)}")
+    for match in matches:
+        OUTCOMES.inc("recognize_chips", "no_match" if match is None else "match")
+
+    results = [recognition_response(match, None) for match in matches]
+    if len(results) == 1:
+        return results[0]
+    return {"success": any(r["success"] for r in results), "results": results}
+
+
+# ============================
+# Recognize dari embedding (dihitung di client)
+# ============================
+@app.post("/recognize/embedding", response_model=Union[FaceRecognitionResponse, FaceRecognitionBatchResponse])
+async def recognize_embedding(request: Request):
+    """
+    Match embedding float32 little-endian (body application/octet-stream) ke gallery
+
+    Body N x dim float32 (dim = dim gallery). Tanpa multipart, decode maupun
+    inference: semua query di-score dengan satu matrix product dalam satu job
+    executor (refresh gallery bisa sync disk dan menunggu lock register, jadi
+    tidak dijalankan di event loop).
+    Satu embedding -> FaceRecognitionResponse, beberapa -> FaceRecognitionBatchResponse.
+    """
+    if not request.headers.get("content-type", "").startswith("application/octet-stream"):
+        raise ImageRejected("Content-Type harus application/octet-stream", 415)
+
+    max_count = config.MAX_EMBEDDINGS_PER_REQUEST
+    dim = face_system.gallery.dim or config.EMBEDDING_DIM
+    with stage("read"):
+        body = await ingestor.read_body(request, max_count * dim * 4)
+    queries = ingestor.decode_raw_embeddings(body, dim, max_count)
+    matches = await run_blocking(face_system.find_matching_faces, queries)
+
+    results = []
+    for match in matches:
+        if match is None:
+            OUTCOMES.inc("recognize_embedding", "no_match")
+            results.append(FaceRecognitionResponse(success=False, message="Wajah tidak dikenali", similarity=0.0))
+            continue
+        OUTCOMES.inc("recognize_embedding", "match")
+        nik, similarity = match
+        results.append(FaceRecognitionResponse(
+            success=True,
+            message="Wajah dikenali",
+            employee_id=str(nik),
+            similarity=float(similarity)
+        ))
+
+    if len(results) == 1:
+        return results[0]
+    return FaceRecognitionBatchResponse(success=any(r.success for r in results), results=results)
+
+
 # ============================
 # Check-in attendance (opsional, kalau mau pakai langsung dari Python)
 # ============================
 @app.post("/api/attendance/checkin", response_model=FaceRecognitionResponse)
-async def attendance_checkin(file: UploadFile = File(...)):
+async def attendance_checkin(file: UploadFile = File(...), detection: Optional[DetectionMode] = None):
     logger.info("📝 Processing attendance check-in")
 
-    content = await file.read()
-    img = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+    content = await read_upload(file)
+    entry = await extract_upload(content, detection)
+    result = entry.result
 
-    result = face_system.extract_face_embedding_from_array(img)
     if result is None:
+        OUTCOMES.inc("checkin", "no_face")
         return FaceRecognitionResponse(success=False, message="Tidak ada wajah terdeteksi")
 
-    embeddings = face_system.load_all_embeddings(str(EMBEDDINGS_DIR))
-    match = face_system.find_matching_face(result["embedding"], embeddings)
+    match = await match_upload(entry)
 
     if match is None:
+        OUTCOMES.inc("checkin", "no_match")
         return FaceRecognitionResponse(success=False, message="Wajah tidak dikenali")
 
     nik, similarity = match
     nik = str(nik)
+    OUTCOMES.inc("checkin", "match")
 
     # Di sini juga TIDAK panggil Laravel, cukup kirim NIK
     response_data = FaceRecognitionResponse(
@@ -0,0 +1,190 @@
+"""
+Matching Engine
+Vectorized cosine matching: satu matrix-vector product terhadap seluruh
+gallery (embeddings sudah L2-normalized), lalu ambil top-k.
+
+Gallery bisa berisi beberapa template per karyawan (templates.py): score per
+row di-reduce per karyawan sebelum top-k, jadi kandidat selalu employee_id
+unik dan margin dihitung antar orang, bukan antar template orang yang sama.
+"""
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from gallery import normalize_embedding
+from templates import TEMPLATE_SCORING_MODES, TemplateIndex, reduce_scores, template_owner
+
+# Scoring centroid: jumlah owner teratas (by centroid) yang di-re-rank dengan max
+CENTROID_SHORTLIST = 8
+
+
+class MatchResult(NamedTuple):
+    """Hasil matching satu query embedding"""
+    candidates: List[Tuple[str, float]]  # [(employee_id, similarity)], urut dari yang tertinggi
+    margin: Optional[float]              # similarity rank 1 - rank 2 (None jika < 2 kandidat)
+
+    @property
+    def best(self) -> Optional[Tuple[str, float]]:
+        return self.candidates[0] if self.candidates else None
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Index top-k dari scores (1-D), urut descending"""
+    n = scores.shape[0]
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+def build_result(ids: np.ndarray, scores: np.ndarray, k: int) -> MatchResult:
+    """Bangun MatchResult dari vector scores (1-D) terhadap ids"""
+    if scores.shape[0] == 0 or k <= 0:
+        return MatchResult([], None)
+    idx = top_k_indices(scores, k)
+    candidates = [(str(ids[i]), float(scores[i])) for i in idx]
+    margin = candidates[0][1] - candidates[1][1] if len(candidates) > 1 else None
+    return MatchResult(candidates, margin)
+
+
+def passes_threshold(result: MatchResult, similarity_threshold: float) -> bool:
+    """Threshold semantics find_matching_face: best > 0 dan best >= threshold"""
+    best = result.best
+    return best is not None and best[1] > 0.0 and best[1] >= similarity_threshold
+
+
+def search_matrix(query_embedding: np.ndarray,
+                  ids: np.ndarray,
+                  matrix: np.ndarray,
+                  k: int = 5) -> MatchResult:
+    """
+    Score query terhadap matrix (N, D) yang sudah L2-normalized
+
+    Args:
+        query_embedding: Embedding yang ingin dicari (tidak harus normalized)
+        ids: Array employee_id, shape (N,)
+        matrix: Embeddings normalized, shape (N, D)
+        k: Jumlah kandidat teratas
+
+    Returns:
+        MatchResult berisi top-k kandidat dan margin
+    """
+    if len(ids) == 0:
+        return MatchResult([], None)
+    scores = matrix @ normalize_embedding(query_embedding)
+    return build_result(ids, scores, k)
+
+
+def search_templates(scores: np.ndarray, templates: TemplateIndex, k: int = 5,
+                     scoring: str = "max") -> List[MatchResult]:
+    """
+    Top-k per karyawan dari score per row template
+
+    Args:
+        scores: Similarity query x row, shape (B, N)
+        templates: Index row -> owner dari gallery
+        k: Jumlah kandidat teratas
+        scoring: "max" = similarity template terbaik; "centroid" = ranking
+                 by centroid, shortlist di-re-rank dengan similarity template terbaik
+
+    Returns:
+        List MatchResult, satu per query (similarity = max antar template)
+    """
+    best, centroid = reduce_scores(scores, templates)
+    if scoring == "max" or centroid is None:
+        return [build_result(templates.owner_ids, row, k) for row in best]
+    results = []
+    for best_row, centroid_row in zip(best, centroid):
+        shortlist = top_k_indices(centroid_row, max(k, CENTROID_SHORTLIST))
+        results.append(build_result(templates.owner_ids[shortlist], best_row[shortlist], k))
+    return results
+
+
+def owner_result(result: MatchResult, k: int) -> MatchResult:
+    """Kandidat per template (urut descending) -> kandidat per karyawan (max antar template)"""
+    candidates = []
+    seen = set()
+    for key, similarity in result.candidates:
+        owner = template_owner(key)
+        if owner in seen:
+            continue
+        seen.add(owner)
+        candidates.append((owner, similarity))
+        if len(candidates) == k:
+            break
+    margin = candidates[0][1] - candidates[1][1] if len(candidates) > 1 else None
+    return MatchResult(candidates, margin)
+
+
+class MatchingEngine:
+    """
+    Top-k matching terhadap EmbeddingGallery / SharedGallery
+    """
+
+    def __init__(self, gallery, similarity_threshold: float = 0.5, index=None,
+                 template_scoring: str = "max", max_templates: int = 1):
+        """
+        Args:
+            gallery: Gallery embeddings (EmbeddingGallery atau SharedGallery)
+            similarity_threshold: Threshold untuk face matching
+            index: ANN index opsional (IVFIndex); exact search jika None / belum di-train
+            template_scoring: Reduce score template per karyawan: max | centroid
+                (ANN index selalu max)
+            max_templates: Maks template per karyawan (kandidat ANN diambil k x max_templates)
+        """
+        if template_scoring not in TEMPLATE_SCORING_MODES:
+            raise ValueError(f"Unknown template scoring: {template_scoring}")
+        self.gallery = gallery
+        self.similarity_threshold = similarity_threshold
+        self.index = index
+        self.template_scoring = template_scoring
+        self.max_templates = max(1, max_templates)
+
+    @property
+    def use_index(self) -> bool:
+        return self.index is not None and self.index.ready
+
+    def search(self, query_embedding: np.ndarray, k: int = 5) -> MatchResult:
+        """
+        Score query terhadap seluruh gallery
+
+        Args:
+            query_embedding: Embedding yang ingin dicari (tidak harus normalized)
+            k: Jumlah kandidat teratas
+
+        Returns:
+            MatchResult berisi top-k kandidat dan margin
+        """
+        return self.search_batch(query_embedding, k)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 5) -> List[MatchResult]:
+        """
+        Score banyak query sekaligus dengan satu matrix product
+
+        Args:
+            query_embeddings: Array (B, D)
+            k: Jumlah kandidat teratas per query
+
+        Returns:
+            List MatchResult, satu per query
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if self.use_index:
+            results = [self.index.search(normalize_embedding(q), k * self.max_templates) for q in queries]
+            if all(result is not None for result in results):
+                return [owner_result(result, k) for result in results]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+
+        def score(ids, matrix, templates):
+            if len(ids) == 0:
+                return [MatchResult([], None) for _ in range(queries.shape[0])]
+            return search_templates(queries @ matrix.T, templates, k, self.template_scoring)
+
+        return self.gallery.read_templates(score)
+
+    def is_match(self, result: MatchResult) -> bool:
+        """True jika kandidat terbaik lolos similarity_threshold"""
+        return passes_threshold(result, self.similarity_threshold)
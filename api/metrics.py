@@ -0,0 +1,216 @@
+"""
+Metrics
+Histogram latency per stage, counter hasil recognition dan gauge (gallery,
+antrian executor) dalam format text Prometheus untuk endpoint /metrics.
+
+Sengaja tanpa dependency tambahan: satu observe = perf_counter + bisect +
+update di bawah lock, cukup murah untuk selalu aktif di production.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Bucket (detik) untuk latency per stage: 0.1 ms .. 10 s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Counter monotonic dengan label"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in items]
+
+
+class Gauge:
+    """Gauge yang nilainya dibaca dari callback saat scrape"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def collect(self) -> List[str]:
+        try:
+            value = float(self.fn())
+        except Exception:
+            return []
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram:
+    """Histogram dengan label (bucket kumulatif saat render, seperti Prometheus client)"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [count per bucket (+Inf terakhir), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Context manager: observe durasi block (detik)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self, *labels: str) -> Dict:
+        """Count dan sum untuk satu label set (dipakai benchmark / debugging)"""
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                return {"count": 0, "sum": 0.0}
+            return {"count": series[2], "sum": series[1]}
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Kumpulan metric yang di-render bersama untuk /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, object] = {}
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, fn: Callable[[], float]) -> Gauge:
+        """Register (atau ganti) gauge callback"""
+        return self._add(Gauge(name, documentation, fn))
+
+    def render(self) -> str:
+        """Semua metric dalam Prometheus text exposition format 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+# Registry global (satu per process)
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "face_api_stage_seconds",
+    "Latency per pipeline stage (read, decode, detect, embed, gallery, match, persist, face_image)",
+    ["stage"]
+)
+REQUEST_SECONDS = metrics.histogram(
+    "face_api_request_seconds",
+    "Total latency per endpoint",
+    ["endpoint"]
+)
+OUTCOMES = metrics.counter(
+    "face_api_outcomes",
+    "Hasil request per endpoint (no_face, no_match, match, registered)",
+    ["endpoint", "outcome"]
+)
+DETECTION_PATHS = metrics.counter(
+    "face_api_detection_path",
+    "Path detection (adaptive: fast, fallback_no_face, fallback_low_score, full; kiosk: track, track_lost)",
+    ["path"]
+)
+BATCH_FILL = metrics.histogram(
+    "face_api_batch_fill",
+    "Isi batch micro-batcher per batch (item / max_batch_size)",
+    ["batcher"],
+    buckets=(0.125, 0.25, 0.5, 0.75, 0.99, 1.0)  # 0.99: batch penuh terpisah dari yang hampir penuh
+)
+BATCH_QUEUE_DELAY_SECONDS = metrics.histogram(
+    "face_api_batch_queue_delay_seconds",
+    "Delay antrian per item micro-batcher, dari submit sampai batch-nya dijalankan",
+    ["batcher"]
+)
+RESULT_CACHE = metrics.counter(
+    "face_api_result_cache",
+    "Result cache per hash upload: extract / match x hit, miss, evicted",
+    ["kind", "result"]
+)
+
+
+def stage(name: str):
+    """Shortcut: `with stage("detect"): ...`"""
+    return STAGE_SECONDS.time(name)
@@ -0,0 +1,88 @@
+"""
+Migrasi embeddings legacy ({employee_id}.pkl) ke embedding store columnar
+
+Usage (dari folder api/):
+    python migrate_embeddings.py
+    python migrate_embeddings.py --embeddings-dir ../data/embeddings --remove-pickles
+
+Semua .pkl ditulis ke store dalam satu commit atomic. Tanpa --remove-pickles,
+file .pkl dibiarkan (store selalu menang atas .pkl saat gallery di-load).
+Hanya jalankan pada file .pkl yang dibuat sendiri oleh sistem ini - unpickle
+bisa mengeksekusi code.
+"""
+import argparse
+import pickle
+import sys
+from pathlib import Path
+import logging
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDINGS_DIR = Path(__file__).parent.parent / "data" / "embeddings"
+
+
+def migrate(embeddings_dir: Path, remove_pickles: bool = False, overwrite: bool = False) -> int:
+    """
+    Konversi semua .pkl di embeddings_dir ke embedding store
+
+    Args:
+        embeddings_dir: Directory embeddings
+        remove_pickles: Hapus .pkl setelah commit berhasil
+        overwrite: Timpa embedding yang sudah ada di store dengan isi .pkl
+
+    Returns:
+        Jumlah embeddings yang dimigrasi
+    """
+    store = EmbeddingStore(str(embeddings_dir))
+    store.sync(force=True)
+
+    items = []
+    migrated_files = []
+    for pkl_file in sorted(embeddings_dir.glob("*.pkl")):
+        employee_id = pkl_file.stem
+        if employee_id in store and not overwrite:
+            logger.info(f"- Skip {employee_id}: sudah ada di store")
+            migrated_files.append(pkl_file)
+            continue
+        try:
+            with open(pkl_file, "rb") as f:
+                embedding = np.asarray(pickle.load(f), dtype=np.float32).reshape(-1)
+        except Exception as e:
+            logger.error(f"✗ Gagal membaca {pkl_file}: {e}")
+            continue
+        items.append((employee_id, embedding))
+        migrated_files.append(pkl_file)
+
+    if items:
+        store.put_many(items)
+    logger.info(f"✓ Migrated {len(items)} embeddings, store sekarang berisi {len(store)} embeddings")
+
+    if remove_pickles:
+        for pkl_file in migrated_files:
+            pkl_file.unlink()
+        logger.info(f"✓ Removed {len(migrated_files)} legacy .pkl files")
+
+    return len(items)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings-dir", type=Path, default=DEFAULT_EMBEDDINGS_DIR)
+    parser.add_argument("--remove-pickles", action="store_true", help="Hapus .pkl setelah migrasi berhasil")
+    parser.add_argument("--overwrite", action="store_true", help="Timpa embedding yang sudah ada di store")
+    args = parser.parse_args()
+
+    if not args.embeddings_dir.is_dir():
+        logger.error(f"Embeddings directory not found: {args.embeddings_dir}")
+        return 1
+    migrate(args.embeddings_dir, remove_pickles=args.remove_pickles, overwrite=args.overwrite)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
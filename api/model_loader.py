@@ -0,0 +1,292 @@
+"""
+Model Loader
+Load model pack InsightFace dengan ONNX Runtime session yang di-tune
+(jumlah thread, graph optimization) dan pool beberapa session independen
+per model supaya request paralel tidak berebut satu thread pool ORT.
+
+insightface 0.7.3 (model_zoo.get_model / FaceAnalysis) tidak meneruskan
+SessionOptions ke InferenceSession, jadi session dibuat di sini lalu
+diberikan ke class model insightface (RetinaFace, ArcFaceONNX, ...).
+
+Graph hasil optimization ORT bisa disimpan ke cache (graph_cache_dir) dan
+dipakai lagi saat start berikutnya tanpa optimization ulang.
+
+Varian model quantized (INT8 / FP16, dibuat quantize_models.py) disimpan
+sebagai pack terpisah "<name>-<precision>" dengan nama file yang sama.
+"""
+import copy
+import glob
+import hashlib
+import os
+import os.path as osp
+import platform
+import queue
+from contextlib import contextmanager
+from typing import Iterator, List, NamedTuple, Optional
+import logging
+
+import onnx
+import onnxruntime as ort
+from insightface.app import FaceAnalysis
+from insightface.model_zoo import ArcFaceONNX, Attribute, Landmark, RetinaFace
+from insightface.utils import ensure_available
+
+logger = logging.getLogger(__name__)
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+# fp32 = model asli di pack, lainnya = varian dari quantize_models.py
+MODEL_PRECISIONS = ("fp32", "int8-dynamic", "int8-static", "fp16")
+
+
+def variant_pack_dir(variants_root: str, name: str, precision: str) -> str:
+    """Folder pack varian quantized, mis. models/insightface/buffalo_l-int8-static"""
+    return osp.join(variants_root, f"{name}-{precision}")
+
+
+class SessionSettings(NamedTuple):
+    """Setting ONNX Runtime per session"""
+    intra_op_threads: int = 0           # Thread per operator (0 = default ORT: semua core fisik)
+    inter_op_threads: int = 0           # Thread antar operator (> 1 = execution mode parallel)
+    graph_optimization: str = "all"     # disable | basic | extended | all
+
+
+def make_session_options(settings: SessionSettings) -> ort.SessionOptions:
+    """SessionOptions dari SessionSettings"""
+    if settings.graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph_optimization: {settings.graph_optimization}")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[settings.graph_optimization]
+    if settings.intra_op_threads > 0:
+        options.intra_op_num_threads = settings.intra_op_threads
+    if settings.inter_op_threads > 0:
+        options.inter_op_num_threads = settings.inter_op_threads
+        if settings.inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return options
+
+
+def create_session(model_file: str, settings: SessionSettings, providers: List[str]) -> ort.InferenceSession:
+    """InferenceSession baru untuk model_file dengan settings"""
+    return ort.InferenceSession(model_file, sess_options=make_session_options(settings), providers=providers)
+
+
+def _cpu_signature() -> str:
+    """Arsitektur + model CPU (graph level "all" bisa memakai kernel NCHWc spesifik CPU)"""
+    model = platform.processor()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{platform.machine()}/{model}"
+
+
+def graph_cache_path(model_file: str, settings: SessionSettings, providers: List[str], cache_dir: str) -> str:
+    """
+    Path graph teroptimasi untuk model_file di cache_dir
+
+    Key mencakup versi ORT, level optimization, providers, arsitektur CPU dan
+    size / mtime model: graph level "all" bisa berisi fused op yang spesifik
+    untuk CPU / execution provider, jadi cache dari mesin lain tidak dipakai.
+    """
+    stat = os.stat(model_file)
+    key = "|".join([
+        ort.__version__, settings.graph_optimization, ",".join(providers),
+        _cpu_signature(), str(stat.st_size), str(stat.st_mtime_ns),
+    ])
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    stem = osp.splitext(osp.basename(model_file))[0]
+    return osp.join(cache_dir, f"{stem}.{digest}.onnx")
+
+
+def create_cached_session(model_file: str, settings: SessionSettings, providers: List[str],
+                          cache_dir: str) -> ort.InferenceSession:
+    """
+    InferenceSession dari graph teroptimasi di cache, atau optimize lalu simpan
+
+    Graph dari cache di-load dengan optimization disable (sudah dioptimasi).
+    File ditulis ke path sementara lalu di-rename, jadi beberapa process yang
+    start bersamaan tidak membaca file setengah jadi.
+    """
+    if settings.graph_optimization == "disable":
+        return create_session(model_file, settings, providers)
+
+    cached = graph_cache_path(model_file, settings, providers, cache_dir)
+    if osp.exists(cached):
+        try:
+            session = create_session(cached, settings._replace(graph_optimization="disable"), providers)
+            logger.info(f"✓ Optimized graph loaded from cache: {osp.basename(cached)}")
+            return session
+        except Exception as e:
+            logger.warning(f"✗ Invalid cached graph {cached}, re-optimizing: {e}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cached}.{os.getpid()}.tmp"
+    options = make_session_options(settings)
+    options.optimized_model_filepath = tmp_path
+    session = ort.InferenceSession(model_file, sess_options=options, providers=providers)
+    if osp.exists(tmp_path):
+        os.replace(tmp_path, cached)
+        logger.info(f"✓ Optimized graph cached: {osp.basename(cached)}")
+    return session
+
+
+def model_task(model_file: str) -> Optional[str]:
+    """
+    Task model dari shape input / jumlah output (sama dengan routing model_zoo),
+    dibaca dari graph ONNX tanpa membuat session
+    """
+    graph = onnx.load(model_file).graph
+    initializers = {init.name for init in graph.initializer}
+    inputs = [i for i in graph.input if i.name not in initializers]
+    if not inputs:
+        return None
+    shape = [d.dim_value for d in inputs[0].type.tensor_type.shape.dim]
+    if len(graph.output) >= 5:
+        return "detection"
+    if len(shape) != 4:
+        return None
+    if shape[2] == 192 and shape[3] == 192:
+        return "landmark"
+    if shape[2] == 96 and shape[3] == 96:
+        return "genderage"
+    if len(inputs) == 2 and shape[2] == 128 and shape[3] == 128:
+        return None  # inswapper, tidak dipakai
+    if shape[2] == shape[3] and shape[2] >= 112 and shape[2] % 16 == 0:
+        return "recognition"
+    return None
+
+
+_MODEL_CLASSES = {
+    "detection": RetinaFace,
+    "landmark": Landmark,
+    "genderage": Attribute,
+    "recognition": ArcFaceONNX,
+}
+
+
+class FaceModelPack(FaceAnalysis):
+    """
+    FaceAnalysis dengan session ORT yang di-tune
+
+    Hanya model dengan task di allowed_modules yang dibuatkan session (file
+    model lain di pack tidak pernah di-load ke ORT). prepare() / get() sama
+    dengan FaceAnalysis. Model insightface tetap diberi model_file asli
+    (ArcFaceONNX membaca mean / std dari graph asli), hanya session yang
+    memakai graph dari cache.
+
+    Dengan precision selain fp32, session dibuat dari file varian quantized
+    (fallback ke fp32 per file jika varian tidak ada), sedangkan metadata
+    model (input mean / std, shape) tetap dibaca dari file fp32.
+    """
+
+    def __init__(self,
+                 name: str = "buffalo_l",
+                 root: str = "~/.insightface",
+                 allowed_modules: Optional[List[str]] = None,
+                 providers: Optional[List[str]] = None,
+                 session_settings: SessionSettings = SessionSettings(),
+                 graph_cache_dir: Optional[str] = None,
+                 precision: str = "fp32",
+                 variants_root: Optional[str] = None):
+        if precision not in MODEL_PRECISIONS:
+            raise ValueError(f"Unknown model precision: {precision}")
+        ort.set_default_logger_severity(3)
+        self.providers = providers or ["CPUExecutionProvider"]
+        self.session_settings = session_settings
+        self.precision = precision
+        self.model_dir = ensure_available("models", name, root=root)
+        pack_id = name if precision == "fp32" else f"{name}-{precision}"
+        self.graph_cache_dir = osp.join(graph_cache_dir, pack_id) if graph_cache_dir else None
+        self.variant_dir = None
+        if precision != "fp32":
+            if variants_root is None:
+                raise ValueError("variants_root is required for quantized models")
+            self.variant_dir = variant_pack_dir(variants_root, name, precision)
+            if not osp.isdir(self.variant_dir):
+                raise RuntimeError(
+                    f"Quantized models not found in {self.variant_dir}, "
+                    f"run: python quantize_models.py --mode {precision}"
+                )
+        # model_file fp32 -> file yang di-load ke session
+        self.session_files = {}
+        self.models = {}
+        for onnx_file in sorted(glob.glob(osp.join(self.model_dir, "*.onnx"))):
+            task = model_task(onnx_file)
+            if task is None:
+                continue
+            if allowed_modules is not None and not any(m.startswith(task) for m in allowed_modules):
+                continue
+            self.session_files[onnx_file] = self._session_file(onnx_file)
+            model = _MODEL_CLASSES[task](model_file=onnx_file, session=self.create_session(onnx_file))
+            if allowed_modules is not None and model.taskname not in allowed_modules:
+                continue
+            if model.taskname not in self.models:
+                self.models[model.taskname] = model
+        if "detection" not in self.models:
+            raise RuntimeError(f"Model pack {name} has no detection model")
+        self.det_model = self.models["detection"]
+
+    def _session_file(self, model_file: str) -> str:
+        if self.variant_dir is None:
+            return model_file
+        variant = osp.join(self.variant_dir, osp.basename(model_file))
+        if not osp.exists(variant):
+            logger.warning(f"✗ No {self.precision} variant for {osp.basename(model_file)}, using fp32")
+            return model_file
+        return variant
+
+    def create_session(self, model_file: str) -> ort.InferenceSession:
+        """Session untuk model_file fp32 (memakai varian quantized jika ada)"""
+        session_file = self.session_files.get(model_file, model_file)
+        if self.graph_cache_dir is not None:
+            return create_cached_session(session_file, self.session_settings, self.providers, self.graph_cache_dir)
+        return create_session(session_file, self.session_settings, self.providers)
+
+
+class ModelPool:
+    """
+    Pool replica model, masing-masing dengan InferenceSession sendiri
+
+    Replica dibuat dengan shallow copy model (atribut hasil prepare ikut)
+    lalu diberi session baru, jadi N request bisa inference paralel dengan
+    thread pool ORT masing-masing (N x intra_op_threads core).
+    """
+
+    def __init__(self, model, size: int, pack: FaceModelPack):
+        """
+        Args:
+            model: Model insightface yang sudah di-prepare
+            size: Jumlah replica (1 = pakai model itu sendiri)
+            pack: FaceModelPack untuk membuat session baru
+        """
+        self.size = max(1, size)
+        self._replicas: "queue.Queue" = queue.Queue()
+        self._replicas.put(model)
+        for _ in range(self.size - 1):
+            replica = copy.copy(model)
+            replica.session = pack.create_session(model.model_file)
+            self._replicas.put(replica)
+
+    @contextmanager
+    def acquire(self) -> Iterator:
+        """Pinjam satu replica (block jika semua sedang dipakai)"""
+        model = self._replicas.get()
+        try:
+            yield model
+        finally:
+            self._replicas.put(model)
+
+    def available(self) -> int:
+        return self._replicas.qsize()
+
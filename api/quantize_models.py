@@ -0,0 +1,242 @@
+"""
+Buat varian quantized (INT8 / FP16) dari model detection & recognition InsightFace
+
+Usage (dari folder api/):
+    python quantize_models.py --mode int8-static --images ../data/faces
+    python quantize_models.py --mode int8-dynamic
+    python quantize_models.py --mode fp16          # butuh: pip install onnxconverter-common
+
+Hasil ditulis ke models/insightface/<model>-<mode>/ dengan nama file sama
+dengan pack asli, lalu di-load dengan MODEL_PRECISION=<mode> di .env.
+Hanya model detection dan recognition yang di-quantize (model lain di pack
+tidak dipakai API dan tetap fp32).
+
+- int8-static: QDQ per-channel, range activation dikalibrasi dari foto wajah
+  lokal (--images). Biasanya paling cepat di CPU x86 (VNNI / AVX2).
+- int8-dynamic: hanya weight yang di-quantize, tanpa kalibrasi. Untuk model
+  konvolusi speedup biasanya kecil, tapi file jauh lebih kecil.
+- fp16: hanya berguna untuk GPU; ORT CPU tidak punya kernel fp16 untuk
+  sebagian besar op.
+
+Cek drift embedding dan keputusan match terhadap fp32 sebelum dipakai di
+production: python benchmarks/bench_quantized.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import logging
+
+import cv2
+import numpy as np
+import onnx
+
+from config import config
+from model_loader import MODEL_PRECISIONS, variant_pack_dir
+from utils import FaceRecognitionSystem
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def list_images(images_dir: Optional[Path], limit: int = 0) -> List[Path]:
+    """
+    Image di images_dir (rekursif); fallback ke sample image insightface jika kosong
+
+    Args:
+        images_dir: Folder foto wajah lokal (mis. data/faces)
+        limit: Maks jumlah image (0 = semua)
+    """
+    paths = []
+    if images_dir is not None and images_dir.is_dir():
+        paths = sorted(p for p in images_dir.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if not paths:
+        import insightface
+
+        sample_dir = Path(insightface.__file__).parent / "data" / "images"
+        logger.warning(f"No images in {images_dir}, using insightface sample images")
+        paths = sorted(p for p in sample_dir.glob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+    return paths[:limit] if limit > 0 else paths
+
+
+def detection_blob(det_model, img: np.ndarray) -> np.ndarray:
+    """Input detector untuk img, sama dengan preprocessing RetinaFace.detect (resize + pad)"""
+    input_w, input_h = det_model.input_size
+    im_ratio = img.shape[0] / img.shape[1]
+    if im_ratio > input_h / input_w:
+        new_h, new_w = input_h, int(input_h / im_ratio)
+    else:
+        new_w, new_h = input_w, int(input_w * im_ratio)
+    det_img = np.zeros((input_h, input_w, 3), dtype=np.uint8)
+    det_img[:new_h, :new_w] = cv2.resize(img, (new_w, new_h))
+    return cv2.dnn.blobFromImage(
+        det_img, 1.0 / det_model.input_std, (input_w, input_h),
+        (det_model.input_mean,) * 3, swapRB=True
+    )
+
+
+def recognition_blob(rec_model, crop: np.ndarray) -> np.ndarray:
+    """Input ArcFace untuk satu aligned crop, sama dengan ArcFaceONNX.get_feat"""
+    return cv2.dnn.blobFromImages(
+        [crop], 1.0 / rec_model.input_std, rec_model.input_size,
+        (rec_model.input_mean,) * 3, swapRB=True
+    )
+
+
+def calibration_feeds(face_system: FaceRecognitionSystem, images: List[Path],
+                      max_faces_per_image: int = 4) -> Dict[str, List[Dict[str, np.ndarray]]]:
+    """
+    Input kalibrasi per task: blob detector per image dan blob ArcFace per wajah
+    (wajah di-align dari hasil detector fp32)
+    """
+    det_model, rec_model = face_system.app.det_model, face_system.rec_model
+    det_input = det_model.session.get_inputs()[0].name
+    rec_input = rec_model.session.get_inputs()[0].name
+    feeds: Dict[str, List[Dict[str, np.ndarray]]] = {"detection": [], "recognition": []}
+    for path in images:
+        img = cv2.imread(str(path))
+        if img is None:
+            logger.warning(f"✗ Cannot read image: {path}")
+            continue
+        feeds["detection"].append({det_input: detection_blob(det_model, img)})
+        bboxes, kpss = face_system.detect_faces(img)
+        if kpss is None:
+            continue
+        for kps in kpss[:max_faces_per_image]:
+            crop = face_system.align_face(img, kps)
+            feeds["recognition"].append({rec_input: recognition_blob(rec_model, crop)})
+    return feeds
+
+
+class FeedReader:
+    """CalibrationDataReader ORT dari list feed dict"""
+
+    def __init__(self, feeds: List[Dict[str, np.ndarray]]):
+        self._feeds = feeds
+        self._iter: Iterator = iter(feeds)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        return next(self._iter, None)
+
+    def rewind(self):
+        self._iter = iter(self._feeds)
+
+
+def _preprocess(src: str, tmp_dir: str) -> str:
+    """Shape inference + optimization sebelum quantization (disarankan ORT)"""
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    dst = os.path.join(tmp_dir, "pre_" + os.path.basename(src))
+    try:
+        quant_pre_process(src, dst, skip_symbolic_shape=True)
+        return dst
+    except Exception as e:
+        logger.warning(f"✗ Pre-processing failed for {os.path.basename(src)}, quantizing original graph: {e}")
+        return src
+
+
+def quantize_model(src: str, dst: str, mode: str, feeds: Optional[List[Dict[str, np.ndarray]]] = None):
+    """
+    Tulis varian quantized src ke dst
+
+    Args:
+        src: Model fp32
+        dst: Path output
+        mode: int8-dynamic, int8-static atau fp16
+        feeds: Input kalibrasi (wajib untuk int8-static)
+    """
+    if mode == "fp16":
+        try:
+            from onnxconverter_common import float16
+        except ImportError:
+            raise SystemExit("Mode fp16 butuh onnxconverter-common: pip install onnxconverter-common")
+        # keep_io_types: input / output tetap float32, preprocessing insightface tidak berubah
+        onnx.save(float16.convert_float_to_float16(onnx.load(src), keep_io_types=True), dst)
+        return
+
+    from onnxruntime.quantization import (
+        CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pre = _preprocess(src, tmp_dir)
+        if mode == "int8-dynamic":
+            # ConvInteger di CPU EP hanya mendukung weight uint8
+            quantize_dynamic(pre, dst, weight_type=QuantType.QUInt8)
+        elif mode == "int8-static":
+            if not feeds:
+                raise ValueError(f"No calibration data for {os.path.basename(src)}")
+            quantize_static(
+                pre, dst, FeedReader(feeds),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+                calibrate_method=CalibrationMethod.MinMax
+            )
+        else:
+            raise ValueError(f"Unknown quantization mode: {mode}")
+
+
+def quantize_pack(model_name: str, model_root: str, mode: str, output_root: Path,
+                  images: List[Path], det_size: int = 640) -> Path:
+    """
+    Quantize model detection & recognition dari pack model_name
+
+    Returns:
+        Folder pack varian
+    """
+    face_system = FaceRecognitionSystem(
+        det_size=(det_size, det_size),
+        model_name=model_name,
+        model_root=model_root,
+        pipeline_profile="recognition",
+        warmup_iterations=0
+    )
+    models = {"detection": face_system.app.det_model, "recognition": face_system.rec_model}
+
+    feeds = {}
+    if mode == "int8-static":
+        feeds = calibration_feeds(face_system, images)
+        logger.info(f"✓ Calibration data: {len(feeds['detection'])} images, "
+                    f"{len(feeds['recognition'])} faces")
+        if not feeds["recognition"]:
+            raise SystemExit("Tidak ada wajah terdeteksi di image kalibrasi, gunakan --images dengan foto wajah")
+
+    out_dir = Path(variant_pack_dir(str(output_root), model_name, mode))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for task, model in models.items():
+        src = model.model_file
+        dst = out_dir / os.path.basename(src)
+        quantize_model(src, str(dst), mode, feeds.get(task))
+        logger.info(f"✓ {task}: {os.path.basename(src)} {os.path.getsize(src) / 2**20:.1f} MB "
+                    f"-> {dst.stat().st_size / 2**20:.1f} MB ({mode})")
+    face_system.close()
+    return out_dir
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", nargs="+", default=["int8-static"],
+                        choices=[p for p in MODEL_PRECISIONS if p != "fp32"])
+    parser.add_argument("--model", default=config.MODEL_NAME)
+    parser.add_argument("--model-root", default=config.MODEL_ROOT)
+    parser.add_argument("--images", type=Path, default=config.FACES_DIR, help="Foto wajah untuk kalibrasi int8-static")
+    parser.add_argument("--max-images", type=int, default=200)
+    parser.add_argument("--output-dir", type=Path, default=Path(config.QUANTIZED_MODELS_DIR))
+    parser.add_argument("--det-size", type=int, default=config.DETECTION_SIZE[0])
+    args = parser.parse_args()
+
+    images = list_images(args.images, args.max_images) if "int8-static" in args.mode else []
+    for mode in args.mode:
+        out_dir = quantize_pack(args.model, args.model_root, mode, args.output_dir, images, args.det_size)
+        logger.info(f"✓ {mode} models ready in {out_dir} (set MODEL_PRECISION={mode})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Result Cache
+Cache hasil extract (detection + embedding) per hash isi upload, supaya upload
+identik (retry dari Laravel setelah timeout, double submit) tidak di-decode dan
+di-inference ulang.
+
+Hasil match ikut disimpan bersama version gallery saat match dihitung; begitu
+gallery berubah (register / delete dari process mana pun) version naik dan
+hasil match lama dianggap miss, sementara hasil extract tetap valid.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+import logging
+
+from metrics import RESULT_CACHE
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """Hasil extract satu upload (+ hasil match terakhir dan version gallery-nya)"""
+
+    __slots__ = ("header", "result", "expires_at", "matched")
+
+    def __init__(self, header, result: Optional[Dict], expires_at: float):
+        self.header = header
+        self.result = result
+        self.expires_at = expires_at
+        self.matched: Optional[Tuple] = None  # (match, gallery_version), diganti sekaligus
+
+
+class ResultCache:
+    """
+    LRU + TTL cache, thread-safe
+
+    Entry kedaluwarsa ttl detik setelah dibuat (tidak diperpanjang saat hit) dan
+    entry paling lama tidak dipakai dibuang begitu jumlah entry melewati max_entries.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60.0):
+        """
+        Args:
+            max_entries: Maks jumlah upload yang disimpan (embedding 512 float per entry)
+            ttl: Umur maksimum entry (detik)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(content: bytes, *variant: str) -> Tuple:
+        """Key cache: BLAKE2b 128-bit isi upload + variant (mis. mode detection)"""
+        return (hashlib.blake2b(content, digest_size=16).digest(),) + variant
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        """Entry untuk key, None jika tidak ada / kedaluwarsa"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                RESULT_CACHE.inc("extract", "miss")
+                return None
+            self._entries.move_to_end(key)
+        RESULT_CACHE.inc("extract", "hit")
+        return entry
+
+    def put(self, key: Hashable, header, result: Optional[Dict]) -> CacheEntry:
+        """Simpan hasil extract (result None = tidak ada wajah, ikut di-cache)"""
+        entry = CacheEntry(header, result, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                RESULT_CACHE.inc("extract", "evicted")
+        return entry
+
+    def get_match(self, entry: CacheEntry, gallery_version: int) -> Tuple[bool, Optional[Tuple[str, float]]]:
+        """
+        Hasil match yang disimpan di entry
+
+        Returns:
+            (hit, match) - hit False jika belum pernah di-match atau gallery sudah berubah
+        """
+        matched = entry.matched
+        if matched is None or matched[1] != gallery_version:
+            RESULT_CACHE.inc("match", "miss")
+            return False, None
+        RESULT_CACHE.inc("match", "hit")
+        return True, matched[0]
+
+    def set_match(self, entry: CacheEntry, match: Optional[Tuple[str, float]], gallery_version: int):
+        """
+        Simpan hasil match beserta version gallery yang dibaca SEBELUM match
+        dihitung (kalau gallery berubah di tengah, lookup berikutnya miss)
+        """
+        entry.matched = (match, gallery_version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
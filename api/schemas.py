@@ -24,6 +24,12 @@ class AttendanceStatus(str, Enum):
     LATE = "late"           # Terlambat
 
 
+class DetectionMode(str, Enum):
+    """Mode face detection per request"""
+    ADAPTIVE = "adaptive"    # Resolusi kecil dulu, fallback ke resolusi penuh
+    FULL = "full"            # Selalu resolusi penuh (DETECTION_SIZE)
+
+
 class UserRole(str, Enum):
     """Role user"""
     ADMIN = "admin"
@@ -82,6 +88,24 @@ class FaceRegistrationResponse(BaseModel):
     employee_id: str
     confidence: float
     bbox: List[float]
+    templates: int = 1  # Jumlah template embedding karyawan setelah register
+
+
+class FaceRegistrationBatchItem(BaseModel):
+    """Hasil register satu file dalam batch (gagal per item tidak menggagalkan batch)"""
+    success: bool
+    message: str
+    employee_id: str
+    confidence: Optional[float] = None
+    bbox: Optional[List[float]] = None
+    templates: Optional[int] = None
+
+
+class FaceRegistrationBatchResponse(BaseModel):
+    """Response register batch (urutan results sama dengan input)"""
+    success: bool  # True jika semua item berhasil
+    registered: int
+    results: List[FaceRegistrationBatchItem]
 
 
 class FaceRecognitionResponse(BaseModel):
@@ -97,6 +121,25 @@ class FaceRecognitionResponse(BaseModel):
     attendance_id: Optional[int] = None
 
 
+class FaceRecognitionBatchResponse(BaseModel):
+    """Response recognition untuk beberapa query sekaligus (urutan sama dengan input)"""
+    success: bool  # True jika minimal satu query dikenali
+    results: List[FaceRecognitionResponse]
+
+
+class GroupFaceResult(FaceRecognitionResponse):
+    """Hasil recognition satu wajah di frame group"""
+    bbox: List[float]
+
+
+class GroupRecognitionResponse(BaseModel):
+    """Response group recognition: semua wajah yang lolos cutoff, terbesar lebih dulu"""
+    success: bool  # True jika minimal satu wajah dikenali
+    message: str
+    faces: int
+    results: List[GroupFaceResult]
+
+
 class MealTimeSettingBase(BaseModel):
     """Base schema untuk meal time settings"""
     meal_type: MealType
@@ -0,0 +1,579 @@
+"""
+Shared Gallery
+Gallery embeddings di satu segment memory-mapped (default /dev/shm) yang
+dibaca bersama oleh semua process (uvicorn workers / inference processes).
+Register di satu process langsung terlihat di process lain lewat version
+counter di header segment, tanpa full reload dan tanpa copy per process.
+
+Layout (di shm_dir):
+    <name>.hdr          header uint64: magic, seq, version, generation, size,
+                        capacity, dim, id_width, store_version
+    <name>.<gen>.seg    employee_id fixed-width (capacity x id_width bytes),
+                        lalu matrix float32 normalized (capacity x dim)
+    <name>.lock         lock antar process untuk writer
+
+Reader tidak pakai lock: header berisi seqlock (seq ganjil = writer sedang
+menulis), reader mengulang baca jika seq berubah selama scoring. Sumber data
+tetap EmbeddingStore di embeddings_dir; segment hanya cache bersama yang
+di-publish ulang dari store jika tertinggal (misal store diubah oleh CLI).
+
+Satu row = satu template (key "<employee_id>#<slot>", lihat templates.py);
+index row -> owner dibangun per process dan di-cache per version segment.
+"""
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+import logging
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+from gallery import normalize_embedding
+from templates import (
+    TEMPLATE_SEPARATOR, TemplateIndex, index_from_codes, owner_codes_from_bytes, plan_template, template_owner,
+    template_slot
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: hanya lock antar thread
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+MAGIC = 0x4D53_4741_4C4C_0001  # "MSGALL" + format 1
+HEADER_BYTES = 4096
+ID_WIDTH = 64  # Maks panjang employee_id (bytes UTF-8)
+
+# Field header (index uint64)
+_MAGIC, _SEQ, _VERSION, _GENERATION, _SIZE, _CAPACITY, _DIM, _ID_WIDTH, _STORE_VERSION = range(9)
+
+
+def default_shm_dir() -> Path:
+    """/dev/shm jika ada (RAM, Linux), selain itu temp dir"""
+    base = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+    return base / "mealscan"
+
+
+class _IdView:
+    """View read-only ke kolom employee_id di segment (decode saat diakses)"""
+
+    def __init__(self, ids: np.ndarray, size: int):
+        self._ids = ids
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, i) -> str:
+        return self._ids[i].decode("utf-8")
+
+
+class SharedGallery:
+    """
+    Gallery embeddings di shared memory-mapped segment
+
+    Interface sama dengan EmbeddingGallery untuk kebutuhan matching
+    (read, snapshot, get, register, delete, refresh). File .pkl legacy tidak
+    dibaca - jalankan migrate_embeddings.py dulu.
+    """
+
+    _INITIAL_CAPACITY = 64
+
+    def __init__(self,
+                 embeddings_dir: str,
+                 refresh_interval: float = 2.0,
+                 shm_dir: Optional[str] = None,
+                 name: Optional[str] = None):
+        """
+        Args:
+            embeddings_dir: Path ke directory embeddings (EmbeddingStore)
+            refresh_interval: Jarak minimum (detik) antar cek perubahan store di luar API
+            shm_dir: Directory segment (default /dev/shm/mealscan)
+            name: Nama segment (default dari path embeddings_dir)
+        """
+        self.embeddings_dir = Path(embeddings_dir)
+        self.refresh_interval = refresh_interval
+        self.shm_dir = Path(shm_dir) if shm_dir else default_shm_dir()
+        digest = hashlib.sha1(str(self.embeddings_dir.resolve()).encode("utf-8")).hexdigest()[:12]
+        self.name = name or f"gallery-{digest}"
+        self.store = EmbeddingStore(embeddings_dir)
+
+        self._lock = threading.RLock()
+        self._header: Optional[np.ndarray] = None
+        self._header_mmap: Optional[mmap.mmap] = None
+        self._data_mmap: Optional[mmap.mmap] = None
+        self._mapped: Tuple[int, int, int] = (-1, 0, 0)
+        self._ids = np.empty(0, dtype=f"S{ID_WIDTH}")
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._rows: Dict[str, int] = {}
+        self._rows_version = -1
+        self._last_refresh = 0.0
+        self._templates: Optional[Tuple[int, TemplateIndex]] = None
+
+    # ============================
+    # Segment files
+    # ============================
+    @property
+    def header_path(self) -> Path:
+        return self.shm_dir / f"{self.name}.hdr"
+
+    def _segment_path(self, generation: int) -> Path:
+        return self.shm_dir / f"{self.name}.{generation}.seg"
+
+    @staticmethod
+    def _ids_bytes(capacity: int, id_width: int) -> int:
+        return (capacity * id_width + 63) // 64 * 64
+
+    def _open_header(self):
+        if self._header is not None:
+            return
+        with self._lock:
+            if self._header is not None:
+                return
+            self.shm_dir.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(self.header_path), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size < HEADER_BYTES:
+                    os.ftruncate(fd, HEADER_BYTES)
+                self._header_mmap = mmap.mmap(fd, HEADER_BYTES)
+            finally:
+                os.close(fd)
+            self._header = np.frombuffer(self._header_mmap, dtype=np.uint64, count=16)
+
+    def _map_generation(self, generation: int):
+        """Map segment data untuk generation (dipanggil reader & writer saat generation berubah)"""
+        header = self._header
+        capacity, dim, id_width = int(header[_CAPACITY]), int(header[_DIM]), int(header[_ID_WIDTH])
+        # Key termasuk capacity / dim: header bisa terbaca di tengah writer ganti generation
+        key = (generation, capacity, dim)
+        if key == self._mapped:
+            return
+        with self._lock:
+            ids_bytes = self._ids_bytes(capacity, id_width)
+            length = ids_bytes + capacity * dim * 4
+            if length == 0:
+                data = None
+                ids = np.empty(0, dtype=f"S{id_width or ID_WIDTH}")
+                matrix = np.zeros((0, dim), dtype=np.float32)
+            else:
+                fd = os.open(str(self._segment_path(generation)), os.O_RDWR)
+                try:
+                    data = mmap.mmap(fd, length)
+                finally:
+                    os.close(fd)
+                ids = np.frombuffer(data, dtype=f"S{id_width}", count=capacity)
+                matrix = np.frombuffer(data, dtype=np.float32, count=capacity * dim,
+                                       offset=ids_bytes).reshape(capacity, dim)
+            # mmap lama dilepas oleh GC setelah tidak ada view yang memakainya
+            self._data_mmap, self._ids, self._matrix = data, ids, matrix
+            self._mapped = key
+
+    @contextmanager
+    def _write_lock(self):
+        """Lock writer antar thread dan antar process"""
+        with self._lock:
+            self._open_header()
+            with open(self.shm_dir / f"{self.name}.lock", "a+b") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def _seqlock(self):
+        """Tandai header sedang ditulis (seq ganjil) lalu naikkan version"""
+        header = self._header
+        header[_SEQ] += np.uint64(1)
+        try:
+            yield
+        finally:
+            header[_VERSION] += np.uint64(1)
+            header[_SEQ] += np.uint64(1)
+
+    # ============================
+    # Read access (lock-free)
+    # ============================
+    def __len__(self) -> int:
+        self._open_header()
+        return int(self._header[_SIZE])
+
+    def __contains__(self, employee_id: str) -> bool:
+        return self.get(employee_id) is not None
+
+    @property
+    def version(self) -> int:
+        """Version counter segment (naik setiap perubahan, dari process mana pun)"""
+        self._open_header()
+        return int(self._header[_VERSION])
+
+    @property
+    def dim(self) -> Optional[int]:
+        self._open_header()
+        return int(self._header[_DIM]) or None
+
+    def read(self, fn: Callable[[_IdView, np.ndarray], T]) -> T:
+        """
+        Jalankan fn(ids, matrix) terhadap view konsisten dari segment
+
+        fn dijalankan langsung di atas memory shared (tanpa copy) dan diulang
+        jika ada writer yang mengubah segment selama fn berjalan, jadi fn
+        harus bebas side effect.
+        """
+        self._open_header()
+        header = self._header
+        while True:
+            seq = int(header[_SEQ])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            try:
+                self._map_generation(int(header[_GENERATION]))
+            except (FileNotFoundError, ValueError):
+                continue  # generation diganti writer di tengah jalan
+            size = min(int(header[_SIZE]), self._matrix.shape[0])
+            ids, matrix = self._ids, self._matrix
+            result = fn(_IdView(ids, size), matrix[:size])
+            if int(header[_SEQ]) == seq:
+                return result
+
+    def read_templates(self, fn: Callable[[_IdView, np.ndarray, TemplateIndex], T]) -> T:
+        """
+        Jalankan fn(ids, matrix, template_index) terhadap view konsisten
+
+        Index dibaca / dibangun di dalam seqlock read: index yang terbangun dari
+        segment setengah ditulis ter-cache di version lama dan tidak dipakai lagi.
+        """
+        def indexed(ids, matrix):
+            version = int(self._header[_VERSION])
+            cached = self._templates
+            if cached is None or cached[0] != version:
+                codes, owner_ids = owner_codes_from_bytes(ids._ids[:len(ids)])
+                cached = self._templates = (version, index_from_codes(codes, owner_ids, matrix))
+            return fn(ids, matrix, cached[1])
+
+        return self.read(indexed)
+
+    def templates(self, employee_id: str) -> Dict[str, np.ndarray]:
+        """Semua template (key -> embedding normalized) milik employee_id, urut slot"""
+        key = employee_id.encode("utf-8")
+        prefix = key + TEMPLATE_SEPARATOR.encode()
+
+        def collect(ids, matrix):
+            column = ids._ids[:len(ids)]
+            rows = np.flatnonzero((column == key) | np.char.startswith(column, prefix))
+            return {ids[i]: matrix[i].copy() for i in rows if template_owner(ids[i]) == employee_id}
+
+        found = self.read(collect)
+        return {k: found[k] for k in sorted(found, key=template_slot)}
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy konsisten (ids, matrix) - O(N), untuk keperluan non-hot-path"""
+        return self.read(lambda ids, matrix: (
+            np.array([ids[i] for i in range(len(ids))], dtype=object), matrix.copy()))
+
+    def as_dict(self) -> Dict[str, np.ndarray]:
+        ids, matrix = self.snapshot()
+        return {employee_id: matrix[i] for i, employee_id in enumerate(ids)}
+
+    def get(self, employee_id: str) -> Optional[np.ndarray]:
+        """Ambil embedding (normalized) untuk employee_id"""
+        key = employee_id.encode("utf-8")
+        return self.read(lambda ids, matrix: next(
+            (matrix[i].copy() for i in np.flatnonzero(ids._ids[:len(ids)] == key)), None))
+
+    # ============================
+    # Publish dari EmbeddingStore
+    # ============================
+    def load(self) -> int:
+        """
+        Attach ke segment; publish dari store jika segment belum ada atau tertinggal
+
+        Returns:
+            Jumlah embeddings di gallery
+        """
+        with self._write_lock():
+            self.store.sync(force=True)
+            self.store.drain_changes()
+            header = self._header
+            if int(header[_MAGIC]) != MAGIC or int(header[_STORE_VERSION]) != self.store.version:
+                self._publish_all()
+            self._last_refresh = time.monotonic()
+        logger.info(f"✓ Shared gallery attached: {len(self)} embeddings ({self.header_path})")
+        return len(self)
+
+    @property
+    def refresh_due(self) -> bool:
+        """True jika refresh() berikutnya akan sync ke disk (refresh_interval sudah lewat)"""
+        return time.monotonic() - self._last_refresh >= self.refresh_interval
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Publish ulang jika store diubah di luar SharedGallery (misal migrate / CLI)
+
+        Register lewat SharedGallery sudah langsung terlihat di semua process,
+        jadi cek ini hanya membandingkan version store dengan segment.
+
+        Returns:
+            True jika segment di-publish ulang
+        """
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return False
+        self._last_refresh = now
+        self._open_header()
+        self.store.sync()
+        self.store.drain_changes()
+        if self.store.version == int(self._header[_STORE_VERSION]):
+            return False
+        with self._write_lock():
+            self.store.sync(force=True)
+            self.store.drain_changes()
+            if self.store.version == int(self._header[_STORE_VERSION]):
+                return False
+            self._publish_all()
+        logger.info(f"✓ Shared gallery re-published from store: {len(self)} embeddings")
+        return True
+
+    def _publish_all(self):
+        """Tulis ulang seluruh segment dari store (generation baru)"""
+        ids, matrix = self.store.live_items()
+        n = len(ids)
+        dim = matrix.shape[1] if n else int(self.store.dim or 0)
+        capacity = max(self._INITIAL_CAPACITY, n + n // 4) if dim else 0
+        generation = self._new_generation(capacity, dim)
+        data_ids, data_matrix = self._segment_views(generation, capacity, dim)
+        if n:
+            encoded = [self._encode_id(employee_id) for employee_id in ids]
+            data_ids[:n] = encoded
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            data_matrix[:n] = matrix / np.where(norms > 0, norms, 1.0)
+        del data_ids, data_matrix
+
+        header = self._header
+        old_generation = int(header[_GENERATION]) if int(header[_MAGIC]) == MAGIC else None
+        with self._seqlock():
+            header[_MAGIC] = np.uint64(MAGIC)
+            header[_ID_WIDTH] = np.uint64(ID_WIDTH)
+            header[_DIM] = np.uint64(dim)
+            header[_CAPACITY] = np.uint64(capacity)
+            header[_SIZE] = np.uint64(n)
+            header[_GENERATION] = np.uint64(generation)
+            header[_STORE_VERSION] = np.uint64(self.store.version)
+        self._map_generation(generation)
+        self._rows = {employee_id: i for i, employee_id in enumerate(ids)}
+        self._rows_version = int(header[_VERSION])
+        if old_generation is not None and old_generation != generation:
+            self._remove_segment(old_generation)
+
+    def _new_generation(self, capacity: int, dim: int) -> int:
+        header = self._header
+        generation = int(header[_GENERATION]) + 1 if int(header[_MAGIC]) == MAGIC else 1
+        length = self._ids_bytes(capacity, ID_WIDTH) + capacity * dim * 4
+        if length:
+            with open(self._segment_path(generation), "wb") as f:
+                f.truncate(length)
+        return generation
+
+    def _segment_views(self, generation: int, capacity: int, dim: int):
+        if capacity == 0:
+            return np.empty(0, dtype=f"S{ID_WIDTH}"), np.zeros((0, dim), dtype=np.float32)
+        ids_bytes = self._ids_bytes(capacity, ID_WIDTH)
+        ids = np.memmap(self._segment_path(generation), dtype=f"S{ID_WIDTH}", mode="r+", shape=(capacity,))
+        matrix = np.memmap(self._segment_path(generation), dtype=np.float32, mode="r+",
+                           offset=ids_bytes, shape=(capacity, dim))
+        return ids, matrix
+
+    def _remove_segment(self, generation: int):
+        try:
+            self._segment_path(generation).unlink()
+        except OSError:
+            pass  # Windows: file masih di-map process lain
+
+    @staticmethod
+    def _encode_id(employee_id: str) -> bytes:
+        encoded = employee_id.encode("utf-8")
+        if not encoded or len(encoded) > ID_WIDTH or b"\0" in encoded:
+            raise ValueError(f"Invalid employee_id for shared gallery: {employee_id!r}")
+        return encoded
+
+    # ============================
+    # Mutations (writer)
+    # ============================
+    def _row_index(self) -> Dict[str, int]:
+        """employee_id -> row, dibangun ulang jika segment diubah process lain"""
+        header = self._header
+        if self._rows_version != int(header[_VERSION]):
+            self._map_generation(int(header[_GENERATION]))
+            size = int(header[_SIZE])
+            self._rows = {self._ids[i].decode("utf-8"): i for i in range(size)}
+            self._rows_version = int(header[_VERSION])
+        return self._rows
+
+    def _grow(self, needed: int, dim: int):
+        header = self._header
+        capacity = int(header[_CAPACITY])
+        if needed <= capacity and int(header[_DIM]) == dim:
+            return
+        size = int(header[_SIZE])
+        new_capacity = max(needed, capacity * 2, self._INITIAL_CAPACITY)
+        generation = self._new_generation(new_capacity, dim)
+        data_ids, data_matrix = self._segment_views(generation, new_capacity, dim)
+        if size:
+            data_ids[:size] = self._ids[:size]
+            data_matrix[:size] = self._matrix[:size]
+        del data_ids, data_matrix
+        old_generation = int(header[_GENERATION])
+        with self._seqlock():
+            header[_DIM] = np.uint64(dim)
+            header[_CAPACITY] = np.uint64(new_capacity)
+            header[_GENERATION] = np.uint64(generation)
+        self._map_generation(generation)
+        self._rows_version = int(header[_VERSION])
+        self._remove_segment(old_generation)
+
+    def _upsert(self, employee_id: str, vec: np.ndarray):
+        header = self._header
+        rows = self._row_index()
+        row = rows.get(employee_id)
+        if row is None:
+            size = int(header[_SIZE])
+            self._grow(size + 1, vec.shape[0])
+            with self._seqlock():
+                self._ids[size] = self._encode_id(employee_id)
+                self._matrix[size] = vec
+                header[_SIZE] = np.uint64(size + 1)
+                header[_STORE_VERSION] = np.uint64(self.store.version)
+            rows[employee_id] = size
+        else:
+            with self._seqlock():
+                self._matrix[row] = vec
+                header[_STORE_VERSION] = np.uint64(self.store.version)
+        self._rows_version = int(header[_VERSION])
+
+    def _remove(self, employee_id: str):
+        header = self._header
+        rows = self._row_index()
+        row = rows.pop(employee_id, None)
+        with self._seqlock():
+            if row is not None:
+                # Swap dengan row terakhir supaya matrix tetap rapat
+                last = int(header[_SIZE]) - 1
+                if row != last:
+                    self._ids[row] = self._ids[last]
+                    self._matrix[row] = self._matrix[last]
+                    rows[self._ids[row].decode("utf-8")] = row
+                header[_SIZE] = np.uint64(last)
+            header[_STORE_VERSION] = np.uint64(self.store.version)
+        self._rows_version = int(header[_VERSION])
+
+    def _catch_up(self):
+        """Publish ulang jika segment tertinggal dari store (dipanggil di dalam _write_lock)"""
+        self.store.sync(force=True)
+        self.store.drain_changes()
+        if self.store.version != int(self._header[_STORE_VERSION]) or int(self._header[_MAGIC]) != MAGIC:
+            self._publish_all()
+
+    def _write_store(self, write: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Jalankan write ke store; return (hasil, True) jika hanya write ini yang
+        terjadi sejak publish terakhir (boleh update incremental)
+        """
+        self._catch_up()
+        before = self.store.version
+        result = write()
+        self.store.drain_changes()
+        return result, self.store.version <= before + 1
+
+    def _register(self, employee_id: str, embedding: np.ndarray, vec: np.ndarray):
+        _, incremental = self._write_store(lambda: self.store.put(employee_id, embedding))
+        if incremental:
+            self._upsert(employee_id, vec)
+        else:
+            self._publish_all()
+
+    def _delete(self, employee_id: str) -> bool:
+        found, incremental = self._write_store(lambda: self.store.delete(employee_id))
+        if incremental:
+            self._remove(employee_id)
+        else:
+            self._publish_all()
+        return found
+
+    def register(self, employee_id: str, embedding: np.ndarray):
+        """Simpan embedding ke store (commit atomic) lalu publish ke segment"""
+        vec = normalize_embedding(embedding)
+        self._encode_id(employee_id)
+        with self._write_lock():
+            self._register(employee_id, embedding, vec)
+
+    def delete(self, employee_id: str) -> bool:
+        """
+        Hapus embedding dari store dan segment
+
+        Returns:
+            True jika employee_id terdaftar
+        """
+        with self._write_lock():
+            return self._delete(employee_id)
+
+    def register_template(self,
+                          employee_id: str,
+                          embedding: np.ndarray,
+                          max_templates: int = 1,
+                          policy: str = "nearest",
+                          replace: bool = False) -> Tuple[str, int]:
+        """
+        Tambah template untuk employee_id (lihat EmbeddingGallery.register_template)
+
+        Pemilihan slot dan penulisan terjadi di bawah lock antar process, jadi
+        dua worker yang mendaftarkan karyawan yang sama tidak menulis slot yang sama.
+
+        Returns:
+            Tuple (key template yang ditulis, jumlah template karyawan sekarang)
+        """
+        vec = normalize_embedding(embedding)
+        with self._write_lock():
+            self._catch_up()
+            key, stale = plan_template(self.templates(employee_id), employee_id, vec,
+                                       max_templates, policy, replace)
+            self._encode_id(key)
+            self._register(key, embedding, vec)
+            for stale_key in stale:
+                self._delete(stale_key)
+            return key, len(self.templates(employee_id))
+
+    def delete_templates(self, employee_id: str) -> bool:
+        """
+        Hapus semua template employee_id
+
+        Returns:
+            True jika employee_id terdaftar
+        """
+        with self._write_lock():
+            self._catch_up()
+            found = self._delete(employee_id)
+            for key in self.templates(employee_id):
+                found = self._delete(key) or found
+            return found
+
+    def close(self):
+        """Lepas mapping di process ini (segment tetap ada untuk process lain)"""
+        with self._lock:
+            self._header = None
+            self._header_mmap = None
+            self._data_mmap = None
+            self._mapped = (-1, 0, 0)
+            self._ids = np.empty(0, dtype=f"S{ID_WIDTH}")
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
@@ -0,0 +1,215 @@
+"""
+Multi-Template Enrollment
+Satu karyawan boleh punya beberapa template embedding (foto register dengan
+pencahayaan / sudut / kacamata berbeda). Setiap template disimpan sebagai row
+biasa di store dan gallery dengan key template:
+
+    slot 0   -> "<employee_id>"       (sama dengan format lama, data lama = slot 0)
+    slot n   -> "<employee_id>#<n>"
+
+Matching tetap satu matrix product ke semua row, lalu score di-reduce per
+pemilik (owner): max similarity antar template, atau centroid (mean template,
+re-normalized) untuk ranking lalu re-rank shortlist dengan max.
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+TEMPLATE_SEPARATOR = "#"
+
+TEMPLATE_SCORING_MODES = ("max", "centroid")
+TEMPLATE_REPLACE_POLICIES = ("nearest", "outlier")
+
+
+def template_key(employee_id: str, slot: int = 0) -> str:
+    """Key row gallery untuk template ke-slot milik employee_id"""
+    return employee_id if slot == 0 else f"{employee_id}{TEMPLATE_SEPARATOR}{slot}"
+
+
+def template_owner(key: str) -> str:
+    """employee_id pemilik key template (key tanpa suffix #<angka> = slot 0)"""
+    owner, sep, slot = key.rpartition(TEMPLATE_SEPARATOR)
+    return owner if sep and owner and slot.isdigit() else key
+
+
+def template_slot(key: str) -> int:
+    """Slot dari key template"""
+    owner, sep, slot = key.rpartition(TEMPLATE_SEPARATOR)
+    return int(slot) if sep and owner and slot.isdigit() else 0
+
+
+class TemplateIndex(NamedTuple):
+    """
+    Pemetaan row gallery -> owner untuk satu version gallery
+
+    Jika setiap owner hanya punya satu template, order None dan owner_ids
+    sejajar dengan row (reduce dilewati sama sekali).
+    """
+    owner_ids: np.ndarray               # (M,) employee_id
+    order: Optional[np.ndarray]         # (N,) row dikelompokkan per owner
+    starts: Optional[np.ndarray]        # (M,) awal grup owner di order
+    centroid_norms: Optional[np.ndarray]  # (M,) norm jumlah template per owner
+
+    @property
+    def grouped(self) -> bool:
+        return self.order is not None
+
+
+def build_template_index(ids, matrix: np.ndarray) -> TemplateIndex:
+    """
+    Kelompokkan row per owner (loop Python O(N); gallery lokal memakai index_from_codes
+    dengan code owner yang di-maintain incremental)
+
+    Args:
+        ids: Key template per row (array / _IdView), shape (N,)
+        matrix: Embeddings normalized, shape (N, D)
+    """
+    n = len(ids)
+    codes = np.empty(n, dtype=np.int64)
+    owner_codes: Dict[str, int] = {}
+    owners: List[str] = []
+    for i in range(n):
+        owner = template_owner(str(ids[i]))
+        code = owner_codes.get(owner)
+        if code is None:
+            code = owner_codes[owner] = len(owners)
+            owners.append(owner)
+        codes[i] = code
+    return index_from_codes(codes, np.array(owners, dtype=object), matrix)
+
+
+def owner_codes_from_bytes(ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Code owner per row dari key template fixed-width bytes (kolom id SharedGallery),
+    vectorized tanpa loop Python per row
+
+    Returns:
+        Tuple (codes (N,), owner_ids (M,) object array employee_id per code)
+    """
+    if ids.shape[0] == 0:
+        return np.zeros(0, dtype=np.int64), np.empty(0, dtype=object)
+    head, sep, slot = np.char.rpartition(ids, TEMPLATE_SEPARATOR.encode()).T
+    is_template = (sep != b"") & (head != b"") & np.char.isdigit(slot)
+    owners, codes = np.unique(np.where(is_template, head, ids), return_inverse=True)
+    return codes.astype(np.int64).ravel(), np.char.decode(owners, "utf-8").astype(object)
+
+
+def centroid_norms_from_codes(codes: np.ndarray, n_owners: int, matrix: np.ndarray) -> np.ndarray:
+    """
+    Norm jumlah template per code owner (code tanpa row -> 0)
+
+    Dijumlah per posisi dalam grup (maks template per owner kecil): np.add.reduceat
+    di axis 0 untuk matrix (N, 512) jauh lebih lambat.
+    """
+    counts = np.bincount(codes, minlength=n_owners)
+    sums = np.zeros((n_owners, matrix.shape[1]), dtype=np.float32)
+    if codes.shape[0] == 0:
+        return np.zeros(n_owners, dtype=np.float32)
+    order = np.argsort(codes, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    for j in range(int(counts.max())):
+        owners = np.flatnonzero(counts > j)
+        sums[owners] += matrix[order[starts[owners] + j]]
+    return np.linalg.norm(sums, axis=1)
+
+
+def index_from_codes(codes: np.ndarray, owner_ids: np.ndarray, matrix: np.ndarray,
+                     centroid_norms: Optional[np.ndarray] = None) -> TemplateIndex:
+    """
+    TemplateIndex dari code owner per row (numpy saja, tanpa loop Python per row)
+
+    Args:
+        codes: Code owner per row, shape (N,)
+        owner_ids: employee_id per code (boleh berisi code yang tidak dipakai row mana pun)
+        matrix: Embeddings normalized, shape (N, D)
+        centroid_norms: Norm jumlah template per code jika sudah di-maintain pemanggil
+    """
+    n = codes.shape[0]
+    counts = np.bincount(codes, minlength=len(owner_ids))
+    live = np.flatnonzero(counts)
+    if live.size == n:
+        return TemplateIndex(owner_ids[codes], None, None, None)
+
+    remap = np.zeros(len(owner_ids), dtype=np.int64)
+    remap[live] = np.arange(live.size)
+    order = np.argsort(remap[codes], kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts[live])[:-1]))
+    if centroid_norms is None:
+        centroid_norms = centroid_norms_from_codes(codes, len(owner_ids), matrix)
+    norms = np.asarray(centroid_norms, dtype=np.float32)[live]
+    return TemplateIndex(owner_ids[live], order, starts, np.where(norms > 0, norms, 1.0))
+
+
+def reduce_scores(scores: np.ndarray, index: TemplateIndex):
+    """
+    Reduce score per row (B, N) menjadi score per owner
+
+    Returns:
+        Tuple (best, centroid) shape (B, M): max similarity antar template dan
+        similarity ke centroid owner (centroid None jika tidak ada owner multi-template)
+    """
+    if not index.grouped:
+        return scores, None
+    grouped = scores[:, index.order]
+    best = np.maximum.reduceat(grouped, index.starts, axis=1)
+    # q . sum(t) / |sum(t)| = cosine ke centroid tanpa perlu matrix centroid terpisah
+    centroid = np.add.reduceat(grouped, index.starts, axis=1) / index.centroid_norms
+    return best, centroid
+
+
+def choose_replacement(templates: Dict[str, np.ndarray], embedding: np.ndarray, policy: str = "nearest") -> str:
+    """
+    Template yang diganti saat jumlah template owner sudah maksimum
+
+    Args:
+        templates: {key: embedding normalized} milik satu owner
+        embedding: Template baru (normalized)
+        policy: "nearest" = ganti template paling mirip dengan template baru
+                (paling redundant, variasi kondisi tetap terjaga);
+                "outlier" = ganti template paling jauh dari centroid owner
+
+    Returns:
+        Key template yang diganti
+    """
+    keys = list(templates)
+    matrix = np.stack([templates[key] for key in keys])
+    if policy == "nearest":
+        scores = matrix @ embedding
+        return keys[int(np.argmax(scores))]
+    if policy == "outlier":
+        scores = matrix @ matrix.sum(axis=0)
+        return keys[int(np.argmin(scores))]
+    raise ValueError(f"Unknown template replace policy: {policy}")
+
+
+def plan_template(existing: Dict[str, np.ndarray],
+                  employee_id: str,
+                  embedding: np.ndarray,
+                  max_templates: int = 1,
+                  policy: str = "nearest",
+                  replace: bool = False) -> Tuple[str, List[str]]:
+    """
+    Tentukan key template yang ditulis untuk enrollment baru
+
+    Args:
+        existing: Template owner yang sudah ada {key: embedding normalized}
+        employee_id: ID karyawan
+        embedding: Template baru (normalized)
+        max_templates: Maks template per karyawan
+        policy: Policy penggantian saat penuh
+        replace: Template baru menggantikan semua template lama
+
+    Returns:
+        Tuple (key yang ditulis, key lama yang harus dihapus)
+    """
+    if replace:
+        key = template_key(employee_id, 0)
+        return key, [stale for stale in existing if stale != key]
+    if len(existing) < max_templates:
+        used = {template_slot(key) for key in existing}
+        slot = next(slot for slot in range(max_templates) if slot not in used)
+        return template_key(employee_id, slot), []
+    key = choose_replacement(existing, embedding, policy)
+    # max_templates diturunkan setelah enrollment: buang kelebihan slot tertinggi
+    others = sorted((other for other in existing if other != key), key=template_slot)
+    return key, others[max(max_templates, 1) - 1:]
@@ -0,0 +1,25 @@
+"""
+Fixture pytest bersama
+
+Jalankan dari folder api/:
+    python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Module api/ di-import flat (from gallery import ...), sama seperti main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def unit(vector) -> np.ndarray:
+    """Vector float32 normalized"""
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
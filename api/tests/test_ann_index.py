@@ -0,0 +1,160 @@
+"""
+IVFIndex: recall terhadap exact search, update incremental lewat listener
+gallery, persist + reconcile saat start ulang
+"""
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex, assign_clusters, spherical_kmeans
+from conftest import unit
+from gallery import EmbeddingGallery
+from matching import MatchingEngine
+
+DIM = 16
+
+
+def clustered(rng, n, clusters=12, noise=0.15):
+    """Embedding ber-cluster (seperti beberapa foto per orang mirip satu sama lain)"""
+    centers = np.stack([unit(rng.standard_normal(DIM)) for _ in range(clusters)])
+    rows = centers[rng.integers(clusters, size=n)] + noise * rng.standard_normal((n, DIM))
+    return (rows / np.linalg.norm(rows, axis=1, keepdims=True)).astype(np.float32)
+
+
+def filled_gallery(path, vectors):
+    gallery = EmbeddingGallery(str(path), read_legacy_pickles=False)
+    gallery.load()
+    for i, vector in enumerate(vectors):
+        gallery.upsert(f"emp{i}", vector)
+    return gallery
+
+
+def assert_same(result, expected):
+    assert [c for c, _ in result.candidates] == [c for c, _ in expected.candidates]
+    np.testing.assert_allclose([s for _, s in result.candidates], [s for _, s in expected.candidates], atol=1e-5)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.01)
+
+
+def test_spherical_kmeans_centroids_are_unit(rng):
+    data = clustered(rng, 300)
+    centroids = spherical_kmeans(data, 8)
+    assert centroids.shape == (8, DIM)
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+    assign = assign_clusters(data, centroids)
+    assert assign.shape == (300,) and assign.max() < 8
+
+
+def test_full_probe_equals_exact_search(tmp_path, rng):
+    gallery = filled_gallery(tmp_path, clustered(rng, 400))
+    index = IVFIndex(nlist=8, nprobe=8, min_size=100)
+    index.attach(gallery)
+    assert index.ready and len(index) == 400
+
+    exact = MatchingEngine(gallery, 0.5)
+    ann = MatchingEngine(gallery, 0.5, index=index)
+    for query in clustered(rng, 20):
+        assert_same(ann.search(query, k=5), exact.search(query, k=5))
+
+
+def test_recall_with_few_probes(tmp_path, rng):
+    gallery = filled_gallery(tmp_path, clustered(rng, 1000))
+    index = IVFIndex(nlist=16, nprobe=4, min_size=100)
+    index.attach(gallery)
+
+    exact = MatchingEngine(gallery, 0.5)
+    ann = MatchingEngine(gallery, 0.5, index=index)
+    queries = clustered(rng, 100, noise=0.05)
+    hits = sum(ann.search(q, k=1).best[0] == exact.search(q, k=1).best[0] for q in queries)
+    assert hits / len(queries) >= 0.9
+
+
+def test_gallery_changes_reach_index(tmp_path, rng):
+    vectors = clustered(rng, 200)
+    gallery = filled_gallery(tmp_path, vectors)
+    index = IVFIndex(nlist=8, nprobe=8, min_size=100)
+    index.attach(gallery)
+    engine = MatchingEngine(gallery, 0.5, index=index)
+
+    new = unit(rng.standard_normal(DIM))
+    gallery.upsert("new", new)
+    assert len(index) == 201 and engine.search(new, k=1).best[0] == "new"
+
+    gallery.upsert("emp3", -vectors[3])  # Re-register: vector lama diganti
+    assert len(index) == 201 and engine.search(-vectors[3], k=1).best[0] == "emp3"
+
+    gallery.remove("new")
+    assert len(index) == 200
+    assert all(candidate != "new" for candidate, _ in engine.search(new, k=10).candidates)
+
+
+def test_below_min_size_uses_exact_search(tmp_path, rng):
+    gallery = filled_gallery(tmp_path, clustered(rng, 50))
+    index = IVFIndex(nlist=4, nprobe=4, min_size=100)
+    index.attach(gallery)
+    engine = MatchingEngine(gallery, 0.5, index=index)
+    assert not index.ready and not engine.use_index
+
+    vectors = clustered(rng, 60)
+    for i, vector in enumerate(vectors):
+        gallery.upsert(f"late{i}", vector)
+    wait_for(lambda: index.ready)
+    assert engine.use_index
+    assert engine.search(vectors[5], k=1).best[0] == "late5"
+
+
+def test_persist_and_reconcile_on_restart(tmp_path, rng):
+    vectors = clustered(rng, 300)
+    path = tmp_path / "ann_index.npz"
+    gallery = filled_gallery(tmp_path / "embeddings", vectors)
+    index = IVFIndex(path=str(path), nlist=8, nprobe=8, min_size=100)
+    index.attach(gallery)
+    assert path.exists()
+    centroids = index.centroids.copy()
+
+    # Gallery berubah selagi index di disk tidak ikut tersimpan
+    gallery.remove("emp0")
+    gallery.upsert("emp1", -vectors[1])
+    extra = unit(rng.standard_normal(DIM))
+    gallery.upsert("extra", extra)
+
+    restarted = IVFIndex(path=str(path), nlist=8, nprobe=8, min_size=100)
+    restarted.attach(gallery)
+    np.testing.assert_array_equal(restarted.centroids, centroids)  # Di-load, bukan train ulang
+    assert len(restarted) == len(gallery)
+
+    exact = MatchingEngine(gallery, 0.5)
+    ann = MatchingEngine(gallery, 0.5, index=restarted)
+    for query in (vectors[0], -vectors[1], extra):
+        assert_same(ann.search(query, k=3), exact.search(query, k=3))
+
+
+def test_ivf_retrains_on_growth_and_drops_below_min_size(tmp_path, rng):
+    gallery = EmbeddingGallery(str(tmp_path), read_legacy_pickles=False)
+    gallery.load()
+    vectors = {f"emp{i}": unit(rng.standard_normal(DIM)) for i in range(130)}
+    for employee_id, vector in list(vectors.items())[:60]:
+        gallery.register(employee_id, vector)
+
+    index = IVFIndex(nlist=4, nprobe=4, min_size=50)
+    index.attach(gallery)
+    engine = MatchingEngine(gallery, 0.5, index=index)
+    assert index.ready and index.trained_size == 60
+
+    # Gallery > 2x ukuran saat train: retrain di background, perubahan selama train tidak hilang
+    for employee_id, vector in list(vectors.items())[60:]:
+        gallery.register(employee_id, vector)
+    wait_for(lambda: index.trained_size > 120 and index._pending is None)
+    assert len(index) == len(gallery) == 130
+    assert engine.search(vectors["emp125"]).best[0] == "emp125"
+
+    # Di bawah min_size: index dilepas, matching exact
+    for i in range(90):
+        gallery.delete(f"emp{i}")
+    assert not index.ready and not engine.use_index
+    assert engine.search(vectors["emp100"]).best[0] == "emp100"
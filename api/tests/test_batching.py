@@ -0,0 +1,87 @@
+"""
+MicroBatcher: item dari banyak thread digabung jadi satu batched call
+"""
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher
+from metrics import BATCH_FILL, BATCH_QUEUE_DELAY_SECONDS, metrics
+
+
+def test_concurrent_items_share_a_batch():
+    calls = []
+    batcher = MicroBatcher(lambda items: calls.append(list(items)) or [x * 2 for x in items],
+                           max_batch_size=4, max_wait_ms=200)
+    try:
+        assert batcher.run_many([1, 2, 3, 4, 5, 6]) == [2, 4, 6, 8, 10, 12]
+    finally:
+        batcher.close()
+
+    assert [len(batch) for batch in calls] == [4, 2]
+    stats = batcher.stats()
+    assert stats["batches"] == 2 and stats["items"] == 6
+    assert stats["batch_size_histogram"] == {"2": 1, "4": 1}
+    assert stats["avg_batch_fill"] == pytest.approx(6 / 8)
+
+
+def test_results_go_back_to_each_caller():
+    batcher = MicroBatcher(lambda items: [x + 100 for x in items], max_batch_size=8, max_wait_ms=20)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.run(i)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+    finally:
+        batcher.close()
+    assert results == {i: i + 100 for i in range(16)}
+    assert batcher.stats()["batches"] < 16
+
+
+def test_lone_item_waits_at_most_max_wait():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=8, max_wait_ms=20)
+    try:
+        started = time.perf_counter()
+        assert batcher.run("x") == "x"
+        elapsed = time.perf_counter() - started
+    finally:
+        batcher.close()
+    assert elapsed < 1.0
+    stats = batcher.stats()
+    assert stats["max_queue_delay_ms"] >= 15 and stats["avg_batch_size"] == 1
+
+
+def test_batch_error_reaches_every_item():
+    def fail(items):
+        raise RuntimeError("model error")
+
+    batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="model error"):
+                future.result(5)
+    finally:
+        batcher.close()
+
+
+def test_fill_and_queue_delay_exported_to_metrics():
+    name = "test-metrics-batcher"
+    batcher = MicroBatcher(lambda items: items, max_batch_size=4, max_wait_ms=200, name=name)
+    try:
+        batcher.run_many([1, 2, 3, 4, 5, 6])
+    finally:
+        batcher.close()
+
+    assert BATCH_FILL.snapshot(name) == {"count": 2, "sum": pytest.approx(1.5)}  # Batch 4 + 2 item
+    assert BATCH_QUEUE_DELAY_SECONDS.snapshot(name)["count"] == 6
+    rendered = metrics.render()
+    assert f'face_api_batch_fill_bucket{{batcher="{name}",le="0.5"}} 1' in rendered
+    assert f'face_api_batch_queue_delay_seconds_count{{batcher="{name}"}} 6' in rendered
@@ -0,0 +1,198 @@
+"""
+EmbeddingStore: put / delete / compact / reopen dan crash safety
+"""
+import json
+
+import numpy as np
+import pytest
+
+from embedding_store import MANIFEST_NAME, EmbeddingStore
+
+
+def vec(value: float, dim: int = 4) -> np.ndarray:
+    return np.full(dim, value, dtype=np.float32)
+
+
+def reopen(store: EmbeddingStore) -> EmbeddingStore:
+    reopened = EmbeddingStore(str(store.root))
+    reopened.sync(force=True)
+    return reopened
+
+
+def test_put_get_and_reopen(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.sync()
+    assert not store.exists() and len(store) == 0
+
+    store.put("emp1", vec(1.0))
+    store.put("emp2", vec(2.0))
+
+    assert store.dim == 4 and len(store) == 2 and "emp1" in store
+    np.testing.assert_array_equal(store.get("emp2"), vec(2.0))
+
+    reopened = reopen(store)
+    assert reopened.version == store.version
+    ids, matrix = reopened.live_items()
+    assert dict(zip(ids, matrix.tolist())) == {"emp1": vec(1.0).tolist(), "emp2": vec(2.0).tolist()}
+
+
+def test_replace_keeps_latest_row(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("emp1", vec(1.0))
+    store.put("emp1", vec(3.0))
+
+    assert len(store) == 1
+    np.testing.assert_array_equal(store.get("emp1"), vec(3.0))
+    np.testing.assert_array_equal(reopen(store).get("emp1"), vec(3.0))
+
+
+def test_delete(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("emp1", vec(1.0))
+    store.put("emp2", vec(2.0))
+
+    assert store.delete("emp1") is True
+    assert store.delete("emp1") is False
+    assert "emp1" not in store and store.get("emp1") is None
+
+    reopened = reopen(store)
+    assert "emp1" not in reopened and len(reopened) == 1
+
+
+def test_put_many_is_one_commit(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("emp1", vec(1.0))
+    version = store.version
+
+    store.put_many([("emp1", vec(4.0)), ("emp2", vec(2.0)), ("emp2", vec(5.0))])
+
+    assert store.version == version + 1
+    assert sorted(store.live_items()[0]) == ["emp1", "emp2"]
+    np.testing.assert_array_equal(store.get("emp1"), vec(4.0))
+    np.testing.assert_array_equal(store.get("emp2"), vec(5.0))  # Duplikat: yang terakhir
+
+
+def test_put_many_with_delete_is_one_commit(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many([("emp1", vec(1.0)), ("emp1#1", vec(1.5))])
+    version = store.version
+
+    store.put_many([("emp1", vec(4.0)), ("emp2", vec(2.0)), ("emp2", vec(5.0))], delete=["emp1#1", "emp1"])
+
+    assert store.version == version + 1
+    assert sorted(store.live_items()[0]) == ["emp1", "emp2"]
+    np.testing.assert_array_equal(store.get("emp1"), vec(4.0))  # Item menang atas delete
+    np.testing.assert_array_equal(store.get("emp2"), vec(5.0))  # Duplikat: yang terakhir
+
+
+def test_compact_rewrites_live_rows_and_removes_old_generation(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    for i in range(10):
+        store.put(f"emp{i}", vec(i))
+    for i in range(5):
+        store.delete(f"emp{i}")
+
+    store.compact()
+
+    manifest = store.manifest
+    assert manifest["generation"] == 1
+    assert manifest["rows"] == 5 and manifest["tombstones"] == 0
+    assert not (tmp_path / "embeddings.0.f32").exists()
+    assert (tmp_path / "embeddings.1.f32").stat().st_size == 5 * 4 * 4
+
+    reopened = reopen(store)
+    assert sorted(reopened.live_items()[0]) == [f"emp{i}" for i in range(5, 10)]
+    np.testing.assert_array_equal(reopened.get("emp7"), vec(7))
+
+    # Write setelah compaction lanjut di generation baru
+    reopened.put("emp0", vec(0.5))
+    np.testing.assert_array_equal(reopen(store).get("emp0"), vec(0.5))
+
+
+def test_auto_compact_when_mostly_dead(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    for _ in range(EmbeddingStore.COMPACT_MIN_ROWS):
+        store.put("emp1", vec(1.0))
+
+    assert store.manifest["generation"] >= 1
+    assert store.manifest["rows"] < EmbeddingStore.COMPACT_MIN_ROWS
+    np.testing.assert_array_equal(store.get("emp1"), vec(1.0))
+
+
+def test_uncommitted_tail_is_ignored_then_truncated(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("emp1", vec(1.0))
+
+    # Crash di tengah write: data sudah di-append, manifest belum di-commit
+    with open(tmp_path / "embeddings.0.f32", "ab") as f:
+        f.write(vec(9.0).tobytes())
+    with open(tmp_path / "ids.0.txt", "ab") as f:
+        f.write(b"ghost\n")
+
+    reopened = reopen(store)
+    assert reopened.live_items()[0] == ["emp1"]
+
+    reopened.put("emp2", vec(2.0))
+    again = reopen(store)
+    assert sorted(again.live_items()[0]) == ["emp1", "emp2"]
+    np.testing.assert_array_equal(again.get("emp2"), vec(2.0))
+    assert (tmp_path / "ids.0.txt").read_bytes() == b"emp1\nemp2\n"
+
+
+def test_sync_reports_changes_from_other_instance(tmp_path):
+    writer = EmbeddingStore(str(tmp_path))
+    writer.put("emp1", vec(1.0))
+    reader = reopen(writer)
+
+    writer.put("emp2", vec(2.0))
+    writer.delete("emp1")
+
+    assert reader.sync(force=True) == {"emp1", "emp2"}
+    assert reader.live_items()[0] == ["emp2"]
+
+    writer.compact()
+    assert reader.sync(force=True) is None  # Generation baru: reload penuh
+    assert reader.live_items()[0] == ["emp2"]
+
+
+def test_sync_survives_compaction_after_stale_manifest_read(tmp_path):
+    writer = EmbeddingStore(str(tmp_path))
+    writer.put("emp1", vec(1.0))
+    reader = reopen(writer)
+    writer.put("emp2", vec(2.0))
+    writer.delete("emp1")
+
+    # Compaction process lain selesai (file gen 0 di-unlink) tepat setelah reader membaca manifest gen 0
+    read_manifest = reader._read_manifest
+
+    def stale_read():
+        manifest = read_manifest()
+        if manifest["generation"] == 0:
+            writer.compact()
+        return manifest
+
+    reader._read_manifest = stale_read
+    assert reader.sync(force=True) is None
+    assert reader.manifest["generation"] == 1
+    assert reader.live_items()[0] == ["emp2"]
+    np.testing.assert_array_equal(reader.get("emp2"), vec(2.0))
+
+
+def test_rejects_invalid_id_and_dim(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("emp1", vec(1.0))
+
+    with pytest.raises(ValueError):
+        store.put("bad\nid", vec(1.0))
+    with pytest.raises(ValueError):
+        store.put("emp2", vec(1.0, dim=8))
+    assert store.live_items()[0] == ["emp1"]
+
+
+def test_manifest_is_plain_json(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put("emp1", vec(1.0))
+
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text())
+    assert manifest["rows"] == 1 and manifest["dim"] == 4
+    assert not list(tmp_path.glob("*.tmp"))
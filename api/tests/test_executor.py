@@ -0,0 +1,70 @@
+"""
+InferenceExecutor: kerja blocking di thread pool, antrian terbatas (backpressure)
+"""
+import asyncio
+import threading
+
+import pytest
+
+from executor import ExecutorOverloaded, InferenceExecutor
+
+
+def test_run_returns_result_off_the_event_loop():
+    executor = InferenceExecutor(max_workers=2)
+
+    async def main():
+        loop_thread = threading.get_ident()
+        result = await executor.run(lambda a, b=0: (a + b, threading.get_ident()), 1, b=2)
+        return loop_thread, result
+
+    try:
+        loop_thread, (value, worker_thread) = asyncio.run(main())
+    finally:
+        executor.shutdown()
+    assert value == 3 and worker_thread != loop_thread
+    assert executor.stats()["completed"] == 1
+
+
+def test_exception_propagates_to_caller():
+    executor = InferenceExecutor(max_workers=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    try:
+        with pytest.raises(RuntimeError, match="boom"):
+            asyncio.run(executor.run(fail))
+    finally:
+        executor.shutdown()
+    stats = executor.stats()
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0 and stats["completed"] == 1
+
+
+def test_rejects_when_queue_is_full():
+    executor = InferenceExecutor(max_workers=1, max_queue=2)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    async def main():
+        running = asyncio.ensure_future(executor.run(blocking))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        queued = [asyncio.ensure_future(executor.run(lambda: "queued")) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert executor.queue_depth == 2 and executor.in_flight == 1
+        with pytest.raises(ExecutorOverloaded):
+            await executor.run(lambda: "rejected")
+        release.set()
+        return await asyncio.gather(running, *queued)
+
+    try:
+        assert asyncio.run(main()) == ["done", "queued", "queued"]
+    finally:
+        release.set()
+        executor.shutdown()
+    stats = executor.stats()
+    assert stats["rejected"] == 1 and stats["max_queue_depth"] == 2 and stats["completed"] == 3
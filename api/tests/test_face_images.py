@@ -0,0 +1,79 @@
+"""
+FaceImageWriter: foto register ditulis di background (original / thumbnail)
+"""
+import cv2
+import numpy as np
+import pytest
+
+from face_images import FaceImageWriter, face_thumbnail
+
+
+def jpeg(width: int, height: int) -> bytes:
+    image = np.full((height, width, 3), 80, dtype=np.uint8)
+    ok, data = cv2.imencode(".jpg", image)
+    assert ok
+    return data.tobytes()
+
+
+@pytest.fixture
+def writer_factory():
+    writers = []
+
+    def make(**kwargs):
+        writer = FaceImageWriter(**kwargs)
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer.close()
+
+
+def test_original_mode_writes_upload_bytes(tmp_path, writer_factory):
+    writer = writer_factory()
+    content = jpeg(64, 48)
+    path = writer.submit(tmp_path / "emp1.png", content, [0, 0, 10, 10])
+    writer.flush()
+
+    assert path == tmp_path / "emp1.png"
+    assert path.read_bytes() == content
+    assert not list(tmp_path.glob(".*.tmp"))
+    stats = writer.stats()
+    assert stats["written"] == 1 and stats["bytes_written"] == len(content) and stats["queue_depth"] == 0
+
+
+def test_thumbnail_mode_writes_face_crop(tmp_path, writer_factory):
+    writer = writer_factory(mode="thumbnail", thumbnail_size=64, thumbnail_margin=0.0)
+    path = writer.submit(tmp_path / "emp1.png", jpeg(1200, 900), [100, 100, 500, 300])
+    writer.flush()
+
+    assert path == tmp_path / "emp1.jpg"
+    thumbnail = cv2.imdecode(np.frombuffer(path.read_bytes(), np.uint8), cv2.IMREAD_COLOR)
+    assert thumbnail.shape[:2] == (32, 64)  # Crop 400x200 di-resize ke sisi terpanjang 64
+
+
+def test_face_thumbnail_clamps_bbox_and_never_upscales():
+    data = face_thumbnail(jpeg(100, 80), [-50, -50, 40, 30], size=160, margin=0.5)
+    thumbnail = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    assert thumbnail.shape[:2] == (75, 85)
+
+
+def test_failed_write_is_counted(tmp_path, writer_factory):
+    writer = writer_factory(mode="thumbnail")
+    writer.submit(tmp_path / "broken.jpg", b"not an image", [0, 0, 10, 10])
+    writer.flush()
+
+    assert writer.stats()["failed"] == 1 and not (tmp_path / "broken.jpg").exists()
+
+
+def test_close_drains_queue(tmp_path):
+    writer = FaceImageWriter(max_queue=2)
+    content = jpeg(32, 32)
+    paths = [writer.submit(tmp_path / f"emp{i}.jpg", content) for i in range(5)]
+    writer.close()
+    assert all(path.exists() for path in paths)
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        FaceImageWriter(mode="webp")
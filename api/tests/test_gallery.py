@@ -0,0 +1,124 @@
+"""
+EmbeddingGallery: matrix resident di memory, update in place, sync dengan disk
+"""
+import pickle
+
+import numpy as np
+import pytest
+
+from conftest import unit
+from gallery import EmbeddingGallery, normalize_embedding
+
+DIM = 8
+
+
+def write_pickle(directory, employee_id, embedding):
+    with open(directory / f"{employee_id}.pkl", "wb") as f:
+        pickle.dump(np.asarray(embedding, dtype=np.float32), f)
+
+
+def test_normalize_embedding():
+    vec = normalize_embedding([3.0, 4.0])
+    assert vec.dtype == np.float32 and np.allclose(vec, [0.6, 0.8])
+    assert np.array_equal(normalize_embedding(np.zeros(3)), np.zeros(3))
+
+
+def test_upsert_get_and_version(tmp_path, rng):
+    gallery = EmbeddingGallery(str(tmp_path))
+    embedding = rng.standard_normal(DIM)
+
+    gallery.upsert("emp1", embedding)
+    version = gallery.version
+    assert len(gallery) == 1 and "emp1" in gallery and gallery.dim == DIM
+    np.testing.assert_allclose(gallery.get("emp1"), unit(embedding), atol=1e-6)
+
+    gallery.upsert("emp1", -embedding)
+    assert len(gallery) == 1 and gallery.version > version
+    np.testing.assert_allclose(gallery.get("emp1"), -unit(embedding), atol=1e-6)
+    assert gallery.get("missing") is None
+
+    with pytest.raises(ValueError):
+        gallery.upsert("emp2", rng.standard_normal(DIM + 1))
+
+
+def test_remove_keeps_existing_snapshot(tmp_path, rng):
+    gallery = EmbeddingGallery(str(tmp_path))
+    for i in range(3):
+        gallery.upsert(f"emp{i}", rng.standard_normal(DIM))
+    ids, matrix = gallery.snapshot()
+    before = matrix.copy()
+
+    assert gallery.remove("emp0") is True
+    assert gallery.remove("emp0") is False
+
+    # Request yang sedang scoring memakai snapshot lama tidak ikut bergeser
+    assert list(ids) == ["emp0", "emp1", "emp2"]
+    np.testing.assert_array_equal(matrix, before)
+    new_ids, new_matrix = gallery.snapshot()
+    assert list(new_ids) == ["emp1", "emp2"]
+    np.testing.assert_array_equal(new_matrix, before[1:])
+
+
+def test_grows_past_initial_capacity(tmp_path, rng):
+    gallery = EmbeddingGallery(str(tmp_path))
+    vectors = {f"emp{i}": unit(rng.standard_normal(DIM)) for i in range(200)}
+    for employee_id, vector in vectors.items():
+        gallery.upsert(employee_id, vector)
+
+    ids, matrix = gallery.snapshot()
+    assert len(ids) == matrix.shape[0] == 200
+    for employee_id, vector in gallery.as_dict().items():
+        np.testing.assert_allclose(vector, vectors[employee_id], atol=1e-6)
+
+
+def test_load_and_refresh_from_disk(tmp_path, rng):
+    write_pickle(tmp_path, "emp1", rng.standard_normal(DIM))
+    write_pickle(tmp_path, "emp2", rng.standard_normal(DIM))
+    gallery = EmbeddingGallery(str(tmp_path), refresh_interval=3600)
+    assert gallery.load() == 2
+
+    # File dari process lain: belum terlihat sampai refresh (throttled) jalan
+    replacement = rng.standard_normal(DIM)
+    write_pickle(tmp_path, "emp3", rng.standard_normal(DIM))
+    write_pickle(tmp_path, "emp1", replacement)
+    (tmp_path / "emp2.pkl").unlink()
+    assert gallery.refresh() is False and len(gallery) == 2
+
+    assert gallery.refresh(force=True) is True
+    assert sorted(gallery.as_dict()) == ["emp1", "emp3"]
+    np.testing.assert_allclose(gallery.get("emp1"), unit(replacement), atol=1e-6)
+
+
+def test_register_persists_to_store_and_other_instance_refreshes(tmp_path, rng):
+    writer = EmbeddingGallery(str(tmp_path), refresh_interval=0)
+    writer.load()
+    reader = EmbeddingGallery(str(tmp_path), refresh_interval=0)
+    reader.load()
+    embedding = rng.standard_normal(DIM)
+
+    writer.register("emp1", embedding)
+    assert "emp1" in writer and not list(tmp_path.glob("*.pkl"))
+
+    assert reader.refresh() is True
+    np.testing.assert_allclose(reader.get("emp1"), unit(embedding), atol=1e-6)
+
+    assert writer.delete("emp1") is True
+    assert reader.refresh() is True and "emp1" not in reader
+    assert EmbeddingGallery(str(tmp_path)).load() == 0
+
+
+def test_store_wins_over_legacy_pickle(tmp_path, rng):
+    stored = rng.standard_normal(DIM)
+    write_pickle(tmp_path, "emp1", rng.standard_normal(DIM))
+    gallery = EmbeddingGallery(str(tmp_path))
+    gallery.load()
+    gallery.register("emp1", stored)
+
+    reloaded = EmbeddingGallery(str(tmp_path))
+    reloaded.load()
+    np.testing.assert_allclose(reloaded.get("emp1"), unit(stored), atol=1e-6)
+
+    # Delete juga membuang pickle legacy, jadi tidak muncul lagi saat load berikutnya
+    assert reloaded.delete("emp1")
+    assert not (tmp_path / "emp1.pkl").exists()
+    assert EmbeddingGallery(str(tmp_path)).load() == 0
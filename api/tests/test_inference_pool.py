@@ -0,0 +1,62 @@
+"""
+InferencePool: batas waktu start worker dan retry restart (tanpa spawn process / model)
+"""
+import itertools
+from concurrent.futures import Future
+
+import pytest
+
+import inference_pool
+from inference_pool import InferencePool
+
+
+class HungPool:
+    """Pool yang worker-nya tidak pernah selesai load model"""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        return Future()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+class ReadyPool(HungPool):
+    """Pool yang setiap worker-nya langsung menjawab ping"""
+
+    def __init__(self, processes: int):
+        super().__init__()
+        self._pids = itertools.cycle(range(1, processes + 1))
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result((next(self._pids), {"load_seconds": 0.0}))
+        return future
+
+
+def make_pool(monkeypatch, pools, processes=2, start_timeout=0.1):
+    pools = iter(pools)
+    monkeypatch.setattr(InferencePool, "_create", lambda self: next(pools))
+    return InferencePool(processes, {}, start_timeout=start_timeout)
+
+
+def test_start_times_out_and_discards_pool(monkeypatch):
+    hung = HungPool()
+    with pytest.raises(TimeoutError, match="0/2 workers ready"):
+        make_pool(monkeypatch, [hung])
+    assert hung.shut_down
+
+
+def test_rebuild_retries_after_hung_start(monkeypatch):
+    monkeypatch.setattr(inference_pool, "RESTART_BACKOFF", 0.0)
+    broken, hung, fresh = ReadyPool(2), HungPool(), ReadyPool(2)
+    pool = make_pool(monkeypatch, [broken, hung, fresh])
+    assert pool.ready and pool.workers.keys() == {1, 2}
+
+    pool._restarting = True
+    pool._rebuild(broken)
+
+    assert broken.shut_down and hung.shut_down
+    assert pool._pool is fresh and pool.ready and pool.restarts == 1
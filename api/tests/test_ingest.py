@@ -0,0 +1,179 @@
+"""
+ImageIngestor: sniffing magic bytes, parsing header, batas upload (413 / 415)
+dan reduced decode JPEG
+"""
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+from ingest import (READ_CHUNK_SIZE, ImageHeader, ImageIngestor, ImageRejected, parse_image_header,
+                    reduction_factor, sniff_format)
+
+
+def encode(width: int, height: int, ext: str = ".jpg") -> bytes:
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    cv2.rectangle(image, (width // 4, height // 4), (width // 2, height // 2), (255, 255, 255), -1)
+    ok, data = cv2.imencode(ext, image)
+    assert ok
+    return data.tobytes()
+
+
+def with_exif(jpeg: bytes, payload_size: int = 2000) -> bytes:
+    """Sisipkan segment APP1 (EXIF) sebelum SOF, seperti foto HP"""
+    payload = b"Exif\x00\x00" + bytes(payload_size)
+    return jpeg[:2] + b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload + jpeg[2:]
+
+
+class FakeUpload:
+    """Pengganti UploadFile: read(n) async per chunk"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+        self.reads = 0
+
+    async def read(self, size: int) -> bytes:
+        self.reads += 1
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
+
+
+def read(ingestor: ImageIngestor, data: bytes) -> bytes:
+    return asyncio.run(ingestor.read(FakeUpload(data)))
+
+
+def test_sniff_format():
+    assert sniff_format(encode(64, 64)) == "jpeg"
+    assert sniff_format(encode(64, 64, ".png")) == "png"
+    assert sniff_format(b"GIF89a....") is None
+    assert sniff_format(b"") is None
+
+
+def test_parse_image_header():
+    assert parse_image_header(encode(320, 240)) == ImageHeader("jpeg", 320, 240)
+    assert parse_image_header(encode(100, 70, ".png")) == ImageHeader("png", 100, 70)
+    # SOF setelah segment EXIF tetap terbaca tanpa decode
+    assert parse_image_header(with_exif(encode(320, 240))) == ImageHeader("jpeg", 320, 240)
+
+
+def test_parse_image_header_rejects_broken_data():
+    jpeg = encode(320, 240)
+    assert parse_image_header(b"not an image") is None
+    assert parse_image_header(jpeg[:4]) is None
+    assert parse_image_header(jpeg[:2] + b"\x00" + jpeg[3:]) is None
+    assert parse_image_header(encode(64, 64, ".png")[:20]) is None
+
+
+@pytest.mark.parametrize("size, expected", [
+    ((4000, 3000), 4),      # 4000 / 4 = 1000 >= 640, 4000 / 8 = 500 < 640
+    ((5120, 100), 8),       # satu sisi saja cukup
+    ((1280, 720), 2),
+    ((1279, 1279), 1),
+    ((640, 480), 1),
+])
+def test_reduction_factor(size, expected):
+    assert reduction_factor(ImageHeader("jpeg", *size), (640, 640)) == expected
+
+
+def test_reduction_factor_only_for_jpeg():
+    assert reduction_factor(ImageHeader("png", 4000, 3000), (640, 640)) == 1
+
+
+def test_read_returns_all_chunks():
+    data = encode(800, 600) + bytes(2 * READ_CHUNK_SIZE)  # Trailing data setelah EOI
+    upload = FakeUpload(data)
+    assert asyncio.run(ImageIngestor(10 * 1024 * 1024).read(upload)) == data
+    assert upload.reads > 2
+
+
+def test_read_rejects_unsupported_format_with_415():
+    with pytest.raises(ImageRejected) as exc:
+        read(ImageIngestor(1024 * 1024), b"GIF89a" + bytes(100))
+    assert exc.value.status_code == 415
+
+    # PNG ditolak jika tidak ada di allowed_formats
+    with pytest.raises(ImageRejected) as exc:
+        read(ImageIngestor(1024 * 1024, allowed_formats=("jpeg",)), encode(64, 64, ".png"))
+    assert exc.value.status_code == 415
+
+
+def test_read_rejects_oversize_with_413_without_reading_everything():
+    data = encode(64, 64) + bytes(5 * READ_CHUNK_SIZE)
+    upload = FakeUpload(data)
+    with pytest.raises(ImageRejected) as exc:
+        asyncio.run(ImageIngestor(READ_CHUNK_SIZE + 1).read(upload))
+    assert exc.value.status_code == 413
+    assert upload.offset < len(data)
+
+
+def test_read_rejects_empty_upload():
+    with pytest.raises(ImageRejected) as exc:
+        read(ImageIngestor(1024), b"")
+    assert exc.value.status_code == 400
+
+
+def test_check_header_limits():
+    ingestor = ImageIngestor(1024 * 1024, min_size=(50, 50), max_pixels=1000 * 1000)
+    with pytest.raises(ImageRejected, match="terlalu kecil"):
+        ingestor.check_header(encode(40, 200))
+    with pytest.raises(ImageRejected, match="terlalu besar"):
+        ingestor.check_header(encode(1200, 1000))
+    with pytest.raises(ImageRejected, match="format"):
+        ingestor.check_header(b"\xff\xd8\xff" + bytes(10))
+
+
+def test_decode_reduced_jpeg_reports_scale():
+    ingestor = ImageIngestor(10 * 1024 * 1024, target_size=(640, 640))
+    decoded = ingestor.decode(encode(2600, 1400))
+
+    assert decoded.header == ImageHeader("jpeg", 2600, 1400)
+    assert decoded.image.shape[:2] == (350, 650)
+    assert decoded.scale == pytest.approx(4.0)
+
+
+def test_decode_full_resolution_without_target():
+    decoded = ImageIngestor(10 * 1024 * 1024).decode(encode(1300, 700))
+    assert decoded.image.shape[:2] == (700, 1300) and decoded.scale == 1.0
+
+    png = ImageIngestor(10 * 1024 * 1024, target_size=(640, 640)).decode(encode(1300, 700, ".png"))
+    assert png.image.shape[:2] == (700, 1300) and png.scale == 1.0
+
+
+
+def test_decode_chip_resizes_square_chips():
+    ingestor = ImageIngestor(1024 * 1024, min_size=(32, 32))
+    assert ingestor.decode_chip(encode(112, 112), 112).shape == (112, 112, 3)
+    assert ingestor.decode_chip(encode(224, 224, ".png"), 112).shape == (112, 112, 3)
+    with pytest.raises(ImageRejected, match="persegi"):
+        ingestor.decode_chip(encode(112, 96), 112)
+
+
+def test_decode_raw_chips_is_zero_copy_view():
+    ingestor = ImageIngestor(1024)
+    chips = np.arange(2 * 4 * 4 * 3, dtype=np.uint8).reshape(2, 4, 4, 3)
+    decoded = ingestor.decode_raw_chips(chips.tobytes(), 4, 8)
+    np.testing.assert_array_equal(decoded, chips)
+    assert not decoded.flags.writeable
+
+    with pytest.raises(ImageRejected):
+        ingestor.decode_raw_chips(chips.tobytes()[:-1], 4, 8)
+    with pytest.raises(ImageRejected) as exc:
+        ingestor.decode_raw_chips(chips.tobytes(), 4, 1)
+    assert exc.value.status_code == 413
+
+
+def test_decode_raw_embeddings_validation():
+    ingestor = ImageIngestor(1024)
+    embeddings = np.ones((2, 4), dtype="<f4")
+    np.testing.assert_array_equal(ingestor.decode_raw_embeddings(embeddings.tobytes(), 4, 8), embeddings)
+
+    with pytest.raises(ImageRejected):
+        ingestor.decode_raw_embeddings(embeddings.tobytes()[:-1], 4, 8)
+    with pytest.raises(ImageRejected) as exc:
+        ingestor.decode_raw_embeddings(embeddings.tobytes(), 4, 1)
+    assert exc.value.status_code == 413
+    with pytest.raises(ImageRejected):
+        ingestor.decode_raw_embeddings(np.zeros((1, 4), dtype="<f4").tobytes(), 4, 8)
@@ -0,0 +1,101 @@
+"""
+MatchingEngine: top-k vectorized vs loop cosine similarity per karyawan
+"""
+import numpy as np
+import pytest
+
+from conftest import unit
+from gallery import EmbeddingGallery
+from matching import (MatchingEngine, MatchResult, build_result, passes_threshold, search_matrix,
+                      top_k_indices)
+
+DIM = 16
+
+
+def loop_ranking(gallery_vectors, query):
+    """Ranking baseline: cosine similarity satu per satu"""
+    query = unit(query)
+    scores = {employee_id: float(unit(vector) @ query) for employee_id, vector in gallery_vectors.items()}
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+@pytest.fixture
+def filled(tmp_path, rng):
+    gallery = EmbeddingGallery(str(tmp_path))
+    vectors = {f"emp{i}": rng.standard_normal(DIM).astype(np.float32) for i in range(50)}
+    for employee_id, vector in vectors.items():
+        gallery.upsert(employee_id, vector)
+    return gallery, vectors
+
+
+def test_top_k_indices():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 4, 0]
+
+
+def test_build_result_margin():
+    ids = np.array(["a", "b", "c"], dtype=object)
+    result = build_result(ids, np.array([0.2, 0.8, 0.5]), 2)
+    assert result.candidates == [("b", 0.8), ("c", 0.5)]
+    assert result.margin == pytest.approx(0.3)
+    assert build_result(ids, np.array([0.2, 0.8, 0.5]), 1).margin is None
+    assert build_result(ids[:0], np.zeros(0), 5) == MatchResult([], None)
+
+
+def test_passes_threshold():
+    assert passes_threshold(MatchResult([("a", 0.6)], None), 0.5)
+    assert passes_threshold(MatchResult([("a", 0.5)], None), 0.5)
+    assert not passes_threshold(MatchResult([("a", 0.49)], None), 0.5)
+    # Similarity <= 0 tidak pernah match, walaupun threshold 0
+    assert not passes_threshold(MatchResult([("a", 0.0)], None), 0.0)
+    assert not passes_threshold(MatchResult([], None), 0.5)
+
+
+def test_search_matches_loop(filled, rng):
+    gallery, vectors = filled
+    engine = MatchingEngine(gallery, 0.5)
+    for _ in range(5):
+        query = rng.standard_normal(DIM)
+        result = engine.search(query, k=5)
+        expected = loop_ranking(vectors, query)[:5]
+        assert [employee_id for employee_id, _ in result.candidates] == [e for e, _ in expected]
+        for (_, similarity), (_, expected_similarity) in zip(result.candidates, expected):
+            assert similarity == pytest.approx(expected_similarity, abs=1e-5)
+        assert result.margin == pytest.approx(expected[0][1] - expected[1][1], abs=1e-5)
+
+
+def test_search_batch_equals_single_queries(filled, rng):
+    gallery, _ = filled
+    engine = MatchingEngine(gallery, 0.5)
+    queries = rng.standard_normal((4, DIM)).astype(np.float32)
+    queries[2] = 0  # Query nol tidak boleh menghasilkan NaN
+
+    batch = engine.search_batch(queries, k=3)
+    assert len(batch) == 4
+    for query, result in zip(queries, batch):
+        single = engine.search(query, k=3)
+        assert [c for c, _ in result.candidates] == [c for c, _ in single.candidates]
+        assert np.isfinite([s for _, s in result.candidates]).all()
+
+
+def test_exact_match_and_threshold(filled):
+    gallery, vectors = filled
+    engine = MatchingEngine(gallery, 0.99)
+    result = engine.search(vectors["emp7"] * 3.0, k=1)
+    assert result.best[0] == "emp7" and result.best[1] == pytest.approx(1.0, abs=1e-5)
+    assert engine.is_match(result)
+    assert not MatchingEngine(gallery, 1.01).is_match(result)
+
+
+def test_empty_gallery(tmp_path, rng):
+    engine = MatchingEngine(EmbeddingGallery(str(tmp_path)), 0.5)
+    assert engine.search(rng.standard_normal(DIM)) == MatchResult([], None)
+    assert engine.search_batch(rng.standard_normal((2, DIM))) == [MatchResult([], None)] * 2
+
+
+def test_search_matrix_normalizes_query(rng):
+    ids = np.array(["a", "b"], dtype=object)
+    matrix = np.stack([unit([1, 0, 0]), unit([0, 1, 0])])
+    result = search_matrix(np.array([0.0, 5.0, 0.0]), ids, matrix, k=2)
+    assert result.candidates[0] == ("b", pytest.approx(1.0))
@@ -0,0 +1,59 @@
+"""
+ResultCache: key per isi upload, LRU + TTL, hasil match terikat version gallery
+"""
+import result_cache
+from result_cache import ResultCache
+
+
+def test_key_depends_on_content_and_variant():
+    assert ResultCache.key(b"abc") == ResultCache.key(b"abc")
+    assert ResultCache.key(b"abc") != ResultCache.key(b"abd")
+    assert ResultCache.key(b"abc", "fast") != ResultCache.key(b"abc", "full")
+
+
+def test_put_get_and_no_face_is_cached():
+    cache = ResultCache(max_entries=4, ttl=60)
+    key = ResultCache.key(b"upload")
+    assert cache.get(key) is None
+
+    cache.put(key, "header", None)
+    entry = cache.get(key)
+    assert entry is not None and entry.result is None and entry.header == "header"
+
+
+def test_lru_eviction():
+    cache = ResultCache(max_entries=2, ttl=60)
+    a, b, c = (ResultCache.key(x) for x in (b"a", b"b", b"c"))
+    cache.put(a, None, {"n": 1})
+    cache.put(b, None, {"n": 2})
+    assert cache.get(a) is not None  # a jadi paling baru dipakai
+
+    cache.put(c, None, {"n": 3})
+    assert len(cache) == 2
+    assert cache.get(b) is None and cache.get(a) is not None and cache.get(c) is not None
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    cache = ResultCache(max_entries=4, ttl=10)
+    key = ResultCache.key(b"upload")
+    cache.put(key, None, {"n": 1})
+
+    now[0] += 9
+    assert cache.get(key) is not None  # Hit tidak memperpanjang umur entry
+    now[0] += 2
+    assert cache.get(key) is None and len(cache) == 0
+
+
+def test_match_is_invalidated_by_gallery_version():
+    cache = ResultCache()
+    entry = cache.put(ResultCache.key(b"upload"), None, {"embedding": [0.1]})
+    assert cache.get_match(entry, 5) == (False, None)
+
+    cache.set_match(entry, ("emp1", 0.9), 5)
+    assert cache.get_match(entry, 5) == (True, ("emp1", 0.9))
+    assert cache.get_match(entry, 6) == (False, None)
+
+    cache.set_match(entry, None, 6)  # Tidak dikenali juga hasil yang valid
+    assert cache.get_match(entry, 6) == (True, None)
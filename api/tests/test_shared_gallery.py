@@ -0,0 +1,110 @@
+"""
+SharedGallery: segment shared antar instance, seqlock read dan template
+"""
+import numpy as np
+import pytest
+
+from conftest import unit
+from shared_gallery import SharedGallery
+from templates import build_template_index, reduce_scores
+from utils import FaceRecognitionSystem
+
+DIM = 8
+
+
+def open_pair(tmp_path):
+    embeddings_dir, shm_dir = str(tmp_path / "embeddings"), str(tmp_path / "shm")
+    writer = SharedGallery(embeddings_dir, shm_dir=shm_dir)
+    writer.load()
+    reader = SharedGallery(embeddings_dir, shm_dir=shm_dir)
+    reader.load()
+    return writer, reader
+
+
+def test_write_is_visible_to_other_instance(tmp_path, rng):
+    writer, reader = open_pair(tmp_path)
+    vector = unit(rng.standard_normal(DIM))
+    writer.register("emp1", vector)
+
+    assert "emp1" in reader and len(reader) == 1
+    np.testing.assert_allclose(reader.get("emp1"), vector, atol=1e-6)
+
+    writer.delete("emp1")
+    assert "emp1" not in reader and len(reader) == 0
+
+
+def test_read_retries_when_writer_runs_during_read(tmp_path, rng):
+    writer, reader = open_pair(tmp_path)
+    writer.register("emp1", unit(rng.standard_normal(DIM)))
+    calls = []
+
+    def fn(ids, matrix):
+        calls.append(len(ids))
+        if len(calls) == 1:
+            writer.register("emp2", unit(rng.standard_normal(DIM)))
+        return sorted(ids[i] for i in range(len(ids)))
+
+    assert reader.read(fn) == ["emp1", "emp2"]
+    assert calls == [1, 2]
+
+
+
+def test_snapshot_survives_segment_growth(tmp_path, rng):
+    writer, reader = open_pair(tmp_path)
+    vectors = {f"emp{i}": unit(rng.standard_normal(DIM)) for i in range(200)}
+    for employee_id, vector in list(vectors.items())[:10]:
+        writer.register(employee_id, vector)
+    ids, matrix = reader.snapshot()
+
+    # Lewat kapasitas awal: writer pindah ke generation segment baru
+    for employee_id, vector in list(vectors.items())[10:]:
+        writer.register(employee_id, vector)
+
+    assert len(ids) == 10 and matrix.shape == (10, DIM)
+    assert len(reader) == 200
+    for employee_id, vector in reader.as_dict().items():
+        np.testing.assert_allclose(vector, vectors[employee_id], atol=1e-6)
+
+
+def test_reload_from_store_after_segment_removed(tmp_path, rng):
+    writer, _ = open_pair(tmp_path)
+    vector = unit(rng.standard_normal(DIM))
+    writer.register("emp1", vector)
+    writer.close()
+    for path in (tmp_path / "shm").iterdir():
+        path.unlink()
+
+    # Segment hilang (reboot): di-publish ulang dari embedding store
+    fresh = SharedGallery(str(tmp_path / "embeddings"), shm_dir=str(tmp_path / "shm"))
+    assert fresh.load() == 1
+    np.testing.assert_allclose(fresh.get("emp1"), vector, atol=1e-6)
+
+
+def test_templates_and_template_index(tmp_path, rng):
+    writer, reader = open_pair(tmp_path)
+    for _ in range(3):
+        writer.register_template("emp1", rng.standard_normal(DIM).astype(np.float32), max_templates=3)
+    writer.register_template("emp2", rng.standard_normal(DIM).astype(np.float32), max_templates=3)
+
+    assert sorted(reader.templates("emp1")) == ["emp1", "emp1#1", "emp1#2"]
+    query = unit(rng.standard_normal(DIM))
+
+    def check(ids, matrix, index):
+        expected = build_template_index([ids[i] for i in range(len(ids))], matrix)
+        scores = (query @ matrix.T)[None, :]
+        best, _ = reduce_scores(scores, index)
+        expected_best, _ = reduce_scores(scores, expected)
+        return (dict(zip(map(str, index.owner_ids), best[0].round(5))),
+                dict(zip(map(str, expected.owner_ids), expected_best[0].round(5))))
+
+    actual, expected = reader.read_templates(check)
+    assert actual == expected and set(actual) == {"emp1", "emp2"}
+
+    assert writer.delete_templates("emp1")
+    assert reader.templates("emp1") == {}
+
+
+def test_ivf_index_with_shared_gallery_is_rejected(tmp_path):
+    # Validasi konfigurasi sebelum model di-load
+    with pytest.raises(ValueError, match="MATCH_INDEX=ivf"):
+        FaceRecognitionSystem(embeddings_dir=str(tmp_path), match_index="ivf", gallery_backend="shared")
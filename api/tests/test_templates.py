@@ -0,0 +1,214 @@
+"""
+Template per karyawan: reduce max / centroid, owner index incremental,
+plan_template, dan dedupe kandidat ANN (over-fetch k x max_templates)
+"""
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex
+from conftest import unit
+from gallery import EmbeddingGallery
+from matching import MatchingEngine, MatchResult, owner_result, search_templates
+from templates import (build_template_index, index_from_codes, owner_codes_from_bytes, plan_template,
+                       reduce_scores, template_key, template_owner, template_slot)
+
+DIM = 16
+
+
+def brute_force(ids, matrix, query):
+    """Score max dan centroid per owner dengan loop biasa"""
+    groups = {}
+    for key, row in zip(ids, matrix):
+        groups.setdefault(template_owner(key), []).append(row)
+    best, centroid = {}, {}
+    for owner, rows in groups.items():
+        rows = np.stack(rows)
+        best[owner] = float((rows @ query).max())
+        centroid[owner] = float(unit(rows.sum(axis=0)) @ query)
+    return best, centroid
+
+
+def random_gallery(rng, owners=30, max_templates=3):
+    ids, rows = [], []
+    for i in range(owners):
+        for slot in range(int(rng.integers(1, max_templates + 1))):
+            ids.append(template_key(f"emp{i}", slot))
+            rows.append(unit(rng.standard_normal(DIM)))
+    order = rng.permutation(len(ids))
+    return [ids[i] for i in order], np.stack(rows)[order]
+
+
+def as_dict(owner_ids, scores):
+    return {str(owner): round(float(score), 5) for owner, score in zip(owner_ids, scores)}
+
+
+def test_template_key_roundtrip():
+    assert template_key("emp1") == "emp1"
+    assert template_key("emp1", 2) == "emp1#2"
+    assert template_owner("emp1#2") == "emp1" and template_slot("emp1#2") == 2
+    assert template_owner("emp1") == "emp1" and template_slot("emp1") == 0
+    # Suffix bukan angka tetap bagian dari employee_id
+    assert template_owner("emp#x") == "emp#x" and template_slot("emp#x") == 0
+
+
+def test_reduce_scores_matches_brute_force(rng):
+    ids, matrix = random_gallery(rng)
+    query = unit(rng.standard_normal(DIM))
+    index = build_template_index(ids, matrix)
+
+    best, centroid = reduce_scores((query @ matrix.T)[None, :], index)
+    expected_best, expected_centroid = brute_force(ids, matrix, query)
+
+    assert index.grouped
+    assert as_dict(index.owner_ids, best[0]) == {k: round(v, 5) for k, v in expected_best.items()}
+    assert as_dict(index.owner_ids, centroid[0]) == {k: round(v, 5) for k, v in expected_centroid.items()}
+
+
+def test_single_template_gallery_skips_reduce(rng):
+    ids = [f"emp{i}" for i in range(5)]
+    matrix = np.stack([unit(rng.standard_normal(DIM)) for _ in ids])
+    index = build_template_index(ids, matrix)
+    scores = rng.standard_normal((2, 5)).astype(np.float32)
+
+    best, centroid = reduce_scores(scores, index)
+    assert not index.grouped and centroid is None
+    assert best is scores
+
+
+def test_index_from_codes_matches_build(rng):
+    ids, matrix = random_gallery(rng)
+    query = unit(rng.standard_normal(DIM))
+    scores = (query @ matrix.T)[None, :]
+
+    codes, owner_ids = owner_codes_from_bytes(np.array(ids, dtype="S32"))
+    built, fast = build_template_index(ids, matrix), index_from_codes(codes, owner_ids, matrix)
+
+    assert sorted(map(str, owner_ids)) == sorted(map(str, built.owner_ids))
+    for a, b in zip(reduce_scores(scores, built), reduce_scores(scores, fast)):
+        assert as_dict(built.owner_ids, a[0]) == as_dict(fast.owner_ids, b[0])
+
+
+def test_owner_codes_from_bytes():
+    codes, owner_ids = owner_codes_from_bytes(np.array([b"a", b"b#1", b"a#2", b"c#x"], dtype="S8"))
+    owners = [str(owner_ids[code]) for code in codes]
+    assert owners == ["a", "b", "a", "c#x"]
+
+
+@pytest.mark.parametrize("scoring", ["max", "centroid"])
+def test_search_templates_ranks_owners(rng, scoring):
+    ids, matrix = random_gallery(rng)
+    query = unit(rng.standard_normal(DIM))
+    index = build_template_index(ids, matrix)
+
+    result = search_templates((query @ matrix.T)[None, :], index, k=5, scoring=scoring)[0]
+    expected_best, expected_centroid = brute_force(ids, matrix, query)
+    ranking = expected_best if scoring == "max" else expected_centroid
+
+    owners = [owner for owner, _ in result.candidates]
+    assert len(owners) == len(set(owners)) == 5
+    # Similarity yang dilaporkan selalu max antar template
+    for owner, similarity in result.candidates:
+        assert similarity == pytest.approx(expected_best[owner], abs=1e-5)
+    if scoring == "max":
+        assert owners == sorted(ranking, key=ranking.get, reverse=True)[:5]
+    else:
+        # Kandidat diambil dari shortlist centroid teratas
+        shortlist = set(sorted(ranking, key=ranking.get, reverse=True)[:8])
+        assert set(owners) <= shortlist
+
+
+def test_plan_template_fills_then_replaces_nearest():
+    a, b = unit([1, 0, 0]), unit([0, 1, 0])
+    assert plan_template({}, "emp", a, max_templates=2) == ("emp", [])
+    assert plan_template({"emp": a}, "emp", b, max_templates=2) == ("emp#1", [])
+    # Penuh: ganti template paling mirip dengan template baru
+    key, stale = plan_template({"emp": a, "emp#1": b}, "emp", unit([0.1, 1, 0]), max_templates=2)
+    assert key == "emp#1" and stale == []
+
+
+def test_plan_template_replace_and_lowered_max():
+    a, b, c = unit([1, 0, 0]), unit([0, 1, 0]), unit([0, 0, 1])
+    existing = {"emp": a, "emp#1": b, "emp#2": c}
+    assert plan_template(existing, "emp", a, max_templates=3, replace=True) == ("emp", ["emp#1", "emp#2"])
+    # max_templates diturunkan ke 1: satu template ditulis ulang, sisanya dibuang
+    key, stale = plan_template(existing, "emp", b, max_templates=1)
+    assert key == "emp#1" and sorted(stale) == ["emp", "emp#2"]
+
+
+def test_gallery_templates_and_matching(tmp_path, rng):
+    gallery = EmbeddingGallery(str(tmp_path), read_legacy_pickles=False)
+    gallery.load()
+    base = unit(rng.standard_normal(DIM))
+    for _ in range(3):
+        gallery.register_template("emp1", base + 0.1 * unit(rng.standard_normal(DIM)), max_templates=3)
+    gallery.register_template("emp2", unit(rng.standard_normal(DIM)), max_templates=3)
+
+    assert sorted(gallery.templates("emp1")) == ["emp1", "emp1#1", "emp1#2"]
+    key, count = gallery.register_template("emp1", base, max_templates=3)
+    assert count == 3 and key in {"emp1", "emp1#1", "emp1#2"}
+
+    for scoring in ("max", "centroid"):
+        engine = MatchingEngine(gallery, 0.5, template_scoring=scoring, max_templates=3)
+        result = engine.search(base, k=2)
+        assert result.best[0] == "emp1" and engine.is_match(result)
+        assert [owner for owner, _ in result.candidates] == ["emp1", "emp2"]
+
+    assert gallery.delete_templates("emp1")
+    assert gallery.templates("emp1") == {}
+    assert [owner for owner, _ in MatchingEngine(gallery).search(base).candidates] == ["emp2"]
+
+
+def test_incremental_owner_index_matches_rebuild(tmp_path, rng):
+    gallery = EmbeddingGallery(str(tmp_path), read_legacy_pickles=False)
+    gallery.load()
+    query = unit(rng.standard_normal(DIM))
+    for step in range(150):
+        employee_id = f"emp{rng.integers(10)}"
+        if rng.random() < 0.75:
+            gallery.register_template(employee_id, rng.standard_normal(DIM).astype(np.float32),
+                                      max_templates=3, replace=rng.random() < 0.1)
+        else:
+            gallery.delete_templates(employee_id)
+
+        if step % 15 == 0:
+            def check(ids, matrix, index):
+                expected = build_template_index(list(ids), matrix)
+                scores = (query @ matrix.T)[None, :]
+                for a, b in zip(reduce_scores(scores, index), reduce_scores(scores, expected)):
+                    if b is not None:
+                        assert as_dict(index.owner_ids, a[0]) == as_dict(expected.owner_ids, b[0])
+            gallery.read_templates(check)
+
+
+def test_owner_result_dedupes_over_fetched_templates():
+    result = MatchResult([("emp1#1", 0.9), ("emp1", 0.8), ("emp2", 0.7), ("emp1#2", 0.6), ("emp3", 0.5)], 0.1)
+
+    deduped = owner_result(result, k=2)
+    assert deduped.candidates == [("emp1", 0.9), ("emp2", 0.7)]
+    assert deduped.margin == pytest.approx(0.2)
+    assert owner_result(MatchResult([("emp1#1", 0.9), ("emp1", 0.8)], 0.1), k=5).margin is None
+
+
+def test_ivf_search_returns_unique_owners(tmp_path, rng):
+    gallery = EmbeddingGallery(str(tmp_path), read_legacy_pickles=False)
+    gallery.load()
+    centers = [unit(rng.standard_normal(DIM)) for _ in range(40)]
+    for i, center in enumerate(centers):
+        for slot in range(3):
+            gallery.register_template(f"emp{i}", center + 0.05 * rng.standard_normal(DIM), max_templates=3)
+
+    index = IVFIndex(nlist=4, nprobe=4, min_size=50)
+    index.attach(gallery)
+    assert index.ready
+
+    ann = MatchingEngine(gallery, 0.5, index=index, max_templates=3)
+    exact = MatchingEngine(gallery, 0.5, max_templates=3)
+    assert ann.use_index
+    for i in (0, 7, 21):
+        result = ann.search(centers[i], k=5)
+        owners = [owner for owner, _ in result.candidates]
+        assert owners[0] == f"emp{i}"
+        assert len(owners) == len(set(owners)) == 5
+        # nprobe = nlist: IVF exhaustive, hasil sama dengan exact search
+        assert owners == [owner for owner, _ in exact.search(centers[i], k=5).candidates]
+
@@ -0,0 +1,109 @@
+"""
+Kiosk tracking: voting identitas K frame, track hilang / berganti orang,
+batas sesi, dan slot frame terbaru
+"""
+import asyncio
+
+import pytest
+
+import tracking
+from tracking import KioskSession, LatestFrame, SessionLimitReached, SessionRegistry
+from utils import bbox_iou
+
+BOX = [100.0, 100.0, 200.0, 200.0]
+OTHER_BOX = [400.0, 100.0, 500.0, 200.0]
+
+
+def face(bbox=BOX, embed=True):
+    result = {"bbox": list(bbox), "confidence": 0.9, "tracked": False}
+    if embed:
+        result["embedding"] = [0.0]
+    return result
+
+
+def test_bbox_iou():
+    assert bbox_iou(BOX, BOX) == pytest.approx(1.0)
+    assert bbox_iou(BOX, OTHER_BOX) == 0.0
+    assert bbox_iou(BOX, [150.0, 100.0, 250.0, 200.0]) == pytest.approx(1 / 3)
+
+
+def test_match_announced_after_k_consistent_frames():
+    session = KioskSession(confirm_frames=3)
+    assert session.update(face(), ("emp1", 0.8)) == []
+    assert session.update(face(), ("emp1", 0.7)) == []
+    assert session.update(face(), ("emp1", 0.9)) == ["match"]
+    assert session.identity == ("emp1", pytest.approx(0.8))
+
+    # Identitas ditahan: frame berikutnya tidak perlu embedding / recognition ulang
+    assert not session.needs_embedding
+    assert session.update(face(embed=False), None) == []
+
+
+def test_disagreeing_frames_do_not_confirm():
+    session = KioskSession(confirm_frames=3)
+    for match in (("emp1", 0.8), ("emp2", 0.8), ("emp1", 0.8)):
+        assert session.update(face(), match) == []
+    assert session.identity is None
+    # Window geser: tiga frame terakhir sepakat
+    assert session.update(face(), ("emp1", 0.8)) == []
+    assert session.update(face(), ("emp1", 0.8)) == ["match"]
+
+
+def test_unknown_announced_once():
+    session = KioskSession(confirm_frames=2)
+    assert session.update(face(), None) == []
+    assert session.update(face(), None) == ["unknown"]
+    assert session.update(face(), None) == []
+
+
+def test_lost_after_max_missed_frames():
+    session = KioskSession(confirm_frames=1, max_missed=2)
+    assert session.update(face(), ("emp1", 0.9)) == ["match"]
+    assert session.update(None, None) == []
+    assert session.update(None, None) == []
+    assert session.update(None, None) == ["lost"]
+    assert session.needs_embedding and session.bbox is None
+
+
+def test_new_person_resets_track():
+    session = KioskSession(confirm_frames=1, min_iou=0.3)
+    assert session.update(face(BOX), ("emp1", 0.9)) == ["match"]
+    assert session.update(face(OTHER_BOX), ("emp2", 0.9)) == ["lost", "match"]
+    assert session.identity[0] == "emp2"
+
+
+def test_registry_limit_and_idle_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tracking.time, "monotonic", lambda: now[0])
+    registry = SessionRegistry(max_sessions=2, idle_timeout=30, confirm_frames=5)
+    first = registry.open()
+    registry.open()
+    assert first.confirm_frames == 5
+    with pytest.raises(SessionLimitReached):
+        registry.open()
+
+    now[0] += 20
+    first.touch()
+    now[0] += 20
+    assert registry.expire_idle() == 1 and len(registry) == 1
+    registry.open()
+    registry.close(first)
+    assert len(registry) == 1
+
+
+def test_latest_frame_keeps_only_newest():
+    async def main():
+        slot = LatestFrame()
+        slot.put(b"1")
+        slot.put(b"2")
+        assert await slot.get() == b"2" and slot.dropped == 1
+
+        waiter = asyncio.ensure_future(slot.get())
+        await asyncio.sleep(0)
+        slot.put(b"3")
+        assert await waiter == b"3"
+
+        slot.close()
+        assert await slot.get() is None
+
+    asyncio.run(main())
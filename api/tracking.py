@@ -0,0 +1,186 @@
+"""
+Kiosk Stream Sessions
+State per sesi WebSocket /ws/kiosk: kiosk mengirim frame terus-menerus, server
+men-track bbox wajah antar frame (frame berikutnya cukup detection di crop
+sekitar bbox lama) dan mengumumkan identitas begitu cocok di K frame berturut-turut.
+
+Setelah identitas dikonfirmasi, sesi menahannya selama wajah yang sama masih
+ter-track (tanpa recognition ulang); wajah hilang lebih dari max_missed frame
+atau berganti orang (IoU bbox rendah) -> event "lost" dan voting mulai lagi.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from utils import bbox_iou
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLimitReached(Exception):
+    """Jumlah sesi kiosk aktif sudah maksimum"""
+
+
+class KioskSession:
+    """Track wajah + voting identitas satu sesi kiosk (state terbatas: maks confirm_frames vote)"""
+
+    def __init__(self, confirm_frames: int = 3, max_missed: int = 3, min_iou: float = 0.3):
+        """
+        Args:
+            confirm_frames: Identitas diumumkan setelah hasil match sama di K frame berturut-turut
+            max_missed: Frame tanpa wajah yang masih ditoleransi sebelum track dianggap hilang
+            min_iou: IoU bbox minimum antar frame untuk dianggap wajah yang sama
+        """
+        self.session_id = uuid.uuid4().hex
+        self.confirm_frames = confirm_frames
+        self.max_missed = max_missed
+        self.min_iou = min_iou
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+        self.frames = 0
+        self.bbox: Optional[List[float]] = None
+        self.missed = 0
+        self.votes: deque = deque(maxlen=confirm_frames)
+        self.identity: Optional[Tuple[str, float]] = None
+        self.announced: Optional[str] = None  # "match" / "unknown" untuk track sekarang
+
+    def touch(self):
+        """Tandai sesi aktif (frame diterima, termasuk frame yang ditolak / dibuang)"""
+        self.last_active = time.monotonic()
+
+    @property
+    def needs_embedding(self) -> bool:
+        """False selama identitas wajah yang di-track sudah dikonfirmasi"""
+        return self.identity is None
+
+    def update(self, face: Optional[Dict], match: Optional[Tuple[str, float]]) -> List[str]:
+        """
+        Masukkan hasil satu frame
+
+        Args:
+            face: Hasil extract_tracked_face (bbox koordinat asli), None jika tidak ada wajah
+            match: Hasil find_matching_face untuk embedding frame ini (None = tidak dikenali)
+
+        Returns:
+            Event yang harus dikirim ke kiosk: "lost", "match", "unknown"
+        """
+        self.frames += 1
+        self.touch()
+        events = []
+        if face is None:
+            if self.bbox is not None:
+                self.missed += 1
+                if self.missed > self.max_missed:
+                    events.extend(self._reset())
+            return events
+
+        if self.bbox is not None and bbox_iou(self.bbox, face["bbox"]) < self.min_iou:
+            events.extend(self._reset())  # Orang berikutnya di antrian
+        self.bbox = face["bbox"]
+        self.missed = 0
+        if self.identity is not None or "embedding" not in face:
+            return events
+
+        self.votes.append(match)
+        if len(self.votes) == self.confirm_frames:
+            employee_ids = {vote[0] if vote else None for vote in self.votes}
+            if employee_ids == {None}:
+                if self.announced is None:
+                    self.announced = "unknown"
+                    events.append("unknown")
+            elif len(employee_ids) == 1:
+                similarity = sum(vote[1] for vote in self.votes) / len(self.votes)
+                self.identity = (employee_ids.pop(), float(similarity))
+                self.announced = "match"
+                events.append("match")
+        return events
+
+    def _reset(self) -> List[str]:
+        """Track selesai; "lost" hanya dikirim jika track ini sudah diumumkan"""
+        announced = self.announced
+        self.bbox = None
+        self.missed = 0
+        self.votes.clear()
+        self.identity = None
+        self.announced = None
+        return ["lost"] if announced else []
+
+
+class SessionRegistry:
+    """Sesi kiosk aktif, dibatasi max_sessions; sesi idle > idle_timeout dibuang"""
+
+    def __init__(self, max_sessions: int = 32, idle_timeout: float = 30.0, **session_kwargs):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.session_kwargs = session_kwargs
+        self._sessions: "OrderedDict[str, KioskSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def open(self) -> KioskSession:
+        """Sesi baru (SessionLimitReached jika penuh setelah sesi idle dibuang)"""
+        self.expire_idle()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitReached(f"Maks {self.max_sessions} sesi kiosk aktif")
+            session = KioskSession(**self.session_kwargs)
+            self._sessions[session.session_id] = session
+            return session
+
+    def close(self, session: KioskSession):
+        with self._lock:
+            self._sessions.pop(session.session_id, None)
+
+    def expire_idle(self) -> int:
+        """Buang sesi yang tidak menerima frame selama idle_timeout, return jumlahnya"""
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if session.last_active < deadline]
+            for sid in expired:
+                del self._sessions[sid]
+        if expired:
+            logger.info(f"✓ Expired {len(expired)} idle kiosk session(s)")
+        return len(expired)
+
+
+class LatestFrame:
+    """
+    Slot satu frame antara receiver WebSocket dan loop inference
+
+    Frame baru menimpa frame yang belum diproses (dihitung di dropped), jadi
+    kiosk yang mengirim lebih cepat dari inference tidak membuat antrian.
+    """
+
+    def __init__(self):
+        self._frame: Optional[bytes] = None
+        self._event = asyncio.Event()
+        self.closed = False
+        self.timed_out = False  # Diset receiver jika ditutup karena idle
+        self.dropped = 0
+
+    def put(self, frame: bytes):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def get(self) -> Optional[bytes]:
+        """Frame terbaru, None setelah close() dan slot kosong"""
+        while self._frame is None:
+            if self.closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        frame, self._frame = self._frame, None
+        return frame
@@ -4,16 +4,90 @@ Menggunakan ArcFace face recognition yang ringan di CPU
 """
 import cv2
 import numpy as np
-from insightface.app import FaceAnalysis
+from insightface.utils import face_align
+import os
 import pickle
+import sys
+import time
 from pathlib import Path
 from typing import List, Tuple, Optional, Dict
 import logging
 
+from gallery import EmbeddingGallery, normalize_embedding
+from shared_gallery import SharedGallery
+from ann_index import INDEX_FILE_NAME, IVFIndex
+from batching import MicroBatcher
+from matching import MatchingEngine, MatchResult, passes_threshold, search_matrix
+from templates import TEMPLATE_REPLACE_POLICIES, TEMPLATE_SEPARATOR
+from metrics import DETECTION_PATHS, stage
+from model_loader import FaceModelPack, ModelPool, SessionSettings
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pipeline profile -> modul InsightFace yang di-load (None = semua model di pack)
+PIPELINE_PROFILES: Dict[str, Optional[List[str]]] = {
+    "full": None,                                  # + landmark 3D/2D dan gender/age (tidak dipakai API)
+    "recognition": ["detection", "recognition"],   # production: detection + recognition saja
+}
+
+# Ukuran input model recognition ArcFace (face chip aligned)
+CHIP_SIZE = 112
+
+# Mode detection: "adaptive" = coba fast_det_size dulu, "full" = selalu det_size
+DETECTION_MODES = ("adaptive", "full")
+
+
+def get_rss_mb() -> float:
+    """Resident memory process saat ini (MB)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource  # Fallback non-Linux: peak RSS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def bbox_iou(a, b) -> float:
+    """Intersection-over-union dua bbox (x1, y1, x2, y2)"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return float(inter / union) if union > 0 else 0.0
+
+
+def expand_bbox(bbox, margin: float, img_shape: Tuple[int, ...]) -> Tuple[int, int, int, int]:
+    """
+    Region crop (x0, y0, x1, y1) integer: bbox diperlebar margin x sisi terpanjang
+    ke setiap arah, di-clip ke ukuran image
+    """
+    pad = margin * max(bbox[2] - bbox[0], bbox[3] - bbox[1])
+    x0, y0 = max(0, int(bbox[0] - pad)), max(0, int(bbox[1] - pad))
+    x1, y1 = min(img_shape[1], int(bbox[2] + pad) + 1), min(img_shape[0], int(bbox[3] + pad) + 1)
+    return x0, y0, x1, y1
+
+
+def make_warmup_image(size: Tuple[int, int] = (640, 640)) -> np.ndarray:
+    """
+    Image sintetis untuk warm-up (deterministik, tanpa file / data wajah asli)
+
+    Wajah kartun (oval kulit, mata, mulut) di tengah background gradient,
+    cukup untuk menjalankan semua layer detector dengan input ukuran penuh.
+    """
+    w, h = size
+    img = np.empty((h, w, 3), dtype=np.uint8)
+    img[...] = np.linspace(60, 190, w, dtype=np.uint8)[None, :, None]
+    cx, cy = w // 2, h // 2
+    fw, fh = w // 6, h // 4
+    cv2.ellipse(img, (cx, cy), (fw, fh), 0, 0, 360, (140, 170, 215), -1)
+    for dx in (-fw // 2, fw // 2):
+        cv2.circle(img, (cx + dx, cy - fh // 4), max(fw // 8, 1), (40, 30, 30), -1)
+    cv2.ellipse(img, (cx, cy + fh // 2), (fw // 3, max(fh // 10, 1)), 0, 0, 180, (60, 60, 150), -1)
+    return img
+
 
 class FaceRecognitionSystem:
     """
@@ -23,35 +97,393 @@ class FaceRecognitionSystem:
     
     def __init__(self, 
                  det_size: Tuple[int, int] = (640, 640),
-                 similarity_threshold: float = 0.5):
+                 similarity_threshold: float = 0.5,
+                 embeddings_dir: Optional[str] = None,
+                 gallery_refresh_interval: float = 2.0,
+                 read_legacy_pickles: bool = True,
+                 match_index: str = "exact",
+                 ivf_nlist: int = 0,
+                 ivf_nprobe: int = 8,
+                 ann_min_size: int = 5000,
+                 max_templates: int = 1,
+                 template_scoring: str = "max",
+                 template_replace_policy: str = "nearest",
+                 recognition_batch_size: int = 1,
+                 recognition_batch_wait_ms: float = 2.0,
+                 face_selection: str = "largest",
+                 model_name: str = "buffalo_l",
+                 model_root: str = "~/.insightface",
+                 providers: Optional[List[str]] = None,
+                 pipeline_profile: str = "recognition",
+                 gallery_backend: str = "local",
+                 shared_gallery_dir: Optional[str] = None,
+                 inference_processes: int = 0,
+                 intra_op_threads: int = 0,
+                 inter_op_threads: int = 0,
+                 graph_optimization: str = "all",
+                 session_pool_size: int = 1,
+                 graph_cache_dir: Optional[str] = None,
+                 warmup_iterations: int = 2,
+                 model_precision: str = "fp32",
+                 quantized_models_dir: Optional[str] = None,
+                 fast_det_size: int = 0,
+                 fast_det_min_score: float = 0.75,
+                 detection_mode: str = "adaptive",
+                 track_det_size: int = 224,
+                 track_margin: float = 0.5):
         """
         Initialize Face Recognition System
         
         Args:
             det_size: Size untuk face detection
             similarity_threshold: Threshold untuk face matching (0.5 default, strict)
+            embeddings_dir: Directory embeddings untuk gallery in-memory (None = tanpa gallery)
+            gallery_refresh_interval: Jarak minimum (detik) antar sync gallery dengan disk
+            read_legacy_pickles: Ikut baca file .pkl lama yang belum dimigrasi ke embedding store
+            match_index: "exact" (brute-force) atau "ivf" (ANN index, untuk gallery sangat besar)
+            ivf_nlist: Jumlah cluster IVF (0 = otomatis sqrt(N))
+            ivf_nprobe: Jumlah cluster IVF yang di-score per query
+            ann_min_size: Di bawah jumlah embeddings ini tetap exact search
+            max_templates: Maks template embedding per karyawan (1 = register selalu overwrite)
+            template_scoring: Reduce score template per karyawan: "max" atau "centroid"
+                (ranking by centroid, shortlist di-re-rank dengan max)
+            template_replace_policy: Template yang diganti saat penuh: "nearest" (paling
+                mirip template baru) atau "outlier" (paling jauh dari centroid)
+            recognition_batch_size: Maks face crop per batched forward pass ArcFace (1 = tanpa batching)
+            recognition_batch_wait_ms: Maks waktu menunggu request lain untuk mengisi batch
+            face_selection: Wajah target jika ada beberapa: "largest" atau "center"
+            model_name: Nama model pack InsightFace (buffalo_l, antelopev2, ...)
+            model_root: Directory root model InsightFace
+            providers: ONNX Runtime execution providers (default CPU)
+            pipeline_profile: Modul yang di-load, lihat PIPELINE_PROFILES
+            gallery_backend: "local" (gallery per process) atau "shared" (satu segment
+                memory-mapped untuk semua process, lihat shared_gallery.py)
+            shared_gallery_dir: Directory segment shared gallery (default /dev/shm/mealscan)
+            inference_processes: > 0 = detection / embedding di pool process terpisah
+                (image lewat shared memory), 0 = di process ini
+            intra_op_threads: Thread ONNX Runtime per operator per session (0 = default ORT)
+            inter_op_threads: Thread ONNX Runtime antar operator (> 1 = parallel execution)
+            graph_optimization: Level graph optimization ORT: disable, basic, extended, all
+            session_pool_size: Jumlah session independen per model (request paralel)
+            graph_cache_dir: Folder cache graph ONNX teroptimasi (None = optimize tiap start)
+            warmup_iterations: Inference dummy per session di warmup() (inference pool:
+                dijalankan di setiap worker saat start)
+            model_precision: "fp32" (model asli) atau varian dari quantize_models.py:
+                "int8-dynamic", "int8-static", "fp16"
+            quantized_models_dir: Folder pack varian quantized (models/insightface)
+            fast_det_size: Resolusi detection pertama untuk mode adaptive (mis. 320), 0 = off
+            fast_det_min_score: Score wajah target minimum di fast pass, di bawahnya fallback ke det_size
+            detection_mode: Default mode detection: "adaptive" atau "full" (bisa di-override per request)
+            track_det_size: Resolusi detection di crop sekitar wajah yang di-track (sesi kiosk), 0 = off
+            track_margin: Lebar crop tracking di sekitar bbox lama, kelipatan sisi bbox per arah
         """
+        if face_selection not in ("largest", "center"):
+            raise ValueError(f"Unknown face_selection: {face_selection}")
+        if pipeline_profile not in PIPELINE_PROFILES:
+            raise ValueError(f"Unknown pipeline_profile: {pipeline_profile}")
+        if gallery_backend not in ("local", "shared"):
+            raise ValueError(f"Unknown gallery_backend: {gallery_backend}")
+        if match_index == "ivf" and gallery_backend == "shared":
+            # Index IVF di-update lewat change event gallery lokal, SharedGallery tidak punya
+            raise ValueError("MATCH_INDEX=ivf is not supported with GALLERY_BACKEND=shared, use MATCH_INDEX=exact")
+        if detection_mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection_mode: {detection_mode}")
+        if template_replace_policy not in TEMPLATE_REPLACE_POLICIES:
+            raise ValueError(f"Unknown template_replace_policy: {template_replace_policy}")
         self.det_size = det_size
         self.similarity_threshold = similarity_threshold
+        self.face_selection = face_selection
+        self.model_name = model_name
+        self.model_root = model_root
+        self.providers = providers or ["CPUExecutionProvider"]
+        self.pipeline_profile = pipeline_profile
+        self.session_settings = SessionSettings(intra_op_threads, inter_op_threads, graph_optimization)
+        self.session_pool_size = session_pool_size
+        self.graph_cache_dir = graph_cache_dir
+        self.warmup_iterations = warmup_iterations
+        self.model_precision = model_precision
+        self.quantized_models_dir = quantized_models_dir
+        self.fast_det_size = fast_det_size
+        self.fast_det_min_score = fast_det_min_score
+        self.detection_mode = detection_mode
+        self.track_det_size = track_det_size
+        self.track_margin = track_margin
+        self.max_templates = max(1, max_templates)
+        self.template_replace_policy = template_replace_policy
+        self.load_stats: Dict = {}
         self.app = None
+        self.gallery = None
+        self.matcher = None
+        self.index = None
+        self.rec_model = None
+        self.det_pool = None
+        self.rec_pool = None
+        self.batcher = None
+        self.pool = None
         
         logger.info(f"Initializing Face Recognition System...")
-        self._load_model()
+        if inference_processes > 0:
+            from inference_pool import InferencePool
+
+            self.pool = InferencePool(inference_processes, dict(
+                det_size=det_size,
+                similarity_threshold=similarity_threshold,
+                face_selection=face_selection,
+                model_name=model_name,
+                model_root=model_root,
+                providers=providers,
+                pipeline_profile=pipeline_profile,
+                intra_op_threads=intra_op_threads,
+                inter_op_threads=inter_op_threads,
+                graph_optimization=graph_optimization,
+                session_pool_size=session_pool_size,
+                graph_cache_dir=graph_cache_dir,
+                model_precision=model_precision,
+                quantized_models_dir=quantized_models_dir,
+                fast_det_size=fast_det_size,
+                fast_det_min_score=fast_det_min_score,
+                detection_mode=detection_mode,
+                track_det_size=track_det_size,
+                track_margin=track_margin
+            ), warmup_iterations=warmup_iterations)
+            self.load_stats = {"inference_processes": inference_processes, "workers": self.pool.workers}
+        else:
+            self._load_model()
+            if recognition_batch_size > 1:
+                self._init_batcher(recognition_batch_size, recognition_batch_wait_ms)
+
+        if embeddings_dir is not None:
+            if gallery_backend == "shared":
+                if read_legacy_pickles and any(Path(embeddings_dir).glob("*.pkl")):
+                    logger.warning("Shared gallery ignores legacy .pkl embeddings, run migrate_embeddings.py")
+                self.gallery = SharedGallery(
+                    embeddings_dir,
+                    refresh_interval=gallery_refresh_interval,
+                    shm_dir=shared_gallery_dir
+                )
+            else:
+                self.gallery = EmbeddingGallery(
+                    embeddings_dir,
+                    refresh_interval=gallery_refresh_interval,
+                    read_legacy_pickles=read_legacy_pickles
+                )
+            self.gallery.load()
+            if match_index == "ivf":
+                self.index = IVFIndex(
+                    path=str(Path(embeddings_dir) / INDEX_FILE_NAME),
+                    nlist=ivf_nlist,
+                    nprobe=ivf_nprobe,
+                    min_size=ann_min_size
+                )
+                self.index.attach(self.gallery)
+            elif match_index != "exact":
+                raise ValueError(f"Unknown match_index: {match_index}")
+            self.matcher = MatchingEngine(self.gallery, similarity_threshold, index=self.index,
+                                          template_scoring=template_scoring,
+                                          max_templates=self.max_templates)
     
     def _load_model(self):
-        """Load InsightFace model"""
+        """Load InsightFace model (hanya modul dari pipeline_profile)"""
         try:
-            # Initialize FaceAnalysis without specifying model name (will use default)
-            # Default model will be auto-downloaded on first run
-            self.app = FaceAnalysis(
-                providers=["CPUExecutionProvider"]
+            start = time.perf_counter()
+            rss_before = get_rss_mb()
+            # Model pack akan auto-download saat pertama kali run
+            self.app = FaceModelPack(
+                name=self.model_name,
+                root=self.model_root,
+                allowed_modules=PIPELINE_PROFILES[self.pipeline_profile],
+                providers=self.providers,
+                session_settings=self.session_settings,
+                graph_cache_dir=self.graph_cache_dir,
+                precision=self.model_precision,
+                variants_root=self.quantized_models_dir
             )
             self.app.prepare(ctx_id=0, det_size=self.det_size)
-            logger.info(f"✓ Face Recognition model loaded successfully")
+            self.rec_model = self.app.models.get("recognition")
+            if self.rec_model is None:
+                raise RuntimeError("Model pack has no recognition model")
+            if self.fast_det_size and isinstance(getattr(self.app.det_model, "input_shape", [None] * 4)[2], int):
+                logger.warning("Detection model has a fixed input size, adaptive detection and tracking disabled")
+                self.fast_det_size = 0
+                self.track_det_size = 0
+            # Replica dibuat setelah prepare supaya setting detection ikut ter-copy
+            self.det_pool = ModelPool(self.app.det_model, self.session_pool_size, self.app)
+            self.rec_pool = ModelPool(self.rec_model, self.session_pool_size, self.app)
+            self.load_stats = {
+                "model_name": self.model_name,
+                "pipeline_profile": self.pipeline_profile,
+                "precision": self.model_precision,
+                "modules": sorted(self.app.models.keys()),
+                "session_pool_size": self.session_pool_size,
+                "session_settings": self.session_settings._asdict(),
+                "graph_cache": self.graph_cache_dir is not None,
+                "fast_det_size": self.fast_det_size,
+                "track_det_size": self.track_det_size,
+                "load_seconds": time.perf_counter() - start,
+                "rss_delta_mb": get_rss_mb() - rss_before,
+            }
+            logger.info(
+                f"✓ Face Recognition model loaded successfully: {self.model_name} ({self.model_precision}) "
+                f"profile={self.pipeline_profile} modules={self.load_stats['modules']} "
+                f"in {self.load_stats['load_seconds']:.2f}s, RSS +{self.load_stats['rss_delta_mb']:.0f} MB"
+            )
         except Exception as e:
             logger.error(f"✗ Error loading model: {e}")
             raise
     
+    def _init_batcher(self, max_batch_size: int, max_wait_ms: float):
+        """Aktifkan micro-batching untuk model recognition"""
+        batch_dim = self.rec_model.input_shape[0]
+        if isinstance(batch_dim, int) and batch_dim == 1:
+            logger.warning("Recognition model has fixed batch size 1, batching disabled")
+            return
+        self.batcher = MicroBatcher(
+            self._embed_aligned_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name="recognition-batcher"
+        )
+        logger.info(f"✓ Recognition micro-batching: batch {max_batch_size}, wait {max_wait_ms} ms")
+    
+    def warmup(self, iterations: Optional[int] = None) -> float:
+        """
+        Jalankan inference dummy supaya alokasi memory / thread pool ORT terjadi
+        sebelum request pertama (tidak tercatat di metrics stage)
+
+        Setiap replica session di pool ikut di-warm-up. Dengan inference pool,
+        worker sudah warm-up sendiri saat start.
+
+        Args:
+            iterations: Jumlah inference per session (default warmup_iterations)
+
+        Returns:
+            Durasi warm-up (detik)
+        """
+        if self.pool is not None:
+            return 0.0
+        iterations = self.warmup_iterations if iterations is None else iterations
+        if iterations <= 0:
+            return 0.0
+        start = time.perf_counter()
+        img = make_warmup_image(self.det_size)
+        size = self.rec_model.input_size[0]
+        crop = cv2.resize(img, (size, size))
+        # Pool mengembalikan replica FIFO, jadi N x pool_size panggilan mengenai semua replica
+        for _ in range(iterations * self.session_pool_size):
+            self.detect_faces(img)
+            if self.fast_det_size:
+                self.detect_faces(img, (self.fast_det_size, self.fast_det_size))
+            if self.track_det_size:
+                self.detect_faces(img, (self.track_det_size, self.track_det_size))
+            self._embed_aligned_batch([crop])
+            if self.batcher is not None:
+                self._embed_aligned_batch([crop] * self.batcher.max_batch_size)
+        elapsed = time.perf_counter() - start
+        logger.info(f"✓ Warm-up done: {iterations} iteration(s) x {self.session_pool_size} session(s) in {elapsed:.2f}s")
+        return elapsed
+    
+    def _embed_aligned_batch(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Satu forward pass ArcFace untuk banyak aligned face crop (112x112 BGR)"""
+        with self.rec_pool.acquire() as rec_model:
+            return rec_model.get_feat(crops)
+    
+    def detect_faces(self, img_array: np.ndarray,
+                     det_size: Optional[Tuple[int, int]] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Jalankan face detection saja (tanpa recognition / landmark / gender-age)
+        
+        Args:
+            img_array: Image BGR
+            det_size: Resolusi input detector (default self.det_size)
+        
+        Returns:
+            Tuple (bboxes, kpss) - bboxes (N, 5) berisi x1, y1, x2, y2, score; kpss (N, 5, 2)
+        """
+        with self.det_pool.acquire() as det_model:
+            return det_model.detect(img_array, input_size=det_size, max_num=0, metric='default')
+    
+    def detect_adaptive(self, img_array: np.ndarray,
+                        detection: Optional[str] = None) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Detection dengan fast path resolusi kecil
+        
+        Mode "adaptive": detection di fast_det_size dulu (cukup untuk satu wajah
+        dekat kamera kiosk), fallback ke det_size jika tidak ada wajah atau score
+        wajah target < fast_det_min_score. Path yang diambil dihitung di metric
+        face_api_detection_path.
+        
+        Args:
+            img_array: Image BGR
+            detection: "adaptive" / "full", None = detection_mode
+        
+        Returns:
+            Tuple (bboxes, kpss) seperti detect_faces
+        """
+        mode = detection or self.detection_mode
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode: {mode}")
+        if mode == "full" or not self.fast_det_size:
+            DETECTION_PATHS.inc("full")
+            return self.detect_faces(img_array)
+        
+        bboxes, kpss = self.detect_faces(img_array, (self.fast_det_size, self.fast_det_size))
+        if bboxes.shape[0] == 0:
+            DETECTION_PATHS.inc("fallback_no_face")
+        elif bboxes[self.select_face(bboxes, img_array.shape), 4] < self.fast_det_min_score:
+            DETECTION_PATHS.inc("fallback_low_score")
+        else:
+            DETECTION_PATHS.inc("fast")
+            return bboxes, kpss
+        return self.detect_faces(img_array)
+    
+    def select_face(self, bboxes: np.ndarray, img_shape: Tuple[int, ...]) -> int:
+        """
+        Pilih index wajah target dari hasil detection
+        
+        Args:
+            bboxes: Array (N, 5) hasil detect_faces
+            img_shape: Shape image (H, W, C)
+            
+        Returns:
+            Index wajah: terbesar ("largest") atau paling dekat ke tengah frame ("center")
+        """
+        if self.face_selection == "center":
+            cx = (bboxes[:, 0] + bboxes[:, 2]) / 2 - img_shape[1] / 2
+            cy = (bboxes[:, 1] + bboxes[:, 3]) / 2 - img_shape[0] / 2
+            return int(np.argmin(cx ** 2 + cy ** 2))
+        areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+        return int(np.argmax(areas))
+    
+    def align_face(self, img_array: np.ndarray, kps: np.ndarray) -> np.ndarray:
+        """Aligned face crop (112x112) dari 5 landmark detector"""
+        return face_align.norm_crop(img_array, landmark=kps, image_size=self.rec_model.input_size[0])
+    
+    def embed_aligned(self, crops: List[np.ndarray]) -> np.ndarray:
+        """
+        Embedding untuk aligned face crops (lewat batcher jika aktif)
+        
+        Returns:
+            Array (N, D) embedding (belum normalized)
+        """
+        if self.batcher is not None:
+            return np.stack(self.batcher.run_many(crops))
+        return self._embed_aligned_batch(crops)
+    
+    def embed_chips(self, chips: np.ndarray) -> np.ndarray:
+        """
+        Embedding untuk face chip yang sudah di-align di client (tanpa detection)
+        
+        Args:
+            chips: Array (N, CHIP_SIZE, CHIP_SIZE, 3) uint8 BGR
+            
+        Returns:
+            Array (N, D) embedding (belum normalized), satu batched forward pass
+        """
+        if self.pool is not None:
+            return self.pool.embed_chips(chips)
+        with stage("embed"):
+            return self.embed_aligned(list(chips))
+    
     def extract_face_embedding(self, image_path: str) -> Optional[Dict]:
         """
         Extract face embedding dari image
@@ -62,76 +494,231 @@ class FaceRecognitionSystem:
         Returns:
             Dict dengan keys: embedding, bbox, confidence, atau None jika tidak ada wajah
         """
-        try:
-            # Read image
-            img = cv2.imread(image_path)
-            if img is None:
-                logger.error(f"Cannot read image: {image_path}")
-                return None
+        # Read image
+        img = cv2.imread(image_path)
+        if img is None:
+            logger.error(f"Cannot read image: {image_path}")
+            return None
+        
+        return self.extract_face_embedding_from_array(img)
+    
+    def extract_face_embedding_from_array(self, img_array: np.ndarray,
+                                          detection: Optional[str] = None) -> Optional[Dict]:
+        """
+        Extract face embedding dari numpy array (untuk upload via API)
+        
+        Pipeline: detection -> pilih wajah target -> align -> recognition hanya
+        untuk wajah itu. Wajah lain di frame (antrian di belakang) tidak di-embed.
+        
+        Args:
+            img_array: Image sebagai numpy array (BGR format)
+            detection: Mode detection ("adaptive" / "full"), None = detection_mode
             
+        Returns:
+            Dict dengan keys: embedding, bbox, confidence, embedding_norm, faces (jumlah
+            wajah terdeteksi), atau None jika tidak ada wajah
+        """
+        if img_array is None:
+            logger.error("Invalid image array")
+            return None
+        
+        # Error pool (worker mati) di-propagate, bukan dianggap "tidak ada wajah"
+        if self.pool is not None:
+            return self.pool.extract(img_array, detection)
+        
+        try:
             # Detect faces
-            faces = self.app.get(img)
+            with stage("detect"):
+                bboxes, kpss = self.detect_adaptive(img_array, detection)
             
-            if len(faces) == 0:
-                logger.warning(f"No face detected in: {image_path}")
+            if bboxes.shape[0] == 0:
+                logger.warning("No face detected in image")
                 return None
             
-            if len(faces) > 1:
-                logger.warning(f"Multiple faces detected ({len(faces)}), using the largest one")
+            if bboxes.shape[0] > 1:
+                logger.warning(f"Multiple faces detected ({bboxes.shape[0]}), using the {self.face_selection} one")
             
-            # Get the largest face (by bbox area)
-            face = max(faces, key=lambda x: (x.bbox[2] - x.bbox[0]) * (x.bbox[3] - x.bbox[1]))
+            i = self.select_face(bboxes, img_array.shape)
+            with stage("embed"):
+                embedding = self.embed_aligned([self.align_face(img_array, kpss[i])])[0]
             
-            return {
-                'embedding': face.embedding,
-                'bbox': face.bbox.tolist(),
-                'confidence': float(face.det_score),
-                'embedding_norm': float(np.linalg.norm(face.embedding))
-            }
+            return self._face_result(bboxes, i, embedding)
             
         except Exception as e:
-            logger.error(f"Error extracting embedding: {e}")
+            logger.error(f"Error extracting embedding from array: {e}")
             return None
     
-    def extract_face_embedding_from_array(self, img_array: np.ndarray) -> Optional[Dict]:
+    @staticmethod
+    def _face_result(bboxes: np.ndarray, i: int, embedding: np.ndarray) -> Dict:
+        """Dict hasil extract untuk wajah target i"""
+        embedding = embedding.flatten()
+        return {
+            'embedding': embedding,
+            'bbox': bboxes[i, 0:4].tolist(),
+            'confidence': float(bboxes[i, 4]),
+            'embedding_norm': float(np.linalg.norm(embedding)),
+            'faces': int(bboxes.shape[0])
+        }
+    
+    def extract_face_embeddings_batch(self, img_arrays: List[np.ndarray],
+                                      detection: Optional[str] = None) -> List[Optional[Dict]]:
         """
-        Extract face embedding dari numpy array (untuk upload via API)
+        extract_face_embedding_from_array untuk banyak image sekaligus (batch upload)
+        
+        Detection tetap per image (ukuran input berbeda), lalu wajah target semua
+        image di-embed dalam satu batched forward pass recognition. Dengan inference
+        pool, semua image di-submit sekaligus sehingga tersebar ke semua worker.
         
         Args:
-            img_array: Image sebagai numpy array (BGR format)
+            img_arrays: List image BGR
+            detection: Mode detection ("adaptive" / "full"), None = detection_mode
             
         Returns:
-            Dict dengan keys: embedding, bbox, confidence, atau None jika tidak ada wajah
+            List hasil per image (urutan sama), None untuk image tanpa wajah
         """
+        if not img_arrays:
+            return []
+        if self.pool is not None:
+            return self.pool.extract_many(img_arrays, detection)
+        
+        results: List[Optional[Dict]] = [None] * len(img_arrays)
         try:
-            if img_array is None:
-                logger.error("Invalid image array")
-                return None
-            
-            # Detect faces
-            faces = self.app.get(img_array)
+            targets = []
+            with stage("detect"):
+                for n, img_array in enumerate(img_arrays):
+                    bboxes, kpss = self.detect_adaptive(img_array, detection)
+                    if bboxes.shape[0] > 0:
+                        targets.append((n, bboxes, kpss, self.select_face(bboxes, img_array.shape)))
+            if not targets:
+                return results
             
-            if len(faces) == 0:
-                logger.warning("No face detected in image")
-                return None
+            with stage("embed"):
+                embeddings = self.embed_aligned([self.align_face(img_arrays[n], kpss[i])
+                                                 for n, _, kpss, i in targets])
+            for (n, bboxes, _, i), embedding in zip(targets, embeddings):
+                results[n] = self._face_result(bboxes, i, embedding)
             
-            if len(faces) > 1:
-                logger.warning(f"Multiple faces detected ({len(faces)}), using the largest one")
+        except Exception as e:
+            logger.error(f"Error extracting batch embeddings: {e}")
+            return [None] * len(img_arrays)
+        return results
+    
+    def extract_tracked_face(self, img_array: np.ndarray,
+                             track_bbox: Optional[List[float]] = None,
+                             embed: bool = True,
+                             detection: Optional[str] = None) -> Optional[Dict]:
+        """
+        Extract wajah dari frame stream kiosk, memakai bbox frame sebelumnya
+        
+        Jika track_bbox ada, detection hanya dijalankan di crop sekitar bbox itu
+        (expand_bbox dengan track_margin) pada track_det_size dan wajah dengan IoU
+        terbesar ke track_bbox dipilih. Tidak ada wajah di crop (atau score <
+        fast_det_min_score) -> fallback ke detect_adaptive full frame.
+        
+        Args:
+            img_array: Frame BGR
+            track_bbox: Bbox wajah di frame sebelumnya (koordinat img_array), None = full frame
+            embed: False = detection saja (identitas sudah dikonfirmasi sesi)
+            detection: Mode detection untuk full frame, None = detection_mode
             
-            # Get the largest face
-            face = max(faces, key=lambda x: (x.bbox[2] - x.bbox[0]) * (x.bbox[3] - x.bbox[1]))
+        Returns:
+            Dict bbox, confidence, tracked (+ embedding, embedding_norm jika embed),
+            atau None jika tidak ada wajah
+        """
+        if self.pool is not None:
+            return self.pool.extract_tracked(img_array, track_bbox, embed, detection)
+        
+        try:
+            tracked = False
+            with stage("detect"):
+                if track_bbox is not None and self.track_det_size:
+                    x0, y0, x1, y1 = expand_bbox(track_bbox, self.track_margin, img_array.shape)
+                    bboxes, kpss = self.detect_faces(img_array[y0:y1, x0:x1],
+                                                     (self.track_det_size, self.track_det_size))
+                    if bboxes.shape[0] and bboxes[:, 4].max() >= self.fast_det_min_score:
+                        bboxes[:, [0, 2]] += x0
+                        bboxes[:, [1, 3]] += y0
+                        kpss += np.array([x0, y0], dtype=kpss.dtype)
+                        i = int(np.argmax([bbox_iou(box, track_bbox) for box in bboxes[:, :4]]))
+                        tracked = True
+                        DETECTION_PATHS.inc("track")
+                    else:
+                        DETECTION_PATHS.inc("track_lost")
+                if not tracked:
+                    bboxes, kpss = self.detect_adaptive(img_array, detection)
+                    if bboxes.shape[0] == 0:
+                        return None
+                    i = self.select_face(bboxes, img_array.shape)
             
-            return {
-                'embedding': face.embedding,
-                'bbox': face.bbox.tolist(),
-                'confidence': float(face.det_score),
-                'embedding_norm': float(np.linalg.norm(face.embedding))
+            face = {
+                'bbox': bboxes[i, 0:4].tolist(),
+                'confidence': float(bboxes[i, 4]),
+                'tracked': tracked
             }
+            if embed:
+                with stage("embed"):
+                    embedding = self.embed_aligned([self.align_face(img_array, kpss[i])])[0].flatten()
+                face['embedding'] = embedding
+                face['embedding_norm'] = float(np.linalg.norm(embedding))
+            return face
             
         except Exception as e:
-            logger.error(f"Error extracting embedding from array: {e}")
+            logger.error(f"Error extracting tracked face from frame: {e}")
             return None
     
+    def extract_all_face_embeddings(self, img_array: np.ndarray,
+                                    detection: Optional[str] = None,
+                                    min_confidence: float = 0.6,
+                                    min_face_size: float = 0.0,
+                                    max_faces: int = 16,
+                                    scale: float = 1.0) -> List[Dict]:
+        """
+        Extract embedding semua wajah di frame (group recognition)
+        
+        Pipeline: detection -> filter confidence / ukuran -> align -> satu batched
+        forward pass recognition untuk semua wajah yang lolos.
+        
+        Args:
+            img_array: Image sebagai numpy array (BGR format)
+            detection: Mode detection ("adaptive" / "full"), None = detection_mode
+            min_confidence: Score detection minimum
+            min_face_size: Sisi bbox terpendek minimum, dalam koordinat image asli
+            max_faces: Maks wajah yang di-embed (terbesar lebih dulu)
+            scale: Koordinat asli = koordinat di img_array x scale (reduced decode)
+            
+        Returns:
+            List dict (embedding, bbox, confidence, embedding_norm) urut dari wajah
+            terbesar, bbox dalam koordinat img_array; list kosong jika tidak ada wajah
+        """
+        if self.pool is not None:
+            return self.pool.extract_all(img_array, detection, min_confidence, min_face_size, max_faces, scale)
+        
+        try:
+            with stage("detect"):
+                bboxes, kpss = self.detect_adaptive(img_array, detection)
+            
+            sides = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1]) * scale
+            keep = np.flatnonzero((bboxes[:, 4] >= min_confidence) & (sides >= min_face_size))
+            if keep.size == 0:
+                logger.warning(f"No face passed the group cutoff ({bboxes.shape[0]} detected)")
+                return []
+            areas = (bboxes[keep, 2] - bboxes[keep, 0]) * (bboxes[keep, 3] - bboxes[keep, 1])
+            keep = keep[np.argsort(-areas)][:max_faces]
+            
+            with stage("embed"):
+                embeddings = self.embed_aligned([self.align_face(img_array, kpss[i]) for i in keep])
+            
+            return [{
+                'embedding': embedding.flatten(),
+                'bbox': bboxes[i, 0:4].tolist(),
+                'confidence': float(bboxes[i, 4]),
+                'embedding_norm': float(np.linalg.norm(embedding))
+            } for i, embedding in zip(keep, embeddings)]
+            
+        except Exception as e:
+            logger.error(f"Error extracting group embeddings from array: {e}")
+            return []
+    
     def cosine_similarity(self, emb1: np.ndarray, emb2: np.ndarray) -> float:
         """
         Hitung cosine similarity antara 2 embeddings
@@ -162,35 +749,80 @@ class FaceRecognitionSystem:
     
     def find_matching_face(self, 
                           query_embedding: np.ndarray, 
-                          database_embeddings: Dict[str, np.ndarray]) -> Optional[Tuple[str, float]]:
+                          database_embeddings: Optional[Dict[str, np.ndarray]] = None) -> Optional[Tuple[str, float]]:
         """
         Cari wajah yang cocok dari database
         
         Args:
             query_embedding: Embedding yang ingin dicari
-            database_embeddings: Dict {employee_id: embedding}
+            database_embeddings: Dict {employee_id: embedding}, None = pakai gallery in-memory
             
         Returns:
             Tuple (employee_id, similarity) atau None jika tidak ada yang cocok
         """
-        best_match = None
-        best_similarity = 0.0
-        
-        for employee_id, db_embedding in database_embeddings.items():
-            similarity = self.cosine_similarity(query_embedding, db_embedding)
-            
-            if similarity > best_similarity:
-                best_similarity = similarity
-                best_match = employee_id
+        if database_embeddings is None:
+            result = self.match(query_embedding, k=1)
+        else:
+            ids = np.array(list(database_embeddings.keys()), dtype=object)
+            matrix = (np.stack([normalize_embedding(e) for e in database_embeddings.values()])
+                      if len(ids) else np.zeros((0, 0), dtype=np.float32))
+            result = search_matrix(query_embedding, ids, matrix, k=1)
         
         # Return only if above threshold
-        if best_similarity >= self.similarity_threshold:
-            return best_match, best_similarity
+        if passes_threshold(result, self.similarity_threshold):
+            return result.best
         
         return None
     
+    def find_matching_faces(self, query_embeddings: np.ndarray) -> List[Optional[Tuple[str, float]]]:
+        """
+        find_matching_face untuk banyak query sekaligus (satu matrix product ke gallery)
+        
+        Returns:
+            List (employee_id, similarity) atau None per query
+        """
+        with stage("gallery"):
+            self.gallery.refresh()
+        with stage("match"):
+            results = self.matcher.search_batch(query_embeddings, k=1)
+        return [result.best if passes_threshold(result, self.similarity_threshold) else None
+                for result in results]
+    
+    def gallery_version(self) -> int:
+        """Version gallery setelah sync dengan embedding store (naik setiap register / delete)"""
+        with stage("gallery"):
+            self.gallery.refresh()
+        return self.gallery.version
+    
+    def cached_gallery_version(self) -> Optional[int]:
+        """
+        Version gallery in-memory tanpa sync ke disk (aman dipanggil di event loop)
+        
+        Returns:
+            Version, atau None jika refresh sudah jatuh tempo (version bisa tertinggal)
+        """
+        if self.gallery.refresh_due:
+            return None
+        return self.gallery.version
+    
+    def match(self, query_embedding: np.ndarray, k: int = 5) -> MatchResult:
+        """
+        Top-k matching terhadap gallery in-memory (tanpa threshold)
+        
+        Args:
+            query_embedding: Embedding yang ingin dicari
+            k: Jumlah kandidat teratas
+            
+        Returns:
+            MatchResult berisi kandidat (employee_id, similarity) dan margin rank 1 - rank 2
+        """
+        with stage("gallery"):
+            self.gallery.refresh()
+        with stage("match"):
+            return self.matcher.search(query_embedding, k=k)
+    
     def save_embedding(self, embedding: np.ndarray, file_path: str):
-        """Save embedding to file using pickle"""
+        """Save embedding to file using pickle (format legacy, pakai register_embedding)"""
         try:
             Path(file_path).parent.mkdir(parents=True, exist_ok=True)
             with open(file_path, 'wb') as f:
@@ -200,6 +832,55 @@ class FaceRecognitionSystem:
             logger.error(f"✗ Error saving embedding: {e}")
             raise
     
+    def register_embedding(self, employee_id: str, embedding: np.ndarray, replace: bool = False) -> Tuple[str, int]:
+        """
+        Simpan embedding sebagai template karyawan ke embedding store (commit atomic)
+        dan update gallery in-memory
+        
+        Slot kosong dipakai selama jumlah template < max_templates, setelah itu
+        satu template diganti sesuai template_replace_policy.
+        
+        Args:
+            employee_id: ID karyawan
+            embedding: Face embedding
+            replace: Hapus semua template lama (re-enrollment dari nol)
+            
+        Returns:
+            Tuple (key template yang ditulis, jumlah template karyawan)
+        """
+        if TEMPLATE_SEPARATOR in employee_id:
+            raise ValueError(f"employee_id tidak boleh mengandung '{TEMPLATE_SEPARATOR}'")
+        key, count = self.gallery.register_template(
+            employee_id, embedding,
+            max_templates=self.max_templates,
+            policy=self.template_replace_policy,
+            replace=replace
+        )
+        logger.info(f"✓ Embedding registered for: {employee_id} (template {key}, {count}/{self.max_templates})")
+        return key, count
+    
+    def save_index(self):
+        """Persist ANN index ke disk"""
+        if self.index is not None:
+            self.index.save()
+    
+    def close(self):
+        """Hentikan batcher / inference pool dan persist ANN index (dipanggil saat shutdown)"""
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.save_index()
+    
+    def delete_embedding(self, employee_id: str) -> bool:
+        """
+        Hapus semua template embedding karyawan dari store dan gallery
+        
+        Returns:
+            True jika employee_id terdaftar
+        """
+        return self.gallery.delete_templates(employee_id)
+    
     def load_embedding(self, file_path: str) -> Optional[np.ndarray]:
         """Load embedding from file"""
         try: